@@ -0,0 +1,149 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import score_pairs
+from analysis.sketch_scoring import Sketches, approximate_matrix
+from model.corpus import pack_fingerprints
+from model.similarity_model import fingerprint
+
+DEFAULT_BUDGET = 5.0
+DEFAULT_TOP_K = 20
+
+# Pairs scored exactly between deadline checks
+CHUNK = 4096
+
+# Seconds between progress snapshots while fingerprinting
+PROGRESS_EVERY = 0.5
+
+
+# =========================================================
+# ---------------- SNAPSHOTS ----------------
+# =========================================================
+
+def _snapshot(phase, started, names, i, j, best, exact, top_k, **extra):
+    """
+    Best-known top pairs: exact scores where computed, sketch estimates
+    elsewhere
+    """
+    k = min(top_k, len(best))
+    order = np.argpartition(-best, k - 1)[:k] if k else np.empty(0, int)
+    order = order[np.lexsort((order, -best[order]))]
+    top = pd.DataFrame({
+        "file_a": [names[a] for a in i[order]],
+        "file_b": [names[b] for b in j[order]],
+        "score": best[order],
+        "exact": exact[order],
+    })
+    return {
+        "phase": phase,
+        "elapsed": time.monotonic() - started,
+        "top": top,
+        **extra,
+    }
+
+
+# =========================================================
+# ---------------- ANYTIME SCORING ----------------
+# =========================================================
+
+def anytime_scores(codes, budget=DEFAULT_BUDGET, top_k=DEFAULT_TOP_K,
+                   chunk=CHUNK):
+    """
+    Time-budgeted analysis of a {name: code} mapping that yields
+    snapshots as it goes, so a caller can show something at once.
+
+    Files are fingerprinted, every pair gets a sketch estimate with an
+    upper bound (sketch_scoring), and pairs are then scored exactly in
+    decreasing estimate order, `chunk` at a time, until `budget`
+    seconds have passed or no unscored pair can still reach the top k.
+    Fingerprinting always finishes; if it alone outlasts the budget the
+    estimates are the final answer.
+
+    Each snapshot has "phase" ("fingerprints", "estimate", "exact",
+    "done" or "deadline"), "elapsed", and "top": a DataFrame of the
+    best-known top_k pairs (file_a, file_b, score, exact). Once scoring
+    starts it also has "scored" / "pairs", and "completeness": the
+    share of pairs whose upper bound reaches the current k-th exact
+    score that have been scored; 1.0 means the top k is final (with the
+    sketch bounds' confidence).
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    names = list(codes)
+
+    # ----- Fingerprints -----
+    # Needed before anything can be scored, so never cut short (the
+    # fingerprint cache makes re-uploads cheap)
+    empty = np.empty(0, dtype=np.int64)
+    fps = {}
+    shown = started
+    for name, code in codes.items():
+        fps[name] = fingerprint(code)
+        if time.monotonic() - shown >= PROGRESS_EVERY:
+            shown = time.monotonic()
+            yield _snapshot("fingerprints", started, names, empty, empty,
+                            np.empty(0), np.empty(0, bool), top_k,
+                            fingerprinted=len(fps), scored=0, pairs=0,
+                            completeness=0.0)
+
+    # ----- Estimates -----
+    corpus = pack_fingerprints(fps)
+    approx = approximate_matrix(Sketches(corpus))
+    i, j = np.triu_indices(len(corpus), k=1)
+    estimate = approx["final"][i, j].astype(np.float64)
+    order = np.argsort(-estimate, kind="stable")
+    i, j, upper = i[order], j[order], approx["upper"][i[order], j[order]]
+    best = estimate[order]
+    exact = np.zeros(len(i), dtype=bool)
+    total = len(i)
+
+    # The estimates are the answer if fingerprinting used up the budget
+    phase = "deadline" if time.monotonic() >= deadline else "estimate"
+    yield _snapshot(phase, started, names, i, j, best, exact, top_k,
+                    scored=0, pairs=total, completeness=0.0)
+    if phase == "deadline":
+        return
+
+    # ----- Exact scores, most suspicious first -----
+    done = 0
+    while True:
+        if done < total:
+            stop = min(done + chunk, total)
+            best[done:stop] = score_pairs(corpus, i[done:stop], j[done:stop])
+            exact[done:stop] = True
+            done = stop
+
+        k = min(top_k, done)
+        kth = np.partition(best[:done], done - k)[done - k] if k else -np.inf
+        # Pairs that could still reach the top k, scored or not
+        open_pairs = int((upper[done:] >= kth).sum())
+        could = int((upper[:done] >= kth).sum()) + open_pairs
+        completeness = 1.0 - open_pairs / could if could else 1.0
+
+        finished = done == total or (k == top_k and open_pairs == 0)
+        if finished:
+            phase = "done"
+        elif time.monotonic() >= deadline:
+            phase = "deadline"
+        else:
+            phase = "exact"
+
+        # Only exact scores are reported once the top k is settled
+        shown = best if not finished else np.where(exact, best, -np.inf)
+        yield _snapshot(phase, started, names, i, j, shown, exact, top_k,
+                        scored=done, pairs=total, completeness=completeness)
+        if phase != "exact":
+            return
+
+
+def anytime_top_pairs(codes, budget=DEFAULT_BUDGET, top_k=DEFAULT_TOP_K):
+    """
+    The last snapshot of anytime_scores
+    """
+    snapshot = None
+    for snapshot in anytime_scores(codes, budget, top_k):
+        pass
+    return snapshot
+
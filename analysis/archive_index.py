@@ -0,0 +1,336 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import fuse
+from model.corpus import (
+    BOUND_SLACK, gather_slices, pack_fingerprints, read_sources
+)
+from model.corpus_snapshot import read_snapshot, write_snapshot
+from model.similarity_model import (
+    AST_GLOBAL_SHARE, AST_SUBTREE_SHARE, Fingerprint, fingerprint
+)
+from syntactic.ast_features import NODE_TYPES
+
+DEFAULT_K = 10
+
+# Posting entries accumulated per query, as a multiple of the archive
+# size; the longest lists (ubiquitous subtrees) beyond it are bounded
+POSTING_BUDGET = 2.0
+
+# Documents scored exactly before the first pruning pass
+FIRST_ROUND = 256
+
+COLUMNS = [
+    "lexical", "ast_global", "ast_subtree", "ast_hybrid", "style", "final"
+]
+
+
+# =========================================================
+# ---------------- ARCHIVE INDEX ----------------
+# =========================================================
+
+class ArchiveIndex:
+    """
+    Inverted index from subtree fingerprint to the archived documents
+    containing it, on top of the archive's PackedCorpus (which already
+    carries per-document token and node-type norms).
+
+    A query accumulates overlap counts from the posting lists, bounds
+    every document's score from them and computes the remaining
+    components only for documents that could still make the top k
+    (see `query`). Scores equal pair_similarity against each archived
+    file.
+    """
+
+    def __init__(self, corpus, posting_indptr=None, posting_docs=None):
+        self.corpus = corpus
+        if posting_indptr is None:
+            postings = corpus.subtree_matrix().tocsc()
+            posting_indptr = postings.indptr.astype(np.int64)
+            posting_docs = postings.indices.astype(np.int32)
+
+        self.posting_indptr = posting_indptr
+        self.posting_docs = posting_docs
+        self.sizes = corpus.subtree_sizes()
+        self._tokens = corpus.token_matrix()
+        self._subtrees = corpus.subtree_matrix()
+
+    def __len__(self):
+        return len(self.corpus)
+
+    # ---------- persistence ----------
+
+    @classmethod
+    def build(cls, codes):
+        """
+        Index a {name: code} archive
+        """
+        return cls(pack_fingerprints({
+            name: fingerprint(code) for name, code in codes.items()
+        }))
+
+    def save(self, path):
+        """
+        One binary snapshot holding the corpus and the posting lists
+        """
+        write_snapshot(self.corpus, path, extras={
+            "posting_indptr": self.posting_indptr,
+            "posting_docs": self.posting_docs,
+        })
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a saved index; postings are rebuilt only if missing.
+        Raises ValueError for an index built under another AST schema
+        (another Python), whose node-type columns and subtree IDs would
+        not line up with fresh fingerprints.
+        """
+        corpus = read_snapshot(path)
+        if corpus.ast_counts.shape[1] != len(NODE_TYPES):
+            raise ValueError(
+                f"{path} has {corpus.ast_counts.shape[1]} node-type "
+                f"columns, expected {len(NODE_TYPES)}; rebuild it"
+            )
+        return cls(
+            corpus,
+            corpus.extras.get("posting_indptr"),
+            corpus.extras.get("posting_docs"),
+        )
+
+    # ---------- query ----------
+
+    def _vocab_ids(self, fp):
+        """
+        Archive vocabulary IDs of the query's subtrees (unknown dropped)
+        """
+        vocab = self.corpus.subtree_vocab
+        if len(vocab) == 0 or len(fp.subtrees) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        ids = np.searchsorted(vocab, fp.subtrees)
+        ids[ids == len(vocab)] = 0
+        return ids[vocab[ids] == fp.subtrees]
+
+    def _posting_counts(self, ids):
+        """
+        Per-document count of how many of `ids` each document contains
+        """
+        positions, _ = gather_slices(self.posting_indptr, ids)
+        docs = self.posting_docs[positions]
+        return np.bincount(docs, minlength=len(self))
+
+    def overlap_counts(self, fp):
+        """
+        Shared subtree count between `fp` and every archived document
+        """
+        return self._posting_counts(self._vocab_ids(fp))
+
+    def _token_vector(self, fp):
+        vocab = self.corpus.token_vocab
+        vec = np.zeros(len(vocab))
+        if len(vocab):
+            pos = np.searchsorted(vocab, fp.tokens.ids)
+            pos[pos == len(vocab)] = 0
+            known = vocab[pos] == fp.tokens.ids
+            vec[pos[known]] = fp.tokens.counts[known]
+        return vec
+
+    def _ast_global(self, fp, docs=None):
+        # docs=None: every document, without copying the count matrix
+        c = self.corpus
+        counts = c.ast_counts if docs is None else c.ast_counts[docs]
+        norms = c.ast_norms if docs is None else c.ast_norms[docs]
+        den = norms * fp.ast_norm
+        out = np.zeros(len(den))
+        np.divide(counts @ fp.ast_counts, den, out=out, where=den > 0)
+        return out
+
+    def _ast_subtree(self, fp, docs, shared):
+        smaller = np.minimum(self.sizes[docs], len(fp.subtrees))
+        out = np.zeros(len(docs))
+        np.divide(shared, smaller, out=out, where=smaller > 0)
+        return out
+
+    def score(self, fp, docs, shared, ast_global=None):
+        """
+        All six components of `fp` against the archived rows `docs`
+        (`shared` overlap counts and, optionally, AST-global cosines
+        already known for them)
+        """
+        c = self.corpus
+
+        den = c.token_norms[docs] * fp.tokens.norm
+        lex_dot = self._tokens[docs] @ self._token_vector(fp)
+        lex = np.zeros(len(docs))
+        np.divide(lex_dot, den, out=lex, where=den > 0)
+
+        if ast_global is None:
+            ast_global = self._ast_global(fp, docs)
+        ast_sub = self._ast_subtree(fp, docs, shared)
+
+        ast_hybrid = AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * ast_sub
+        style = 1 / (1 + np.abs(c.entropy[docs] - fp.entropy))
+
+        return np.column_stack([
+            lex, ast_global, ast_sub, ast_hybrid, style,
+            fuse(lex, ast_hybrid, style)
+        ])
+
+    def query(self, code, k=DEFAULT_K):
+        """
+        Exact top-k archived matches of a submission (code or
+        Fingerprint) as a DataFrame of components, best first.
+
+        Rare subtrees are counted from their posting lists; the longest
+        lists are skipped and only bounded, since nearly every document
+        contains them. With exact style and AST-global scores and a
+        perfect lexical score assumed, that gives every document a
+        score ceiling.
+        Documents are then scored in decreasing ceiling order until no
+        ceiling can beat the current k-th score; within each batch the
+        lexical cosine (the costliest part) is skipped for documents
+        whose exact AST score already rules them out.
+        attrs["scored"] is how many documents needed full scoring.
+        """
+        fp = code if isinstance(code, Fingerprint) else fingerprint(code)
+        n = len(self)
+        if n == 0 or k <= 0:
+            return self._frame(fp, np.empty(0, dtype=np.int64),
+                               np.empty((0, len(COLUMNS))), 0)
+
+        # ----- Rare subtrees exactly, frequent ones bounded -----
+        ids = self._vocab_ids(fp)
+        lengths = self.posting_indptr[ids + 1] - self.posting_indptr[ids]
+        order = np.argsort(lengths, kind="stable")
+        rare = order[np.cumsum(lengths[order]) <= POSTING_BUDGET * n]
+        frequent = np.setdiff1d(ids, ids[rare])
+        counts = self._posting_counts(ids[rare])
+
+        smaller = np.minimum(self.sizes, len(fp.subtrees))
+        shared_ceiling = np.minimum(
+            counts + np.minimum(len(frequent), self.sizes), smaller
+        )
+        sub_ceiling = np.zeros(n)
+        np.divide(shared_ceiling, smaller, out=sub_ceiling, where=smaller > 0)
+
+        # Node-type cosines are one dense mat-vec; compute them for all
+        ast_global = self._ast_global(fp)
+        style = 1 / (1 + np.abs(self.corpus.entropy - fp.entropy))
+        ceiling = fuse(
+            1.0,
+            AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * sub_ceiling,
+            style
+        ) + BOUND_SLACK
+
+        # ----- Exact scores, best ceilings first -----
+        frequent_mask = np.zeros(len(self.corpus.subtree_vocab_heights))
+        frequent_mask[frequent] = 1.0
+
+        def exact(docs, kth):
+            # Exact subtree overlap first; lexical only where still needed
+            shared = counts[docs]
+            if len(frequent):
+                shared = shared + self._subtrees[docs] @ frequent_mask
+            hybrid = (
+                AST_GLOBAL_SHARE * ast_global[docs] +
+                AST_SUBTREE_SHARE * self._ast_subtree(fp, docs, shared)
+            )
+            keep = fuse(1.0, hybrid, style[docs]) + BOUND_SLACK >= kth
+            docs = docs[keep]
+            return docs, self.score(fp, docs, shared[keep], ast_global[docs])
+
+        m = min(n, max(FIRST_ROUND, k))
+        first = np.argpartition(-ceiling, m - 1)[:m]
+        docs, scores = exact(first, -np.inf)
+
+        kth = self._kth(scores, k)
+        pending = np.ones(n, dtype=bool)
+        pending[first] = False
+        rest = np.flatnonzero(pending & (ceiling >= kth))
+        rest = rest[np.argsort(-ceiling[rest], kind="stable")]
+
+        start, size = 0, FIRST_ROUND
+        while start < len(rest):
+            chunk = rest[start:start + size]
+            start, size = start + size, size * 2
+            chunk = chunk[ceiling[chunk] >= kth]
+            if len(chunk) == 0:
+                break
+            chunk, chunk_scores = exact(chunk, kth)
+            docs = np.concatenate([docs, chunk])
+            scores = np.vstack([scores, chunk_scores])
+            kth = self._kth(scores, k)
+
+        return self._frame(fp, docs, scores, k)
+
+    @staticmethod
+    def _kth(scores, k):
+        finals = scores[:, -1]
+        if len(finals) < k:
+            return -np.inf
+        return np.partition(finals, len(finals) - k)[len(finals) - k]
+
+    def _frame(self, fp, docs, scores, k):
+        order = np.lexsort((docs, -scores[:, -1]))[:k]
+        top = pd.DataFrame(
+            scores[order], columns=COLUMNS,
+            index=[self.corpus.names[d] for d in docs[order]]
+        )
+        top.attrs["scored"] = int(len(docs))
+        return top
+
+
+# =========================================================
+# ---------------- CLI ----------------
+# =========================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.archive_index",
+        description="Check submissions against an archive"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="index every .py file under a folder")
+    p.add_argument("root")
+    p.add_argument("index")
+
+    p = sub.add_parser("query", help="top matches of one or more files")
+    p.add_argument("index")
+    p.add_argument("files", nargs="+")
+    p.add_argument("-k", type=int, default=DEFAULT_K)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = ArchiveIndex.build(read_sources(args.root))
+        index.save(args.index)
+        print(f"🗄 Indexed {len(index)} files -> {args.index}")
+        return
+
+    start = time.perf_counter()
+    try:
+        index = ArchiveIndex.load(args.index)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"🗄 Loaded {len(index)} files in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for path in args.files:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+        start = time.perf_counter()
+        top = index.query(code, args.k)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"\n🔍 {path} ({top.attrs['scored']} scored exactly, "
+              f"{ms:.1f} ms)")
+        for name, score in top["final"].items():
+            print(f"{score:.3f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import score_block
+from model.corpus import pack_fingerprints, read_sources
+from model.similarity_model import fingerprint_all
+
+DEFAULT_TOP_K = 20
+
+# Cohort A rows per block product; bounds the dense intermediates
+BLOCK = 512
+
+
+# =========================================================
+# ---------------- COHORTS ----------------
+# =========================================================
+
+def pack_cohorts(fps_a, fps_b):
+    """
+    Pack two {name: Fingerprint} mappings into PackedCorpus blocks that
+    share one vocabulary, so they can be multiplied against each other.
+    A name may appear in both cohorts.
+    """
+    both = {("a", name): fp for name, fp in fps_a.items()}
+    both.update({("b", name): fp for name, fp in fps_b.items()})
+    corpus = pack_fingerprints(both)
+
+    a = corpus.rows(np.arange(len(fps_a)))
+    b = corpus.rows(np.arange(len(fps_a), len(corpus)))
+    a.names = list(fps_a)
+    b.names = list(fps_b)
+    return a, b
+
+
+# =========================================================
+# ---------------- CROSS BLOCK ----------------
+# =========================================================
+
+def cross_matrix(a, b, block=BLOCK):
+    """
+    |A| x |B| final scores of two blocks from pack_cohorts; the A x A
+    and B x B blocks are never computed
+    """
+    matrix = np.empty((len(a), len(b)))
+    for start in range(0, len(a), block):
+        stop = min(start + block, len(a))
+        matrix[start:stop] = score_block(a.rows(np.arange(start, stop)), b)
+    return matrix
+
+
+def top_cross_pairs(matrix, names_a, names_b, k=DEFAULT_TOP_K):
+    """
+    The k highest-scoring (name_a, name_b, score) cells, ties broken by
+    position
+    """
+    scores = matrix.ravel()
+    k = min(k, len(scores))
+    if not k:
+        return []
+    order = np.argpartition(-scores, k - 1)[:k]
+    order = order[np.lexsort((order, -scores[order]))]
+    rows, cols = np.divmod(order, matrix.shape[1])
+    return [
+        (names_a[r], names_b[c], float(matrix[r, c]))
+        for r, c in zip(rows, cols)
+    ]
+
+
+def best_matches(matrix, names_a, names_b):
+    """
+    Closest cohort B file for every cohort A file, most similar first
+    """
+    if not matrix.size:
+        return pd.DataFrame(columns=["file", "closest", "score"])
+    best = matrix.argmax(axis=1)
+    df = pd.DataFrame({
+        "file": names_a,
+        "closest": [names_b[c] for c in best],
+        "score": matrix[np.arange(len(names_a)), best],
+    })
+    return df.sort_values("score", ascending=False,
+                          kind="stable").reset_index(drop=True)
+
+
+def bipartite_scores(fps_a, fps_b, top_k=DEFAULT_TOP_K, block=BLOCK):
+    """
+    Score every cohort A file against every cohort B file.
+
+    Returns a dict:
+        matrix  |A| x |B| DataFrame (rows A, columns B)
+        top     top_k (name_a, name_b, score) pairs
+        best    closest B file for each A file
+        report  cells computed against an all-pairs run over A + B
+    """
+    a, b = pack_cohorts(fps_a, fps_b)
+    matrix = cross_matrix(a, b, block)
+
+    n = len(a) + len(b)
+    total = n * (n - 1) // 2
+    return {
+        "matrix": pd.DataFrame(matrix, index=a.names, columns=b.names),
+        "top": top_cross_pairs(matrix, a.names, b.names, top_k),
+        "best": best_matches(matrix, a.names, b.names),
+        "report": {
+            "files_a": len(a),
+            "files_b": len(b),
+            "pairs": matrix.size,
+            "pairs_all": total,
+            "work_fraction": matrix.size / total if total else 0.0,
+        },
+    }
+
+
+def bipartite_similarity(codes_a, codes_b, top_k=DEFAULT_TOP_K):
+    """
+    bipartite_scores of two {name: code} mappings, each side
+    fingerprinted once
+    """
+    return bipartite_scores(fingerprint_all(codes_a),
+                            fingerprint_all(codes_b), top_k)
+
+
+# =========================================================
+# ---------------- CLI ----------------
+# =========================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.bipartite",
+        description="Compare one cohort of submissions against another"
+    )
+    parser.add_argument("cohort_a", help="directory of new submissions")
+    parser.add_argument("cohort_b", help="directory to compare against")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args(argv)
+
+    result = bipartite_similarity(read_sources(args.cohort_a),
+                                  read_sources(args.cohort_b), args.top_k)
+
+    report = result["report"]
+    print(f"🆚 {report['files_a']} x {report['files_b']} files: "
+          f"{report['pairs']} pairs ({report['work_fraction']:.1%} of "
+          f"all-pairs)")
+    for name_a, name_b, score in result["top"]:
+        print(f"   {score:.3f}  {name_a}  <->  {name_b}")
+
+
+if __name__ == "__main__":
+    main()
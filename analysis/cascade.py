@@ -0,0 +1,219 @@
+import numpy as np
+from scipy import sparse
+
+from analysis.matrix_engine import fuse, row_dots
+from model.corpus import BOUND_SLACK, pack_fingerprints
+from model.similarity_model import (
+    AST_GLOBAL_SHARE, AST_SUBTREE_SHARE, fingerprint_all
+)
+
+DEFAULT_THRESHOLD = 0.4
+BATCH = 65536
+
+# A listed pair costs about this many cells of a block product
+PAIR_COST = 10
+
+# Subtree heights at or above the last bucket share it, so one deep file
+# cannot widen every file's histogram
+HEIGHT_BUCKETS = 32
+
+# Cheapest first; every stage but the last only tightens the bound
+STAGES = ("style", "ast_global", "subtree_bound", "lexical", "ast_subtree")
+
+
+# =========================================================
+# ---------------- BOUNDS ----------------
+# =========================================================
+
+def height_histograms(corpus, buckets=HEIGHT_BUCKETS):
+    """
+    (n, buckets) count of each file's subtrees per height, heights from
+    buckets - 1 up folded into the last column. Equal fingerprints have
+    equal heights, so two files share at most
+    sum_h min(count_a[h], count_b[h]) subtrees; a merged bucket still
+    bounds the shared subtrees it holds.
+    """
+    sizes = corpus.subtree_sizes()
+    heights = np.minimum(
+        corpus.subtree_vocab_heights[corpus.subtree_cols], buckets - 1
+    ).astype(np.int64)
+    hist = np.zeros((len(corpus), buckets), dtype=np.int32)
+    np.add.at(hist, (np.repeat(np.arange(len(corpus)), sizes), heights), 1)
+    return hist
+
+
+def upper_bound(lex, ast_global, ast_sub, style):
+    """
+    Final score with unknown components at their ceilings
+    """
+    return fuse(
+        lex, AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * ast_sub,
+        style
+    )
+
+
+# =========================================================
+# ---------------- CASCADE ----------------
+# =========================================================
+
+class Cascade:
+    """
+    Scores listed pairs one component at a time, cheapest first, and
+    drops a pair as soon as its upper bound falls below the threshold:
+
+        style          one subtraction
+        ast_global     dense node-type dot product
+        subtree_bound  per-height set sizes (no intersection)
+        lexical        sparse token dot product
+        ast_subtree    sparse subtree intersection -> exact score
+
+    Pairs that survive get exactly the score pair_components gives;
+    `stats` counts how many pairs each stage evaluated and pruned.
+    """
+
+    def __init__(self, corpus, threshold=DEFAULT_THRESHOLD):
+        self.corpus = corpus
+        self.threshold = threshold
+        self.tokens = corpus.token_matrix()
+        self.subtrees = corpus.subtree_matrix()
+        self.sizes = corpus.subtree_sizes()
+        self.hist = height_histograms(corpus)
+        self.stats = {stage: {"evaluated": 0, "pruned": 0} for stage in STAGES}
+
+    def _keep(self, stage, bound):
+        keep = bound >= self.threshold - BOUND_SLACK
+        self.stats[stage]["evaluated"] += len(bound)
+        self.stats[stage]["pruned"] += int(len(bound) - keep.sum())
+        return keep
+
+    @staticmethod
+    def _dots(matrix, a, b):
+        """
+        matrix[a] . matrix[b] for the listed pairs of a sparse or dense
+        matrix: one block product when they fill enough of their row x
+        column rectangle, otherwise pair by pair
+        """
+        rows, ra = np.unique(a, return_inverse=True)
+        cols, cb = np.unique(b, return_inverse=True)
+        if len(rows) * len(cols) <= PAIR_COST * len(a):
+            block = matrix[rows] @ matrix[cols].T
+            if sparse.issparse(block):
+                block = block.toarray()
+            return block[ra, cb]
+        if sparse.issparse(matrix):
+            return row_dots(matrix[a], matrix[b])
+        return np.einsum("ij,ij->i", matrix[a], matrix[b])
+
+    def _batch(self, a, b):
+        c = self.corpus
+
+        # ----- Style -----
+        style = 1 / (1 + np.abs(c.entropy[a] - c.entropy[b]))
+        keep = self._keep("style", upper_bound(1.0, 1.0, 1.0, style))
+        a, b, style = a[keep], b[keep], style[keep]
+
+        # ----- AST global -----
+        den = c.ast_norms[a] * c.ast_norms[b]
+        ast_global = np.zeros(len(a))
+        np.divide(self._dots(c.ast_counts, a, b), den, out=ast_global,
+                  where=den > 0)
+        keep = self._keep("ast_global",
+                          upper_bound(1.0, ast_global, 1.0, style))
+        a, b, style, ast_global = a[keep], b[keep], style[keep], ast_global[keep]
+
+        # ----- Subtree overlap bounded by per-height sizes -----
+        smaller = np.minimum(self.sizes[a], self.sizes[b])
+        most = np.minimum(self.hist[a], self.hist[b]).sum(axis=1)
+        sub_bound = np.zeros(len(a))
+        np.divide(most, smaller, out=sub_bound, where=smaller > 0)
+        keep = self._keep("subtree_bound",
+                          upper_bound(1.0, ast_global, sub_bound, style))
+        a, b, style, ast_global, smaller = (
+            a[keep], b[keep], style[keep], ast_global[keep], smaller[keep]
+        )
+
+        # ----- Lexical -----
+        den = c.token_norms[a] * c.token_norms[b]
+        lex = np.zeros(len(a))
+        np.divide(self._dots(self.tokens, a, b), den,
+                  out=lex, where=den > 0)
+        keep = self._keep("lexical", upper_bound(lex, ast_global, 1.0, style))
+        a, b, style, ast_global, smaller, lex = (
+            a[keep], b[keep], style[keep], ast_global[keep], smaller[keep],
+            lex[keep]
+        )
+
+        # ----- Exact subtree overlap -----
+        ast_sub = np.zeros(len(a))
+        np.divide(self._dots(self.subtrees, a, b), smaller,
+                  out=ast_sub, where=smaller > 0)
+        final = upper_bound(lex, ast_global, ast_sub, style)
+        keep = final >= self.threshold
+        self.stats["ast_subtree"]["evaluated"] += len(final)
+        self.stats["ast_subtree"]["pruned"] += int(len(final) - keep.sum())
+        return a[keep], b[keep], final[keep]
+
+    def score(self, i, j, batch=BATCH):
+        """
+        (i, j, final) of the listed pairs scoring >= threshold
+        """
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        found = [self._batch(i[s:s + batch], j[s:s + batch])
+                 for s in range(0, len(i), batch)]
+        if not found:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+        return tuple(np.concatenate(parts) for parts in zip(*found))
+
+    def score_all(self, batch=BATCH):
+        """
+        Every pair i < j scoring >= threshold, generated row by row so
+        the full index list never exists at once
+        """
+        n = len(self.corpus)
+        found, rows, size = [], [], 0
+        for r in range(n - 1):
+            rows.append(r)
+            size += n - 1 - r
+            if size >= batch or r == n - 2:
+                lengths = n - 1 - np.array(rows)
+                i = np.repeat(rows, lengths)
+                starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+                j = i + 1 + np.arange(len(i)) - starts
+                found.append(self._batch(i, j))
+                rows, size = [], 0
+
+        if not found:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+        return tuple(np.concatenate(parts) for parts in zip(*found))
+
+    def report(self):
+        total = self.stats["style"]["evaluated"]
+        return {
+            "threshold": self.threshold,
+            "pairs": total,
+            "stages": [
+                {"stage": stage, **self.stats[stage]} for stage in STAGES
+            ],
+            "results": (self.stats["ast_subtree"]["evaluated"] -
+                        self.stats["ast_subtree"]["pruned"]),
+        }
+
+
+def cascade_similarity(codes, threshold=DEFAULT_THRESHOLD):
+    """
+    {(name_a, name_b): score} of every pair of a {name: code} mapping
+    scoring >= threshold, plus the per-stage report
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    cascade = Cascade(corpus, threshold)
+    i, j, scores = cascade.score_all()
+    names = corpus.names
+    pairs = {
+        tuple(sorted((names[a], names[b]))): float(s)
+        for a, b, s in zip(i, j, scores)
+    }
+    return pairs, cascade.report()
+
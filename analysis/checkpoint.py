@@ -0,0 +1,267 @@
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.parallel_matrix import (
+    DEFAULT_TILE, _place_tile, default_workers, parallel_fingerprints,
+    scheduled_score_matrix, upper_triangle_tiles
+)
+from analysis.scheduler import balance_tiles, doc_costs
+from model.corpus import (
+    corpus_digest, load_corpus, pack_fingerprints, save_corpus
+)
+from model.similarity_model import (
+    AST_SCHEMA, FEATURE_VERSIONS, fingerprint_arrays, fingerprint_from_arrays
+)
+
+VERSION = 2
+MANIFEST = "manifest.json"
+CORPUS = "corpus.npz"
+FINGERPRINT_CHUNK = 500
+FLUSH_TILES = 16
+FLUSH_SECONDS = 60.0
+
+
+# =========================================================
+# ---------------- FILES ----------------
+# =========================================================
+
+def _atomic_write(path, write):
+    """
+    write(f) to a temporary file, then rename over `path`, so a crash
+    never leaves a half-written checkpoint file behind
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def source_digest(codes):
+    h = hashlib.sha256()
+    for name, code in codes.items():
+        h.update(name.encode("utf-8") + b"\0")
+        h.update(code.encode("utf-8", errors="surrogatepass") + b"\0")
+    return h.hexdigest()
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    _atomic_write(
+        os.path.join(directory, MANIFEST),
+        lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8"))
+    )
+
+
+# =========================================================
+# ---------------- FINGERPRINT STAGE ----------------
+# =========================================================
+
+def _save_chunk(path, fps):
+    """
+    Fingerprints as plain arrays (CODECS encoding) in one .npz, headed
+    by the AST schema and feature versions that produced them
+    """
+    header = {
+        "ast_schema": AST_SCHEMA,
+        "versions": FEATURE_VERSIONS,
+        "names": list(fps),
+    }
+    arrays = {}
+    for i, fp in enumerate(fps.values()):
+        for component, parts in fingerprint_arrays(fp).items():
+            for k, arr in enumerate(parts):
+                arrays[f"{i}:{component}:{k}"] = np.asarray(arr)
+
+    _atomic_write(path, lambda f: np.savez(
+        f, header=np.array(json.dumps(header)), **arrays
+    ))
+
+
+def _load_chunk(path, names):
+    """
+    {name: Fingerprint} of a saved chunk, or None unless it holds exactly
+    `names` under this AST schema and these feature versions (a chunk
+    from another interpreter or an unreadable one is recomputed)
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            if (header.get("ast_schema") != AST_SCHEMA or
+                    header.get("versions") != FEATURE_VERSIONS or
+                    header.get("names") != names):
+                return None
+
+            arrays = [{} for _ in names]
+            for key in data.files:
+                if key == "header":
+                    continue
+                i, component, k = key.split(":")
+                arrays[int(i)].setdefault(component, {})[int(k)] = data[key]
+
+        return {
+            name: fingerprint_from_arrays({
+                component: tuple(parts[k] for k in sorted(parts))
+                for component, parts in by_component.items()
+            })
+            for name, by_component in zip(names, arrays)
+        }
+    except Exception:
+        # Truncated, foreign or hand-edited file
+        return None
+
+
+def _checkpointed_fingerprints(codes, directory, workers, chunk_size):
+    """
+    Fingerprint in chunks, each saved as soon as it is done; chunks
+    already on disk are loaded instead of recomputed
+    """
+    names = list(codes)
+    fingerprints = {}
+    for k, start in enumerate(range(0, len(names), chunk_size)):
+        path = os.path.join(directory, f"fingerprints-{k:05d}.npz")
+        chunk_names = names[start:start + chunk_size]
+        if os.path.exists(path):
+            fps = _load_chunk(path, chunk_names)
+            if fps is not None:
+                fingerprints.update(fps)
+                continue
+
+        chunk = {name: codes[name] for name in chunk_names}
+        fps = parallel_fingerprints(chunk, workers)
+        _save_chunk(path, fps)
+        fingerprints.update(fps)
+    return fingerprints
+
+
+def _load_tiles(directory):
+    done = {}
+    for path in sorted(glob.glob(os.path.join(directory, "tiles-*.npz"))):
+        with np.load(path, allow_pickle=False) as data:
+            # Each data[...] access decompresses the whole array again
+            tiles, scores = data["tiles"], data["scores"]
+            offset = 0
+            for tile in tiles:
+                r0, r1, c0, c1 = (int(x) for x in tile)
+                size = (r1 - r0) * (c1 - c0)
+                block = scores[offset:offset + size]
+                done[(r0, r1, c0, c1)] = block.reshape(r1 - r0, c1 - c0)
+                offset += size
+    return done
+
+
+# =========================================================
+# ---------------- CHECKPOINTED BUILDER ----------------
+# =========================================================
+
+def checkpointed_similarity_matrix(codes, directory, workers=None,
+                                   tile_size=DEFAULT_TILE,
+                                   chunk_size=FINGERPRINT_CHUNK,
+                                   flush_tiles=FLUSH_TILES,
+                                   flush_seconds=FLUSH_SECONDS,
+                                   progress=None):
+    """
+    parallel_similarity_matrix that survives being killed.
+
+    Fingerprints are saved per chunk, then packed into `corpus.npz`;
+    the tile plan is fixed in `manifest.json` at that point. Completed
+    tiles are flushed to `tiles-NNNNN.npz` every `flush_tiles` tiles or
+    `flush_seconds`, and once more on the way out of an exception or
+    Ctrl-C. Calling again with the same codes and directory resumes
+    from whatever was saved and returns exactly the matrix an
+    uninterrupted run would. `progress(done, total)` reports tiles.
+    """
+    workers = workers or default_workers()
+    os.makedirs(directory, exist_ok=True)
+    digest = source_digest(codes)
+
+    manifest = _read_manifest(directory)
+    if manifest is not None and (manifest.get("version") != VERSION or
+                                 manifest["source_digest"] != digest):
+        raise ValueError(
+            f"{directory} holds a checkpoint of a different run"
+        )
+
+    corpus_path = os.path.join(directory, CORPUS)
+    if manifest is None:
+        _write_manifest(directory, {
+            "version": VERSION,
+            "source_digest": digest,
+            "chunk_size": chunk_size,
+        })
+        manifest = _read_manifest(directory)
+
+    if "corpus_digest" not in manifest:
+        fingerprints = _checkpointed_fingerprints(
+            codes, directory, workers, manifest["chunk_size"]
+        )
+        corpus = pack_fingerprints(fingerprints)
+        save_corpus(corpus, corpus_path)
+        weighted = balance_tiles(
+            upper_triangle_tiles(len(corpus), tile_size), doc_costs(corpus),
+            workers
+        )
+        manifest["corpus_digest"] = corpus_digest(corpus)
+        manifest["tiles"] = [list(tile) for tile, _ in weighted]
+        _write_manifest(directory, manifest)
+
+    # Always score from the saved corpus so resumed and fresh runs agree
+    corpus = load_corpus(corpus_path)
+    if corpus_digest(corpus) != manifest["corpus_digest"]:
+        raise ValueError(f"{corpus_path} does not match its manifest")
+
+    plan = [tuple(tile) for tile in manifest["tiles"]]
+    resumed = _load_tiles(directory)
+    remaining = [tile for tile in plan if tile not in resumed]
+
+    pending = []
+    state = {
+        "file": len(glob.glob(os.path.join(directory, "tiles-*.npz"))),
+        "flushed": time.monotonic(),
+        "done": len(plan) - len(remaining),
+    }
+
+    def flush():
+        if not pending:
+            return
+        tiles = np.array([t for t, _ in pending], dtype=np.int64)
+        scores = np.concatenate([b.ravel() for _, b in pending])
+        path = os.path.join(directory, f"tiles-{state['file']:05d}.npz")
+        _atomic_write(path, lambda f: np.savez(f, tiles=tiles, scores=scores))
+        state["file"] += 1
+        state["flushed"] = time.monotonic()
+        pending.clear()
+
+    def on_tile(tile, block):
+        pending.append((tile, block))
+        state["done"] += 1
+        if (len(pending) >= flush_tiles or
+                time.monotonic() - state["flushed"] >= flush_seconds):
+            flush()
+        if progress is not None:
+            progress(state["done"], len(plan))
+
+    try:
+        matrix, _ = scheduled_score_matrix(corpus, workers, tiles=remaining,
+                                           on_tile=on_tile)
+    finally:
+        flush()
+
+    for tile, block in resumed.items():
+        _place_tile(matrix, tile, block)
+    np.fill_diagonal(matrix, 1.0)
+    return pd.DataFrame(matrix, index=corpus.names, columns=corpus.names)
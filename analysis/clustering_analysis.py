@@ -2,16 +2,35 @@ import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import linkage, dendrogram, fcluster
 from scipy.spatial.distance import squareform
 
-def perform_clustering(similarity_df, threshold=0.3):
+def cluster_linkage(similarity_df, threshold=0.3):
+    """
+    Average-linkage tree and flat cluster labels at `threshold` distance
+    """
     distance = 1 - similarity_df.values
     condensed = squareform(distance, checks=False)
 
     Z = linkage(condensed, method="average")
-    labels = fcluster(Z, t=threshold, criterion="distance")
+    return Z, fcluster(Z, t=threshold, criterion="distance")
+
 
+def _group(labels, names):
     clusters = {}
-    for label, name in zip(labels, similarity_df.index):
+    for label, name in zip(labels, names):
         clusters.setdefault(label, []).append(name)
+    return clusters
+
+
+def cluster_groups(similarity_df, threshold=0.3):
+    """
+    {label: [names]} without drawing the dendrogram
+    """
+    _, labels = cluster_linkage(similarity_df, threshold)
+    return _group(labels, similarity_df.index)
+
+
+def perform_clustering(similarity_df, threshold=0.3):
+    Z, labels = cluster_linkage(similarity_df, threshold)
+    clusters = _group(labels, similarity_df.index)
 
     fig, ax = plt.subplots(figsize=(12, 6))
     dendrogram(Z, labels=similarity_df.index, leaf_rotation=45, ax=ax)
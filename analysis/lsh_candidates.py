@@ -0,0 +1,225 @@
+import numpy as np
+
+from analysis.matrix_engine import score_matrix, score_pairs
+from lexical.lexical_analysis import token_ids
+from model.corpus import pack_fingerprints
+from model.similarity_model import fingerprint_all
+
+NUM_PERM = 128
+SHINGLE = 5
+DEFAULT_JACCARD = 0.5
+DEFAULT_RECALL = 0.95
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+# =========================================================
+# ---------------- HASHING ----------------
+# =========================================================
+
+def splitmix64(x):
+    """
+    SplitMix64 finalizer over a uint64 array (wrapping arithmetic)
+    """
+    with np.errstate(over="ignore"):
+        z = np.asarray(x, dtype=np.uint64) + _GAMMA
+        z = (z ^ (z >> np.uint64(30))) * _M1
+        z = (z ^ (z >> np.uint64(27))) * _M2
+        return z ^ (z >> np.uint64(31))
+
+
+def token_shingles(code: str, k=SHINGLE):
+    """
+    Sorted unique hashes of every k consecutive normalized tokens
+    (identifiers already renamed VAR_n, so renaming does not matter)
+    """
+    ids = token_ids(code).astype(np.uint64)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    k = min(k, len(ids))
+    h = np.zeros(len(ids) - k + 1, dtype=np.uint64)
+    for t in range(k):
+        h = splitmix64(h ^ ids[t:len(ids) - k + 1 + t])
+    return np.unique(h)
+
+
+# =========================================================
+# ---------------- MINHASH ----------------
+# =========================================================
+
+def minhash_signatures(indptr, values, num_perm=NUM_PERM, seed=0):
+    """
+    (n, num_perm) MinHash signatures of the sets stored CSR-style
+    (values[indptr[d]:indptr[d + 1]] is set d). Empty sets get all-max
+    rows, which callers leave out of the buckets.
+    """
+    n = len(indptr) - 1
+    values = np.asarray(values).astype(np.uint64)
+    sig = np.full((n, num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    nonempty = np.flatnonzero(np.diff(indptr) > 0)
+    if len(nonempty) == 0:
+        return sig
+
+    seeds = splitmix64(np.arange(num_perm, dtype=np.uint64) + np.uint64(seed))
+    starts = indptr[nonempty]
+    for p in range(num_perm):
+        hashed = splitmix64(values ^ seeds[p])
+        sig[nonempty, p] = np.minimum.reduceat(hashed, starts)
+    return sig
+
+
+def collision_probability(s, bands, rows):
+    """
+    Chance two sets with Jaccard similarity s share at least one band
+    """
+    return 1 - (1 - np.asarray(s, dtype=np.float64) ** rows) ** bands
+
+
+def choose_bands(threshold=DEFAULT_JACCARD, recall=DEFAULT_RECALL,
+                 num_perm=NUM_PERM):
+    """
+    (bands, rows) with bands * rows <= num_perm that still catch pairs
+    at `threshold` Jaccard with probability >= `recall`, using as many
+    rows per band as possible (fewest false candidates)
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if collision_probability(threshold, bands, rows) >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+def band_pairs(sig, bands, rows, active=None):
+    """
+    Unique (i, j), i < j, of documents whose signatures agree on all
+    rows of at least one band. `active` limits which rows take part.
+    """
+    docs = np.arange(len(sig)) if active is None else np.asarray(active)
+    found = []
+    for b in range(bands):
+        key = np.zeros(len(docs), dtype=np.uint64)
+        for column in sig[docs, b * rows:(b + 1) * rows].T:
+            key = splitmix64(key ^ column)
+
+        order = np.argsort(key, kind="stable")
+        key, members = key[order], docs[order]
+        bounds = np.flatnonzero(np.diff(key)) + 1
+        for group in np.split(members, bounds):
+            if len(group) > 1:
+                a, c = np.triu_indices(len(group), k=1)
+                found.append(np.stack([group[a], group[c]]))
+
+    if not found:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    pairs = np.concatenate(found, axis=1)
+    lo, hi = np.minimum(pairs[0], pairs[1]), np.maximum(pairs[0], pairs[1])
+    n = max(len(sig), 1)
+    codes = np.unique(lo.astype(np.int64) * n + hi)
+    return codes // n, codes % n
+
+
+# =========================================================
+# ---------------- CANDIDATE GENERATION ----------------
+# =========================================================
+
+def lsh_candidates(codes, corpus=None, threshold=DEFAULT_JACCARD,
+                   recall=DEFAULT_RECALL, num_perm=NUM_PERM,
+                   shingles=True):
+    """
+    Candidate pairs (i, j) of a {name: code} mapping from banded LSH
+    over subtree sets and, with `shingles`, normalized token shingles;
+    a pair colliding in either is kept. Files whose set is empty
+    (e.g. unparsable for subtrees) skip that index.
+    """
+    if corpus is None:
+        corpus = pack_fingerprints(fingerprint_all(codes))
+    bands, rows = choose_bands(threshold, recall, num_perm)
+
+    sets = [(corpus.subtree_indptr, corpus.subtree_vocab[corpus.subtree_cols])]
+    if shingles:
+        hashes = [token_shingles(code) for code in codes.values()]
+        indptr = np.zeros(len(hashes) + 1, dtype=np.int64)
+        np.cumsum([len(h) for h in hashes], out=indptr[1:])
+        values = (np.concatenate(hashes) if hashes
+                  else np.empty(0, dtype=np.uint64))
+        sets.append((indptr, values))
+
+    lo, hi = [], []
+    for indptr, values in sets:
+        sig = minhash_signatures(indptr, values, num_perm)
+        a, b = band_pairs(sig, bands, rows,
+                          active=np.flatnonzero(np.diff(indptr) > 0))
+        lo.append(a)
+        hi.append(b)
+
+    n = max(len(corpus), 1)
+    merged = np.unique(np.concatenate(lo) * n + np.concatenate(hi))
+    return merged // n, merged % n, corpus
+
+
+def lsh_similarity_pairs(codes, threshold=DEFAULT_JACCARD,
+                         recall=DEFAULT_RECALL, num_perm=NUM_PERM):
+    """
+    Exact final scores for LSH candidate pairs only.
+    Returns ({(name_a, name_b): score}, report).
+    """
+    i, j, corpus = lsh_candidates(codes, None, threshold, recall, num_perm)
+    scores = score_pairs(corpus, i, j)
+    names = corpus.names
+
+    n = len(names)
+    total = n * (n - 1) // 2
+    bands, rows = choose_bands(threshold, recall, num_perm)
+    report = {
+        "files": n,
+        "pairs": total,
+        "candidates": int(len(i)),
+        "pruned": int(total - len(i)),
+        "pruned_fraction": (total - len(i)) / total if total else 0.0,
+        "bands": bands,
+        "rows": rows,
+    }
+    pairs = {
+        tuple(sorted((names[a], names[b]))): float(s)
+        for a, b, s in zip(i, j, scores)
+    }
+    return pairs, report
+
+
+# =========================================================
+# ---------------- RECALL CHECK ----------------
+# =========================================================
+
+def measure_recall(codes, score_threshold=0.5, threshold=DEFAULT_JACCARD,
+                   recall=DEFAULT_RECALL, num_perm=NUM_PERM):
+    """
+    Compare LSH candidates with an exhaustive run: the fraction of
+    pairs scoring >= score_threshold that LSH keeps, and how much it
+    prunes
+    """
+    i, j, corpus = lsh_candidates(codes, None, threshold, recall, num_perm)
+    matrix = score_matrix(corpus)
+    n = len(corpus)
+
+    rows, cols = np.triu_indices(n, k=1)
+    positive = matrix[rows, cols] >= score_threshold
+    kept = np.zeros((n, n), dtype=bool)
+    kept[i, j] = True
+    caught = kept[rows, cols] & positive
+
+    total = len(rows)
+    return {
+        "files": n,
+        "pairs": total,
+        "candidates": int(len(i)),
+        "pruned_fraction": (total - len(i)) / total if total else 0.0,
+        "positives": int(positive.sum()),
+        "recall": float(caught.sum() / positive.sum())
+        if positive.any() else 1.0,
+        "bands_rows": choose_bands(threshold, recall, num_perm),
+    }
+
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from model.corpus import pack_fingerprints
+from model.similarity_model import (
+    AST_GLOBAL_SHARE, AST_SUBTREE_SHARE, AST_WEIGHT, LEXICAL_WEIGHT,
+    STRETCH, STYLE_WEIGHT, fingerprint_all
+)
+
+
+# =========================================================
+# ---------------- COMPONENT MATRICES ----------------
+# =========================================================
+
+def _cosine_block(products, norms_a, norms_b):
+    den = np.outer(norms_a, norms_b)
+    out = np.zeros(den.shape)
+    np.divide(products, den, out=out, where=den > 0)
+    return out
+
+
+def component_matrices(rows, cols=None):
+    """
+    All six final_similarity components for every (row, col) pair of
+    two PackedCorpus blocks cut from the same corpus (cols defaults to
+    rows), computed with sparse / dense matrix products.
+    """
+    if cols is None:
+        cols = rows
+
+    # ----- Lexical -----
+    lex_dot = (rows.token_matrix() @ cols.token_matrix().T).toarray()
+    lex = _cosine_block(lex_dot, rows.token_norms, cols.token_norms)
+
+    # ----- AST global -----
+    ast_dot = rows.ast_counts @ cols.ast_counts.T
+    ast_global = _cosine_block(ast_dot, rows.ast_norms, cols.ast_norms)
+
+    # ----- AST subtree -----
+    shared = (rows.subtree_matrix() @ cols.subtree_matrix().T).toarray()
+    smaller = np.minimum.outer(rows.subtree_sizes(), cols.subtree_sizes())
+    ast_sub = np.zeros(shared.shape)
+    np.divide(shared, smaller, out=ast_sub, where=smaller > 0)
+
+    ast_hybrid = AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * ast_sub
+
+    # ----- Style -----
+    style = 1 / (1 + np.abs(np.subtract.outer(rows.entropy, cols.entropy)))
+
+    final = fuse(lex, ast_hybrid, style)
+
+    return {
+        "lexical": lex,
+        "ast_global": ast_global,
+        "ast_subtree": ast_sub,
+        "ast_hybrid": ast_hybrid,
+        "style": style,
+        "final": final,
+    }
+
+
+def fuse(lex, ast_hybrid, style):
+    """
+    Vectorized final score, same weights and stretch as pair_similarity
+    """
+    score = (
+        LEXICAL_WEIGHT * lex +
+        AST_WEIGHT * ast_hybrid +
+        STYLE_WEIGHT * style
+    )
+    return np.clip(score ** STRETCH, 0.0, 1.0)
+
+
+def score_block(rows, cols=None):
+    return component_matrices(rows, cols)["final"]
+
+
+# =========================================================
+# ---------------- SELECTED PAIRS ----------------
+# =========================================================
+
+def row_dots(a, b):
+    """
+    Row-wise dot products of two equally shaped sparse matrices
+    """
+    return np.asarray(a.multiply(b).sum(axis=1)).ravel()
+
+
+def pair_components(corpus, i, j, batch=65536):
+    """
+    The six components for the listed pairs (i[t], j[t]) only, in
+    batches, for when scoring the whole matrix would be wasteful
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    tokens = corpus.token_matrix()
+    subtrees = corpus.subtree_matrix()
+    sizes = corpus.subtree_sizes()
+
+    lex = np.zeros(len(i))
+    ast_global = np.zeros(len(i))
+    ast_sub = np.zeros(len(i))
+    for s in range(0, len(i), batch):
+        a, b = i[s:s + batch], j[s:s + batch]
+
+        den = corpus.token_norms[a] * corpus.token_norms[b]
+        np.divide(row_dots(tokens[a], tokens[b]), den,
+                  out=lex[s:s + batch], where=den > 0)
+
+        den = corpus.ast_norms[a] * corpus.ast_norms[b]
+        dots = np.einsum("ij,ij->i", corpus.ast_counts[a],
+                         corpus.ast_counts[b])
+        np.divide(dots, den, out=ast_global[s:s + batch], where=den > 0)
+
+        smaller = np.minimum(sizes[a], sizes[b])
+        np.divide(row_dots(subtrees[a], subtrees[b]), smaller,
+                  out=ast_sub[s:s + batch], where=smaller > 0)
+
+    ast_hybrid = AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * ast_sub
+    style = 1 / (1 + np.abs(corpus.entropy[i] - corpus.entropy[j]))
+
+    return {
+        "lexical": lex,
+        "ast_global": ast_global,
+        "ast_subtree": ast_sub,
+        "ast_hybrid": ast_hybrid,
+        "style": style,
+        "final": fuse(lex, ast_hybrid, style),
+    }
+
+
+def score_pairs(corpus, i, j):
+    return pair_components(corpus, i, j)["final"]
+
+
+# =========================================================
+# ---------------- FULL MATRIX ----------------
+# =========================================================
+
+def score_matrix(corpus):
+    """
+    Final-score matrix of a PackedCorpus, diagonal fixed at 1.0
+    """
+    matrix = score_block(corpus)
+    np.fill_diagonal(matrix, 1.0)
+    return matrix
+
+
+def similarity_dataframe(codes):
+    """
+    Fingerprint a {name: code} mapping and score every pair at once
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    return pd.DataFrame(
+        score_matrix(corpus), index=corpus.names, columns=corpus.names
+    )
+
+
+def pair_scores(matrix, names):
+    """
+    {(name_a, name_b): score} for the upper triangle, keys sorted the
+    way evaluate_system and roc_curve_data look them up. NaN cells
+    (pairs never compared) are left out.
+    """
+    rows, cols = np.triu_indices(len(names), k=1)
+    compared = ~np.isnan(matrix[rows, cols])
+    rows, cols = rows[compared], cols[compared]
+    return {
+        tuple(sorted((names[i], names[j]))): float(matrix[i, j])
+        for i, j in zip(rows, cols)
+    }
+
+
+def top_pairs(matrix, names, k=100):
+    """
+    The k highest-scoring (name_a, name_b, score) pairs of the upper
+    triangle, ties broken by position
+    """
+    rows, cols = np.triu_indices(len(names), k=1)
+    scores = matrix[rows, cols]
+    order = np.lexsort((cols, rows, -scores))[:k]
+    return [
+        (names[rows[o]], names[cols[o]], float(scores[o])) for o in order
+    ]
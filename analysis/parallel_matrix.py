@@ -0,0 +1,206 @@
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import score_block
+from analysis.scheduler import (
+    WorkQueues, balance_tiles, doc_costs, utilization_report, weigh_tiles
+)
+from model.corpus import pack_fingerprints
+from model.shared_corpus import SharedCorpus, attach_corpus
+from model.similarity_model import fingerprint
+
+DEFAULT_TILE = 256
+
+
+# =========================================================
+# ---------------- TILING ----------------
+# =========================================================
+
+def upper_triangle_tiles(n, tile_size=DEFAULT_TILE):
+    """
+    (row_start, row_stop, col_start, col_stop) blocks covering the upper
+    triangle of an n x n matrix, diagonal blocks included
+    """
+    starts = range(0, n, tile_size)
+    return [
+        (r, min(r + tile_size, n), c, min(c + tile_size, n))
+        for r in starts for c in starts if c >= r
+    ]
+
+
+def _place_tile(matrix, tile, block):
+    r0, r1, c0, c1 = tile
+    if (r0, r1) == (c0, c1):
+        # Keep the matrix exactly symmetric
+        block = np.triu(block) + np.triu(block, 1).T
+    matrix[r0:r1, c0:c1] = block
+    matrix[c0:c1, r0:r1] = block.T
+
+
+def _score_tile(corpus, tile):
+    r0, r1, c0, c1 = tile
+    rows = corpus.rows(np.arange(r0, r1))
+    cols = None if (r0, r1) == (c0, c1) else corpus.rows(np.arange(c0, c1))
+    return score_block(rows, cols)
+
+
+def _worker_loop(spec, worker, inbox, outbox):
+    """
+    Score tiles from `inbox` against the shared corpus until None
+    """
+    try:
+        corpus, segment = attach_corpus(spec)
+        for tile in iter(inbox.get, None):
+            start = time.perf_counter()
+            block = _score_tile(corpus, tile)
+            outbox.put((worker, tile, block, time.perf_counter() - start))
+    except BaseException:
+        outbox.put((worker, None, traceback.format_exc(), 0.0))
+
+
+# =========================================================
+# ---------------- PARALLEL BUILDERS ----------------
+# =========================================================
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def parallel_fingerprints(codes, workers=None):
+    """
+    fingerprint_all over a process pool, preserving order
+    """
+    workers = workers or default_workers()
+    names = list(codes)
+    if workers == 1:
+        return {name: fingerprint(codes[name]) for name in names}
+
+    chunksize = max(1, len(names) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fps = pool.map(fingerprint, [codes[n] for n in names],
+                       chunksize=chunksize)
+        return dict(zip(names, fps))
+
+
+def parallel_score_matrix(corpus, workers=None, tile_size=DEFAULT_TILE):
+    """
+    Final-score matrix of a PackedCorpus, computed tile by tile over the
+    upper triangle (see scheduled_score_matrix)
+    """
+    return scheduled_score_matrix(corpus, workers, tile_size)[0]
+
+
+def scheduled_score_matrix(corpus, workers=None, tile_size=DEFAULT_TILE,
+                           tiles=None, on_tile=None):
+    """
+    Tiled, cost-balanced scoring. Returns (matrix, utilization report).
+
+    Tiles are split until none dominates the estimated total cost, then
+    handed out longest-first from per-worker queues; idle workers steal
+    from the busiest queue. With several workers the corpus is placed
+    in shared memory once; workers map it read-only and each task
+    message is just the tile's index ranges. The segment is released
+    however the run ends.
+
+    `tiles` scores a fixed tile list instead (other cells stay 0), and
+    `on_tile(tile, block)` is called as each tile completes.
+    """
+    workers = workers or default_workers()
+    n = len(corpus)
+    matrix = np.zeros((n, n))
+    if tiles is None:
+        weighted = balance_tiles(
+            upper_triangle_tiles(n, tile_size), doc_costs(corpus), workers
+        )
+    else:
+        weighted = weigh_tiles(tiles, doc_costs(corpus))
+
+    busy = [0.0] * workers
+    done = [0] * workers
+    steals = 0
+    start = time.perf_counter()
+
+    if workers == 1 or len(weighted) <= 1:
+        for tile, _ in weighted:
+            t0 = time.perf_counter()
+            block = _score_tile(corpus, tile)
+            _place_tile(matrix, tile, block)
+            busy[0] += time.perf_counter() - t0
+            done[0] += 1
+            if on_tile is not None:
+                on_tile(tile, block)
+    else:
+        queues = WorkQueues(weighted, workers)
+        ctx = multiprocessing.get_context()
+        outbox = ctx.Queue()
+        inboxes = [ctx.Queue() for _ in range(workers)]
+        procs = []
+
+        with SharedCorpus(corpus) as shared:
+            try:
+                for w in range(workers):
+                    proc = ctx.Process(
+                        target=_worker_loop,
+                        args=(shared.spec, w, inboxes[w], outbox),
+                        daemon=True
+                    )
+                    proc.start()
+                    procs.append(proc)
+
+                active = 0
+                for w in range(workers):
+                    task = queues.next_for(w)
+                    inboxes[w].put(task)
+                    active += task is not None
+
+                while active:
+                    try:
+                        w, tile, block, seconds = outbox.get(timeout=1.0)
+                    except queue.Empty:
+                        if any(p.exitcode not in (None, 0) for p in procs):
+                            raise RuntimeError("A scoring worker died")
+                        continue
+
+                    if tile is None:
+                        raise RuntimeError(f"Worker {w} failed:\n{block}")
+
+                    _place_tile(matrix, tile, block)
+                    busy[w] += seconds
+                    done[w] += 1
+                    if on_tile is not None:
+                        on_tile(tile, block)
+
+                    task = queues.next_for(w)
+                    inboxes[w].put(task)
+                    active -= task is None
+
+                steals = queues.steals
+                for proc in procs:
+                    proc.join()
+            finally:
+                for proc in procs:
+                    if proc.is_alive():
+                        proc.terminate()
+                        proc.join()
+
+    np.fill_diagonal(matrix, 1.0)
+    report = utilization_report(
+        busy, done, time.perf_counter() - start, steals
+    )
+    return matrix, report
+
+
+def parallel_similarity_matrix(codes, workers=None, tile_size=DEFAULT_TILE):
+    """
+    Parallel fingerprinting + tiled scoring of a {name: code} mapping
+    """
+    corpus = pack_fingerprints(parallel_fingerprints(codes, workers))
+    matrix = parallel_score_matrix(corpus, workers, tile_size)
+    return pd.DataFrame(matrix, index=corpus.names, columns=corpus.names)
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import score_matrix, score_pairs, top_pairs
+from model.corpus import pack_fingerprints
+from model.similarity_model import fingerprint_all
+
+# Uploaded solutions are named <assignment>_solution_<n>.py
+DEFAULT_PATTERN = r"^(.*)_solution_\d+\.py$"
+
+# Files no rule places are compared with each other only
+UNGROUPED = "(ungrouped)"
+
+DEFAULT_TOP_K = 20
+DEFAULT_CROSS_THRESHOLD = 0.7
+
+
+# =========================================================
+# ---------------- GROUPING ----------------
+# =========================================================
+
+def directory_groups(names):
+    """
+    Group by containing folder (data/submissions/<problem>/...)
+    """
+    return [os.path.dirname(name) or UNGROUPED for name in names]
+
+
+def pattern_groups(names, pattern=DEFAULT_PATTERN):
+    """
+    Group by a regex over the file name: its first capture group, or
+    the whole match if it has none
+    """
+    regex = re.compile(pattern)
+    groups = []
+    for name in names:
+        m = regex.match(os.path.basename(name))
+        if m is None:
+            groups.append(UNGROUPED)
+        else:
+            groups.append(m.group(1) if regex.groups else m.group(0))
+    return groups
+
+
+def load_manifest(source):
+    """
+    {file: group} from a JSON object or a CSV with file,group columns,
+    given a path or an open (uploaded) file
+    """
+    name = str(getattr(source, "name", source))
+    if name.endswith(".json"):
+        if isinstance(source, str):
+            with open(source, encoding="utf-8") as f:
+                return {str(k): str(v) for k, v in json.load(f).items()}
+        return {str(k): str(v) for k, v in json.load(source).items()}
+
+    df = pd.read_csv(source)
+    return dict(zip(df["file"].astype(str), df["group"].astype(str)))
+
+
+def manifest_groups(names, manifest):
+    """
+    Group by a {file: group} manifest, matched on the full name first
+    and then the base name
+    """
+    return [
+        manifest.get(name, manifest.get(os.path.basename(name), UNGROUPED))
+        for name in names
+    ]
+
+
+# =========================================================
+# ---------------- PARTITIONED SCORING ----------------
+# =========================================================
+
+def _cross_check(corpus, labels, samples, threshold, seed):
+    """
+    Every file against `samples` random members of each other group:
+    a misfiled submission scores high against its real assignment.
+    Returns (every sampled pair, those >= threshold), best first.
+    """
+    rng = np.random.default_rng(seed)
+    members = {g: np.flatnonzero(labels == g) for g in np.unique(labels)}
+
+    i, j = [], []
+    for g, idx in members.items():
+        others = [
+            rng.choice(m, size=min(samples, len(m)), replace=False)
+            for h, m in members.items() if h != g
+        ]
+        if not others:
+            continue
+        picked = np.concatenate(others)
+        i.append(np.repeat(idx, len(picked)))
+        j.append(np.tile(picked, len(idx)))
+
+    if not i:
+        empty = pd.DataFrame(
+            columns=["file_a", "group_a", "file_b", "group_b", "score"]
+        )
+        return empty, empty
+
+    i, j = np.concatenate(i), np.concatenate(j)
+    # Both directions can be drawn; score each pair once
+    codes = np.unique(np.minimum(i, j) * len(corpus) + np.maximum(i, j))
+    i, j = codes // len(corpus), codes % len(corpus)
+    scores = score_pairs(corpus, i, j)
+
+    names = corpus.names
+    found = pd.DataFrame({
+        "file_a": [names[a] for a in i],
+        "group_a": labels[i],
+        "file_b": [names[b] for b in j],
+        "group_b": labels[j],
+        "score": scores,
+    })
+    found = found.sort_values("score", ascending=False,
+                              kind="stable").reset_index(drop=True)
+    return found, found[found["score"] >= threshold].reset_index(drop=True)
+
+
+def partitioned_scores(corpus, labels, top_k=DEFAULT_TOP_K, cross_samples=0,
+                       cross_threshold=DEFAULT_CROSS_THRESHOLD, seed=0):
+    """
+    Score a PackedCorpus only within groups (`labels[d]` is file d's
+    group), optionally with a sampled cross-group check.
+
+    Returns a dict:
+        groups       {group: similarity DataFrame}
+        top_pairs    {group: [(name_a, name_b, score)]}
+        combined     n x n DataFrame in corpus order: scores within
+                     groups and for sampled cross-group pairs, NaN for
+                     pairs never compared
+        top          combined top_k pairs over all groups
+        cross_check  sampled cross-group pairs >= cross_threshold
+        report       pair counts against a full all-pairs run
+    """
+    labels = np.asarray(labels, dtype=object)
+    n = len(corpus)
+    names = corpus.names
+    combined = np.full((n, n), np.nan)
+
+    groups, tops, within = {}, {}, 0
+    for g in sorted(set(labels)):
+        idx = np.flatnonzero(labels == g)
+        block = score_matrix(corpus.rows(idx))
+        combined[np.ix_(idx, idx)] = block
+        members = [names[d] for d in idx]
+        groups[g] = pd.DataFrame(block, index=members, columns=members)
+        tops[g] = top_pairs(block, members, top_k)
+        within += len(idx) * (len(idx) - 1) // 2
+
+    flagged, sampled = pd.DataFrame(), 0
+    if cross_samples:
+        found, flagged = _cross_check(corpus, labels, cross_samples,
+                                      cross_threshold, seed)
+        index = {name: d for d, name in enumerate(names)}
+        a = found["file_a"].map(index).to_numpy(dtype=np.int64)
+        b = found["file_b"].map(index).to_numpy(dtype=np.int64)
+        combined[a, b] = combined[b, a] = found["score"].to_numpy()
+        sampled = len(found)
+
+    merged = sorted(
+        (pair for pairs in tops.values() for pair in pairs),
+        key=lambda pair: -pair[2]
+    )[:top_k]
+
+    total = n * (n - 1) // 2
+    return {
+        "groups": groups,
+        "top_pairs": tops,
+        "combined": pd.DataFrame(combined, index=names, columns=names),
+        "top": merged,
+        "cross_check": flagged,
+        "report": {
+            "files": n,
+            "groups": len(groups),
+            "pairs": total,
+            "pairs_within": within,
+            "pairs_cross_sampled": sampled,
+            "work_fraction": (within + sampled) / total if total else 0.0,
+        },
+    }
+
+
+def partitioned_similarity(codes, by="directory", pattern=DEFAULT_PATTERN,
+                           manifest=None, **kwargs):
+    """
+    Fingerprint a {name: code} mapping and score it within groups
+    formed `by` "directory", "pattern" (regex on the file name) or
+    "manifest" ({file: group} or a path to one)
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    if by == "directory":
+        labels = directory_groups(corpus.names)
+    elif by == "pattern":
+        labels = pattern_groups(corpus.names, pattern)
+    elif by == "manifest":
+        if isinstance(manifest, str):
+            manifest = load_manifest(manifest)
+        labels = manifest_groups(corpus.names, manifest or {})
+    else:
+        raise ValueError(f"Unknown grouping: {by}")
+    return partitioned_scores(corpus, labels, **kwargs)
+
@@ -0,0 +1,191 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis.matrix_engine import score_block
+from model.corpus import CorpusBuilder
+from model.similarity_model import fingerprint
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+# =========================================================
+# ---------------- STAGES ----------------
+# =========================================================
+
+def _put(q, item, stop):
+    """
+    Blocking put that gives up once the pipeline is being torn down
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """
+    Blocking get that returns _DONE once the pipeline is being torn down
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _read_stage(sources, out, stop):
+    try:
+        for name, read in sources:
+            data = read() if callable(read) else read
+            if isinstance(data, bytes):
+                data = data.decode("utf-8", errors="ignore")
+            if not _put(out, (name, data), stop):
+                return
+        _put(out, _DONE, stop)
+    except BaseException as e:
+        _put(out, _Failed(e), stop)
+
+
+def _fingerprint_stage(inbox, out, stop, workers, max_in_flight):
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+
+    try:
+        while True:
+            item = _get(inbox, stop)
+            if item is _DONE or isinstance(item, _Failed):
+                break
+
+            name, code = item
+            if pool is None:
+                if not _put(out, (name, fingerprint(code)), stop):
+                    return
+                continue
+
+            pending.append((name, pool.submit(fingerprint, code)))
+            while len(pending) >= max_in_flight:
+                name, future = pending.popleft()
+                if not _put(out, (name, future.result()), stop):
+                    return
+
+        while pending:
+            name, future = pending.popleft()
+            if not _put(out, (name, future.result()), stop):
+                return
+        _put(out, item, stop)
+    except BaseException as e:
+        _put(out, _Failed(e), stop)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# =========================================================
+# ---------------- STREAMING SCORES ----------------
+# =========================================================
+
+def stream_scores(sources, workers=1, queue_size=32, batch_size=32):
+    """
+    Read, fingerprint and score submissions as a pipeline.
+
+    `sources` yields (name, data) where data is str, bytes or a
+    zero-argument callable returning either. Reading, fingerprinting
+    (in `workers` processes when > 1) and scoring run concurrently,
+    joined by queues of at most `queue_size` items, so only a bounded
+    number of source texts is ever held; only compact fingerprints are
+    kept for the all-pairs part.
+
+    Yields (names, block) per batch of up to `batch_size` new files
+    (a repeated name keeps its first submission):
+    block[i, j] is the final score of names[i] against the j-th file
+    seen so far (batch included), i.e. rows of the lower triangle.
+    """
+    stop = threading.Event()
+    texts = queue.Queue(maxsize=queue_size)
+    fps = queue.Queue(maxsize=queue_size)
+
+    threads = [
+        threading.Thread(target=_read_stage, args=(sources, texts, stop),
+                         daemon=True),
+        threading.Thread(target=_fingerprint_stage,
+                         args=(texts, fps, stop, workers, queue_size),
+                         daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    # Earlier rows are packed once; each batch is only appended
+    packed = CorpusBuilder()
+    seen = set()
+    try:
+        while True:
+            batch = {}
+            item = None
+            while len(batch) < batch_size:
+                item = fps.get()
+                if item is _DONE or isinstance(item, _Failed):
+                    break
+                name, fp = item
+                if name not in seen:
+                    # Duplicate names keep their first submission
+                    batch.setdefault(name, fp)
+
+            if batch:
+                seen.update(batch)
+                start = len(packed)
+                packed.add(batch)
+                corpus = packed.corpus()
+                rows = corpus.rows(np.arange(start, len(corpus)))
+                yield list(batch), score_block(rows, corpus)
+
+            if isinstance(item, _Failed):
+                raise item.error
+            if item is _DONE:
+                return
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+def streamed_similarity_matrix(sources, workers=1, queue_size=32,
+                               batch_size=32, progress=None):
+    """
+    Assemble stream_scores output into the usual symmetric DataFrame.
+    `progress(files_scored)` is called after every batch.
+    """
+    names = []
+    rows = []
+    for batch_names, block in stream_scores(sources, workers, queue_size,
+                                            batch_size):
+        names.extend(batch_names)
+        rows.append(block)
+        if progress is not None:
+            progress(len(names))
+
+    n = len(names)
+    matrix = np.zeros((n, n))
+    start = 0
+    for block in rows:
+        stop = start + len(block)
+        matrix[start:stop, :stop] = block
+        start = stop
+
+    # Lower triangle is authoritative; mirror it
+    matrix = np.tril(matrix, -1) + np.tril(matrix, -1).T
+    np.fill_diagonal(matrix, 1.0)
+    return pd.DataFrame(matrix, index=names, columns=names)
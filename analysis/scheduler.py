@@ -0,0 +1,146 @@
+from collections import deque
+
+import numpy as np
+
+
+# =========================================================
+# ---------------- COST MODEL ----------------
+# =========================================================
+
+def doc_costs(corpus):
+    """
+    Relative scoring cost of each file: AST nodes, distinct subtrees
+    and distinct tokens all grow the work of every pair it is in
+    """
+    return (
+        corpus.node_counts() +
+        corpus.subtree_sizes() +
+        np.diff(corpus.token_indptr)
+    ).astype(np.float64) + 1.0
+
+
+def tile_cost(prefix, tile):
+    """
+    Estimated cost of a tile given prefix sums of doc_costs: every pair
+    (i, j) costs roughly cost_i + cost_j
+    """
+    r0, r1, c0, c1 = tile
+    rows = prefix[r1] - prefix[r0]
+    cols = prefix[c1] - prefix[c0]
+    cost = (c1 - c0) * rows + (r1 - r0) * cols
+    return cost / 2 if (r0, r1) == (c0, c1) else cost
+
+
+def _split(tile):
+    r0, r1, c0, c1 = tile
+    if (r0, r1) == (c0, c1):
+        m = (r0 + r1) // 2
+        return [(r0, m, r0, m), (m, r1, m, r1), (r0, m, m, r1)]
+    if r1 - r0 >= c1 - c0:
+        m = (r0 + r1) // 2
+        return [(r0, m, c0, c1), (m, r1, c0, c1)]
+    m = (c0 + c1) // 2
+    return [(r0, r1, c0, m), (r0, r1, m, c1)]
+
+
+def weigh_tiles(tiles, costs):
+    """
+    [(tile, cost)] for a fixed tile list, sorted by decreasing cost
+    """
+    prefix = np.concatenate([[0.0], np.cumsum(costs)])
+    out = [(tile, tile_cost(prefix, tile)) for tile in tiles]
+    out.sort(key=lambda item: -item[1])
+    return out
+
+
+def balance_tiles(tiles, costs, workers, granularity=8):
+    """
+    Split tiles until none costs more than total / (workers * granularity),
+    so a few giant submissions end up spread over many small tiles.
+    Returns [(tile, cost)] sorted by decreasing cost.
+    """
+    prefix = np.concatenate([[0.0], np.cumsum(costs)])
+    total = sum(tile_cost(prefix, t) for t in tiles)
+    target = total / max(workers * granularity, 1)
+
+    out = []
+    pending = list(tiles)
+    while pending:
+        tile = pending.pop()
+        cost = tile_cost(prefix, tile)
+        r0, r1, c0, c1 = tile
+        if cost > target and max(r1 - r0, c1 - c0) > 1:
+            pending.extend(_split(tile))
+        else:
+            out.append((tile, cost))
+
+    out.sort(key=lambda item: -item[1])
+    return out
+
+
+# =========================================================
+# ---------------- WORK QUEUES ----------------
+# =========================================================
+
+class WorkQueues:
+    """
+    Per-worker task deques filled longest-processing-time first (each
+    task goes to the currently least-loaded worker). A worker whose own
+    deque runs dry steals from the back of the most loaded one.
+    """
+
+    def __init__(self, weighted_tasks, workers):
+        self.queues = [deque() for _ in range(workers)]
+        self.remaining = [0.0] * workers
+        self.steals = 0
+
+        for task, cost in sorted(weighted_tasks, key=lambda t: -t[1]):
+            w = min(range(workers), key=self.remaining.__getitem__)
+            self.queues[w].append((task, cost))
+            self.remaining[w] += cost
+
+    def next_for(self, worker):
+        """
+        Next task for `worker`, stolen if necessary; None when all done
+        """
+        own = self.queues[worker]
+        if own:
+            task, cost = own.popleft()
+            self.remaining[worker] -= cost
+            return task
+
+        victim = max(range(len(self.queues)), key=self.remaining.__getitem__)
+        if not self.queues[victim]:
+            return None
+
+        task, cost = self.queues[victim].pop()
+        self.remaining[victim] -= cost
+        self.steals += 1
+        return task
+
+
+# =========================================================
+# ---------------- UTILIZATION REPORT ----------------
+# =========================================================
+
+def utilization_report(busy, tiles_done, wall, steals):
+    """
+    Per-worker busy time / wall time, plus a summary imbalance figure
+    (max busy / mean busy; 1.0 is perfectly balanced)
+    """
+    busy = np.asarray(busy, dtype=np.float64)
+    mean = busy.mean() if len(busy) else 0.0
+    return {
+        "wall_seconds": wall,
+        "steals": steals,
+        "imbalance": float(busy.max() / mean) if mean else 1.0,
+        "workers": [
+            {
+                "worker": w,
+                "tiles": int(tiles_done[w]),
+                "busy_seconds": float(busy[w]),
+                "utilization": float(busy[w] / wall) if wall else 0.0,
+            }
+            for w in range(len(busy))
+        ],
+    }
@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analysis.parallel_matrix import (
+    DEFAULT_TILE, _place_tile, _score_tile, parallel_fingerprints,
+    upper_triangle_tiles
+)
+from analysis.scheduler import WorkQueues, balance_tiles, doc_costs
+from model.corpus import (
+    corpus_digest, load_corpus, pack_fingerprints, read_sources, save_corpus
+)
+from model.corpus_snapshot import write_snapshot
+
+FORMAT = "shard-result"
+VERSION = 1
+DEFAULT_TOP_K = 100
+
+
+# =========================================================
+# ---------------- SNAPSHOT ----------------
+# =========================================================
+
+def build_snapshot(root, path, workers=None):
+    """
+    Fingerprint every file under root once and save the packed corpus
+    that all shards read: .npz, or the memory-mapped binary format for
+    any other extension
+    """
+    corpus = pack_fingerprints(parallel_fingerprints(read_sources(root),
+                                                     workers))
+    if path.endswith(".npz"):
+        save_corpus(corpus, path)
+    else:
+        write_snapshot(corpus, path)
+    return corpus
+
+
+# =========================================================
+# ---------------- SHARD PLAN ----------------
+# =========================================================
+
+def shard_plan(corpus, shards, tile_size=DEFAULT_TILE):
+    """
+    Deterministic split of the upper-triangle tiles into `shards` lists
+    of roughly equal estimated cost. Depends only on the snapshot, so
+    every host computes the same plan independently.
+    """
+    weighted = balance_tiles(
+        upper_triangle_tiles(len(corpus), tile_size), doc_costs(corpus),
+        shards
+    )
+    queues = WorkQueues(weighted, shards)
+    return [[tile for tile, _ in q] for q in queues.queues]
+
+
+def _tile_pairs(tile, block):
+    """
+    Global (i, j, score) of the strict upper-triangle cells of a tile
+    """
+    r0, r1, c0, c1 = tile
+    if (r0, r1) == (c0, c1):
+        i, j = np.triu_indices(r1 - r0, k=1)
+    else:
+        i, j = np.indices(block.shape).reshape(2, -1)
+    return i + r0, j + c0, block[i, j]
+
+
+def _keep_top(i, j, scores, k):
+    order = np.lexsort((j, i, -scores))[:k]
+    return i[order], j[order], scores[order]
+
+
+def _cells(tile):
+    r0, r1, c0, c1 = tile
+    m = r1 - r0
+    return m * (m + 1) // 2 if (r0, r1) == (c0, c1) else m * (c1 - c0)
+
+
+# =========================================================
+# ---------------- RUN ONE SHARD ----------------
+# =========================================================
+
+def shard_path(out_dir, shard, shards):
+    return os.path.join(out_dir, f"shard-{shard:04d}-of-{shards:04d}.npz")
+
+
+def run_shard(snapshot, shard, shards, out_dir,
+              tile_size=DEFAULT_TILE, top_k=DEFAULT_TOP_K):
+    """
+    Score one shard of the snapshot and write its partial result.
+
+    The .npz is self-describing: a JSON header (format, snapshot digest,
+    shard numbering, tile size, names), the scored tiles with their raw
+    blocks, and the shard's own top_k pairs.
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard {shard} out of range for {shards} shards")
+
+    corpus = load_corpus(snapshot)
+    tiles = shard_plan(corpus, shards, tile_size)[shard]
+
+    blocks = []
+    top = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0))
+    for tile in tiles:
+        block = _score_tile(corpus, tile)
+        blocks.append(block.ravel())
+        i, j, s = _tile_pairs(tile, block)
+        top = _keep_top(np.concatenate([top[0], i]),
+                        np.concatenate([top[1], j]),
+                        np.concatenate([top[2], s]), top_k)
+
+    header = {
+        "format": FORMAT,
+        "version": VERSION,
+        "digest": corpus_digest(corpus),
+        "shard": shard,
+        "shards": shards,
+        "tile_size": tile_size,
+        "top_k": top_k,
+        "names": corpus.names,
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = shard_path(out_dir, shard, shards)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            header=np.array(json.dumps(header)),
+            tiles=np.array(tiles, dtype=np.int64).reshape(-1, 4),
+            scores=np.concatenate(blocks) if blocks else np.empty(0),
+            top_i=top[0], top_j=top[1], top_scores=top[2],
+        )
+    os.replace(tmp, path)
+    return path
+
+
+# =========================================================
+# ---------------- MERGE ----------------
+# =========================================================
+
+def _load_partial(path):
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} shard result")
+        return header, {key: data[key] for key in data.files
+                        if key != "header"}
+
+
+def merge_shards(paths, top_k=DEFAULT_TOP_K, threshold=0.3, matrix=True):
+    """
+    Combine shard results into the global view.
+
+    Checks that every shard of one snapshot is present exactly once and
+    that the tiles cover the upper triangle, then returns
+    {"names", "top_pairs", "matrix", "clusters"}. With matrix=False only
+    the top pairs are assembled (matrix and clusters are None), which
+    needs no n x n memory; threshold=None skips clustering.
+    """
+    partials = [_load_partial(p) for p in paths]
+    if not partials:
+        raise ValueError("No shard results to merge")
+
+    first = partials[0][0]
+    for header, _ in partials:
+        for key in ("digest", "shards", "tile_size"):
+            if header[key] != first[key]:
+                raise ValueError(f"Shard results disagree on {key}")
+
+    found = sorted(header["shard"] for header, _ in partials)
+    if found != list(range(first["shards"])):
+        raise ValueError(
+            f"Expected shards 0..{first['shards'] - 1}, found {found}"
+        )
+
+    names = first["names"]
+    n = len(names)
+    covered = sum(_cells(tuple(t)) for _, d in partials for t in d["tiles"])
+    if covered != n * (n + 1) // 2:
+        raise ValueError("Shard tiles do not cover the upper triangle")
+
+    if top_k > min(h["top_k"] for h, _ in partials):
+        raise ValueError("top_k exceeds what the shards kept")
+
+    i, j, s = _keep_top(
+        np.concatenate([d["top_i"] for _, d in partials]),
+        np.concatenate([d["top_j"] for _, d in partials]),
+        np.concatenate([d["top_scores"] for _, d in partials]),
+        top_k
+    )
+    result = {
+        "names": names,
+        "top_pairs": [
+            (names[a], names[b], float(score)) for a, b, score in zip(i, j, s)
+        ],
+        "matrix": None,
+        "clusters": None,
+    }
+    if not matrix:
+        return result
+
+    full = np.zeros((n, n))
+    for _, data in partials:
+        scores = data["scores"]
+        offset = 0
+        for tile in data["tiles"]:
+            r0, r1, c0, c1 = (int(x) for x in tile)
+            size = (r1 - r0) * (c1 - c0)
+            block = scores[offset:offset + size]
+            _place_tile(full, (r0, r1, c0, c1), block.reshape(r1 - r0, -1))
+            offset += size
+    np.fill_diagonal(full, 1.0)
+
+    df = pd.DataFrame(full, index=names, columns=names)
+    result["matrix"] = df
+    if threshold is None:
+        return result
+
+    # Imported here so shard hosts do not need the plotting stack
+    from analysis.clustering_analysis import cluster_groups
+
+    result["clusters"] = cluster_groups(df, threshold) if n > 1 else {}
+    return result
+
+
+# =========================================================
+# ---------------- LOCAL RUN ----------------
+# =========================================================
+
+def run_local(snapshot, shards, out_dir, tile_size=DEFAULT_TILE,
+              top_k=DEFAULT_TOP_K):
+    """
+    Run every shard as its own OS process on this machine, the way
+    separate hosts would, and return the partial result paths
+    """
+    procs = [
+        subprocess.Popen([
+            sys.executable, "-m", "analysis.sharding", "run", snapshot,
+            str(shard), str(shards), out_dir,
+            "--tile-size", str(tile_size), "--top-k", str(top_k),
+        ])
+        for shard in range(shards)
+    ]
+    for shard, proc in enumerate(procs):
+        if proc.wait() != 0:
+            raise RuntimeError(f"Shard {shard} exited with {proc.returncode}")
+    return [shard_path(out_dir, s, shards) for s in range(shards)]
+
+
+# =========================================================
+# ---------------- CLI ----------------
+# =========================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.sharding",
+        description="Sharded all-pairs similarity runs"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("snapshot", help="fingerprint a directory once")
+    p.add_argument("root")
+    p.add_argument("snapshot")
+    p.add_argument("--workers", type=int, default=None)
+
+    p = sub.add_parser("run", help="score one shard")
+    p.add_argument("snapshot")
+    p.add_argument("shard", type=int)
+    p.add_argument("shards", type=int)
+    p.add_argument("out_dir")
+    p.add_argument("--tile-size", type=int, default=DEFAULT_TILE)
+    p.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+
+    p = sub.add_parser("merge", help="combine shard results")
+    p.add_argument("out_dir")
+    p.add_argument("shards", type=int)
+    p.add_argument("--top-k", type=int, default=20)
+    p.add_argument("--threshold", type=float, default=0.3)
+    p.add_argument("--matrix-csv", default=None)
+
+    p = sub.add_parser("local", help="run all shards here and merge")
+    p.add_argument("snapshot")
+    p.add_argument("shards", type=int)
+    p.add_argument("out_dir")
+    p.add_argument("--tile-size", type=int, default=DEFAULT_TILE)
+    p.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        corpus = build_snapshot(args.root, args.snapshot, args.workers)
+        print(f"📦 Snapshot: {len(corpus)} files -> {args.snapshot}")
+
+    elif args.command == "run":
+        path = run_shard(args.snapshot, args.shard, args.shards,
+                         args.out_dir, args.tile_size, args.top_k)
+        print(f"✅ Shard {args.shard}/{args.shards} -> {path}")
+
+    elif args.command == "merge":
+        # Only this run's files: leftovers of a run with another shard
+        # count stay out of the merge
+        paths = [shard_path(args.out_dir, shard, args.shards)
+                 for shard in range(args.shards)]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            parser.error(f"missing shard results: {', '.join(missing)}")
+        merged = merge_shards(paths, args.top_k, args.threshold,
+                              matrix=args.matrix_csv is not None)
+        for a, b, score in merged["top_pairs"]:
+            print(f"{score:.3f}  {a}  {b}")
+        if merged["matrix"] is not None:
+            merged["matrix"].to_csv(args.matrix_csv)
+            groups = [g for g in merged["clusters"].values() if len(g) > 1]
+            print(f"🧩 Clusters with 2+ files: {len(groups)}")
+
+    elif args.command == "local":
+        paths = run_local(args.snapshot, args.shards, args.out_dir,
+                          args.tile_size, args.top_k)
+        merged = merge_shards(paths, args.top_k, matrix=False)
+        print(f"📁 Files: {len(merged['names'])} over {args.shards} shards")
+        for a, b, score in merged["top_pairs"]:
+            print(f"{score:.3f}  {a}  {b}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import math
+
+import numpy as np
+from scipy import stats
+
+from analysis.lsh_candidates import band_pairs, collision_probability, splitmix64
+from analysis.matrix_engine import component_matrices
+from model.corpus import pack_fingerprints
+from model.similarity_model import fingerprint_all
+
+BITS = 256
+DEFAULT_COSINE = 0.9
+DEFAULT_RECALL = 0.95
+MAX_TABLES = 64
+
+# Separate hyperplanes per component
+SEEDS = {"lexical": 1, "ast_global": 2}
+
+_UNIT = 2.0 ** -53
+
+# Bits set in each byte value, for numpy < 2 (no np.bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# =========================================================
+# ---------------- SIGNATURES ----------------
+# =========================================================
+
+def hyperplanes(ids, bits=BITS, seed=0):
+    """
+    (len(ids), bits) standard normal hyperplane coordinates derived from
+    a hash of (feature id, bit), so signatures of different corpora use
+    the same hyperplanes (Box-Muller over two SplitMix64 streams)
+    """
+    keys = (np.asarray(ids).astype(np.int64).astype(np.uint64)[:, None] *
+            np.uint64(bits) + np.arange(bits, dtype=np.uint64)[None, :])
+    keys = keys ^ splitmix64(np.uint64(seed))
+    u1 = ((splitmix64(keys) >> np.uint64(11)) + np.uint64(1)) * _UNIT
+    u2 = (splitmix64(~keys) >> np.uint64(11)) * _UNIT
+    return np.sqrt(-2 * np.log(u1)) * np.cos(2 * np.pi * u2)
+
+
+def simhash_signatures(matrix, ids, bits=BITS, seed=0):
+    """
+    Random-hyperplane SimHash of every row of a (sparse or dense) count
+    matrix whose columns are the features `ids`: bit b is set when the
+    row lies on the positive side of hyperplane b. Packed into
+    (n, bits // 64) uint64 words.
+    """
+    projected = np.asarray(matrix @ hyperplanes(ids, bits, seed))
+    return np.packbits(projected > 0, axis=1, bitorder="little").view(np.uint64)
+
+
+def corpus_signatures(corpus, bits=BITS):
+    """
+    {"lexical": ..., "ast_global": ...} signatures of a PackedCorpus
+    """
+    return {
+        "lexical": simhash_signatures(
+            corpus.token_matrix(), corpus.token_vocab, bits,
+            SEEDS["lexical"]
+        ),
+        "ast_global": simhash_signatures(
+            corpus.ast_counts, np.arange(corpus.ast_counts.shape[1]), bits,
+            SEEDS["ast_global"]
+        ),
+    }
+
+
+def hamming(sig_a, sig_b):
+    """
+    Row-wise Hamming distance between two equally shaped signature arrays
+    """
+    diff = np.ascontiguousarray(sig_a ^ sig_b)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=-1)
+    return _POPCOUNT[diff.view(np.uint8)].sum(axis=-1, dtype=np.uint64)
+
+
+def hamming_cosine(distance, bits=BITS):
+    """
+    Cosine implied by a Hamming distance: P(bit differs) = angle / pi
+    """
+    return np.cos(np.pi * np.asarray(distance) / bits)
+
+
+# =========================================================
+# ---------------- PARAMETERS ----------------
+# =========================================================
+
+def flip_probability(cosine):
+    return math.acos(min(max(cosine, -1.0), 1.0)) / math.pi
+
+
+def hamming_radius(cosine=DEFAULT_COSINE, recall=DEFAULT_RECALL, bits=BITS):
+    """
+    Largest Hamming distance to accept so a pair exactly at `cosine`
+    passes with probability >= recall (binomial quantile)
+    """
+    return int(stats.binom.ppf(recall, bits, flip_probability(cosine)))
+
+
+def choose_tables(cosine=DEFAULT_COSINE, recall=DEFAULT_RECALL, bits=BITS,
+                  max_tables=MAX_TABLES):
+    """
+    (tables, prefix): the longest prefix (fewest false candidates) for
+    which at most `max_tables` permuted tables still bring a pair at
+    `cosine` together with probability >= recall
+    """
+    agree = 1 - flip_probability(cosine)
+    for prefix in range(bits, 0, -1):
+        hit = agree ** prefix
+        if hit >= 1:
+            return 1, prefix
+        if hit <= 0:
+            continue
+        tables = math.ceil(math.log1p(-recall) / math.log1p(-hit))
+        if tables <= max_tables:
+            return tables, prefix
+    return max_tables, 1
+
+
+# =========================================================
+# ---------------- PERMUTED-PREFIX SEARCH ----------------
+# =========================================================
+
+def prefix_pairs(sig, tables, prefix, seed=0, active=None):
+    """
+    Unique (i, j), i < j, whose signatures agree on the first `prefix`
+    bits of at least one of `tables` random bit permutations
+    """
+    bits = np.unpackbits(sig.view(np.uint8), axis=1, bitorder="little")
+    rng = np.random.default_rng(seed)
+    columns = np.concatenate([
+        rng.permutation(bits.shape[1])[:prefix] for _ in range(tables)
+    ])
+    return band_pairs(bits[:, columns].astype(np.uint64), tables, prefix,
+                      active)
+
+
+def simhash_candidates(sig, cosine=DEFAULT_COSINE, recall=DEFAULT_RECALL,
+                       max_tables=MAX_TABLES, active=None):
+    """
+    Pairs whose cosine is likely >= `cosine`: bucketed by permuted
+    prefixes, then kept if their Hamming distance is within the radius.
+    The recall target is split evenly between the two stages.
+    Returns (i, j, report).
+    """
+    bits = sig.shape[1] * 64
+    stage_recall = math.sqrt(recall)
+    tables, prefix = choose_tables(cosine, stage_recall, bits, max_tables)
+    radius = hamming_radius(cosine, stage_recall, bits)
+
+    i, j = prefix_pairs(sig, tables, prefix, active=active)
+    keep = hamming(sig[i], sig[j]) <= radius
+
+    n = len(sig)
+    report = {
+        "files": n,
+        "pairs": n * (n - 1) // 2,
+        "bucketed": int(len(i)),
+        "candidates": int(keep.sum()),
+        "tables": tables,
+        "prefix": prefix,
+        "radius": radius,
+        "expected_recall": float(
+            collision_probability(1 - flip_probability(cosine), tables,
+                                  prefix) *
+            stats.binom.cdf(radius, bits, flip_probability(cosine))
+        ),
+    }
+    return i[keep], j[keep], report
+
+
+# =========================================================
+# ---------------- RECALL / PRECISION ----------------
+# =========================================================
+
+def measure(codes, cosine=DEFAULT_COSINE, recall=DEFAULT_RECALL, bits=BITS):
+    """
+    Compare SimHash candidates with the exact lexical and AST-global
+    cosines of every pair. Returns {component: report} with recall
+    (exact pairs >= cosine that are candidates) and precision
+    (candidates whose exact cosine is >= cosine).
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    exact = component_matrices(corpus.rows(np.arange(len(corpus))))
+    signatures = corpus_signatures(corpus, bits)
+    nonzero = {
+        "lexical": np.flatnonzero(corpus.token_norms > 0),
+        "ast_global": np.flatnonzero(corpus.ast_norms > 0),
+    }
+
+    rows, cols = np.triu_indices(len(corpus), k=1)
+    reports = {}
+    for component, sig in signatures.items():
+        i, j, report = simhash_candidates(sig, cosine, recall,
+                                          active=nonzero[component])
+        # Rounding: identical files can land a hair below 1.0
+        positive = exact[component][rows, cols] >= cosine - 1e-9
+        hits = exact[component][i, j] >= cosine - 1e-9
+
+        report["positives"] = int(positive.sum())
+        report["recall"] = (float(hits.sum() / positive.sum())
+                            if positive.any() else 1.0)
+        report["precision"] = float(hits.mean()) if len(i) else 1.0
+        reports[component] = report
+    return reports
+
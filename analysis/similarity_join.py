@@ -0,0 +1,336 @@
+import numpy as np
+
+from analysis.cascade import Cascade
+from analysis.matrix_engine import score_matrix
+from model.corpus import BOUND_SLACK, gather_slices, pack_fingerprints
+from model.similarity_model import (
+    AST_GLOBAL_SHARE, AST_SUBTREE_SHARE, AST_WEIGHT, LEXICAL_WEIGHT,
+    STRETCH, STYLE_WEIGHT, fingerprint_all
+)
+
+# The app's evaluation threshold
+DEFAULT_THRESHOLD = 0.4
+
+# Listed pairs cost several times more per pair than the full matrix,
+# even through the cascade, so the join only pays below this share
+MAX_JOIN_SHARE = 0.25
+
+# Posting entries a join may touch, per pair of the full matrix
+MAX_POSTINGS_PER_PAIR = 4
+
+SUBTREE_WEIGHT = AST_WEIGHT * AST_SUBTREE_SHARE
+
+
+# =========================================================
+# ---------------- ORDERED SETS ----------------
+# =========================================================
+
+class OrderedSets:
+    """
+    CSR rows (sets, or weighted vectors) with each row's entries sorted
+    by one global order of increasing document frequency, plus posting
+    lists (document, position in that document) per feature rank.
+    Rare features come first, so prefixes probe short posting lists.
+    """
+
+    def __init__(self, indptr, cols, vocab_size, weights=None):
+        n = len(indptr) - 1
+        df = np.bincount(cols, minlength=vocab_size)
+        order = np.lexsort((np.arange(vocab_size), df))
+        rank_of = np.empty(vocab_size, dtype=np.int64)
+        rank_of[order] = np.arange(vocab_size)
+
+        docs = np.repeat(np.arange(n), np.diff(indptr))
+        ranks = rank_of[cols]
+        perm = np.lexsort((ranks, docs))
+
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.ranks = ranks[perm]
+        self.weights = None if weights is None else weights[perm]
+        self.df = df[order]
+        self.sizes = np.diff(self.indptr)
+
+        positions = np.arange(len(perm)) - self.indptr[docs]
+        by_rank = np.lexsort((docs, self.ranks))
+        self.post_indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.ranks, minlength=vocab_size),
+                  out=self.post_indptr[1:])
+        self.post_docs = docs[by_rank]
+        self.post_pos = positions[by_rank]
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def prefix_cost(self, prefix):
+        """
+        Posting entries touched when every row probes its first
+        `prefix[d]` features
+        """
+        csum = np.zeros(len(self.ranks) + 1, dtype=np.int64)
+        np.cumsum(self.df[self.ranks], out=csum[1:])
+        start = self.indptr[:-1]
+        return int((csum[start + prefix] - csum[start]).sum())
+
+    def probe(self, doc, length):
+        """
+        First hit of every document in the postings of `doc`'s first
+        `length` features: (docs, position in `doc`, position in them).
+        Earlier features of `doc` are probed first, so the first hit is
+        the first shared feature in the global order.
+        """
+        ranks = self.ranks[self.indptr[doc]:self.indptr[doc] + length]
+        offsets, lengths = gather_slices(self.post_indptr, ranks)
+        total = len(offsets)
+        found, first = np.unique(self.post_docs[offsets], return_index=True)
+        own = np.repeat(np.arange(length), lengths)[first]
+        return found, own, self.post_pos[offsets[first]], total
+
+
+# =========================================================
+# ---------------- SUBTREE OVERLAP JOIN ----------------
+# =========================================================
+
+def _overlap_prefix(sets, beta):
+    # With the row as the smaller set, |A n B| >= t = ceil(beta |A|)
+    needed = np.maximum(np.ceil(beta * sets.sizes - BOUND_SLACK), 1)
+    needed = needed.astype(np.int64)
+    return needed, np.clip(sets.sizes - needed + 1, 0, sets.sizes)
+
+
+def overlap_join(sets, beta):
+    """
+    Every pair with |A n B| / min(|A|, |B|) >= beta.
+
+    The smaller set A (ties by index) must share one of its first
+    |A| - t + 1 features with B (prefix filter), B is at least as large
+    (size filter), and after the first shared feature at positions i
+    and j at most 1 + min(|A| - i - 1, |B| - j - 1) can be shared
+    (positional filter). Returns (i, j, postings touched).
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if beta > 1 + BOUND_SLACK:
+        return empty, empty, 0
+
+    needed, prefix = _overlap_prefix(sets, beta)
+    lo, hi, touched = [], [], 0
+    for a in np.flatnonzero(prefix > 0):
+        size = sets.sizes[a]
+        docs, i, j, total = sets.probe(a, prefix[a])
+        touched += total
+
+        larger = (sets.sizes[docs] > size) | (
+            (sets.sizes[docs] == size) & (docs > a)
+        )
+        bound = 1 + np.minimum(size - i - 1, sets.sizes[docs] - j - 1)
+        docs = docs[larger & (bound >= needed[a])]
+        lo.append(np.full(len(docs), a))
+        hi.append(docs)
+
+    if not lo:
+        return empty, empty, touched
+    a, b = np.concatenate(lo), np.concatenate(hi)
+    return np.minimum(a, b), np.maximum(a, b), touched
+
+
+# =========================================================
+# ---------------- COSINE JOIN ----------------
+# =========================================================
+
+def _suffix_sums(sets, values):
+    """
+    Per entry, the sum of `values` from that entry to the end of its row
+    """
+    csum = np.zeros(len(values) + 1)
+    np.cumsum(values, out=csum[1:])
+    ends = np.repeat(sets.indptr[1:], sets.sizes)
+    return csum[ends] - csum[:-1]
+
+
+def _cosine_bounds(sets):
+    """
+    Per entry, a bound on the dot product any unit vector can reach with
+    the rest of the row from that entry on (using the largest weight of
+    every feature, and Cauchy-Schwarz), and the norm of that rest
+    """
+    w = sets.weights
+    max_weight = np.zeros(len(sets.df))
+    np.maximum.at(max_weight, sets.ranks, w)
+    norms = np.sqrt(np.maximum(_suffix_sums(sets, w * w), 0.0))
+    reach = np.minimum(_suffix_sums(sets, w * max_weight[sets.ranks]), norms)
+    return reach, norms
+
+
+def _cosine_prefix(sets, reach, alpha):
+    # reach never increases along a row: the prefix is every entry
+    # whose remainder could still reach alpha
+    docs = np.repeat(np.arange(len(sets)), sets.sizes)
+    return np.bincount(docs[reach >= alpha - BOUND_SLACK], minlength=len(sets))
+
+
+def cosine_join(sets, alpha, bounds=None):
+    """
+    Every pair of unit vectors with dot product >= alpha (AllPairs-style
+    prefix filtering). A vector's prefix ends where the rest of it can
+    no longer reach alpha with any vector, so a qualifying partner
+    shares a prefix feature. After the first shared feature the dot
+    product is at most the product of both remainders' norms
+    (positional filter). Returns (i, j, postings touched).
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if alpha > 1 + BOUND_SLACK:
+        return empty, empty, 0
+
+    reach, norms = bounds if bounds is not None else _cosine_bounds(sets)
+    prefix = _cosine_prefix(sets, reach, alpha)
+    lo, hi, touched = [], [], 0
+    for a in np.flatnonzero(prefix > 0):
+        docs, i, j, total = sets.probe(a, prefix[a])
+        touched += total
+
+        start = sets.indptr[a]
+        bound = norms[start + i] * norms[sets.indptr[docs] + j]
+        docs = docs[(docs > a) & (bound >= alpha - BOUND_SLACK)]
+        lo.append(np.full(len(docs), a))
+        hi.append(docs)
+
+    if not lo:
+        return empty, empty, touched
+    return np.concatenate(lo), np.concatenate(hi), touched
+
+
+# =========================================================
+# ---------------- THRESHOLD JOIN ----------------
+# =========================================================
+
+def linear_threshold(threshold):
+    """
+    final >= threshold  <=>  weighted sum >= threshold ** (1 / STRETCH)
+    """
+    return max(threshold, 0.0) ** (1 / STRETCH)
+
+
+def budget_splits(residual):
+    """
+    (alpha, beta) pairs with LEXICAL_WEIGHT * alpha + SUBTREE_WEIGHT *
+    beta = residual: a pair whose lexical and subtree terms reach the
+    residual must have lex >= alpha or sub >= beta
+    """
+    shares = set(np.round(np.linspace(0.05, 0.95, 19), 2))
+    for cap in (LEXICAL_WEIGHT, SUBTREE_WEIGHT):
+        if 0 < cap / residual < 1:
+            shares.add(cap / residual)
+            shares.add(1 - cap / residual)
+
+    return [
+        (share * residual / LEXICAL_WEIGHT,
+         (1 - share) * residual / SUBTREE_WEIGHT)
+        for share in sorted(shares)
+    ]
+
+
+def threshold_join(corpus, threshold=DEFAULT_THRESHOLD):
+    """
+    Exactly the pairs (i < j) of a PackedCorpus whose final score is >=
+    threshold, with their scores. Returns (i, j, scores, report).
+
+    AST-global and style are at most 1, so a qualifying pair needs
+    LEXICAL_WEIGHT * lex + SUBTREE_WEIGHT * sub >= residual. The
+    residual is split into a lexical cosine threshold and a subtree
+    overlap threshold (whichever split touches the fewest postings),
+    both are joined with prefix filters, and the union goes through
+    the cascade (only pairs it cannot rule out are scored exactly).
+    When the joins would touch too many postings, or leave too many
+    candidates to verify, the whole matrix is scored instead.
+    """
+    n = len(corpus)
+    total = n * (n - 1) // 2
+    residual = (
+        linear_threshold(threshold) - BOUND_SLACK
+        - AST_WEIGHT * AST_GLOBAL_SHARE - STYLE_WEIGHT
+    )
+    report = {
+        "files": n,
+        "pairs": total,
+        "threshold": threshold,
+        "linear_threshold": linear_threshold(threshold),
+    }
+
+    best = None
+    if residual > 0 and n > 1:
+        subtrees = OrderedSets(
+            corpus.subtree_indptr, corpus.subtree_cols,
+            len(corpus.subtree_vocab_heights)
+        )
+        norms = np.repeat(corpus.token_norms, np.diff(corpus.token_indptr))
+        tokens = OrderedSets(
+            corpus.token_indptr, corpus.token_cols, len(corpus.token_vocab),
+            weights=corpus.token_counts / np.where(norms > 0, norms, 1.0)
+        )
+        bounds = _cosine_bounds(tokens)
+
+        for alpha, beta in budget_splits(residual):
+            cost = 0
+            if alpha <= 1 + BOUND_SLACK:
+                cost += tokens.prefix_cost(
+                    _cosine_prefix(tokens, bounds[0], alpha))
+            if beta <= 1 + BOUND_SLACK:
+                cost += subtrees.prefix_cost(
+                    _overlap_prefix(subtrees, beta)[1])
+            if best is None or cost < best[0]:
+                best = (cost, alpha, beta)
+
+    if best is not None and best[0] <= MAX_POSTINGS_PER_PAIR * total:
+        _, alpha, beta = best
+        li, lj, lex_touched = cosine_join(tokens, alpha, bounds)
+        si, sj, sub_touched = overlap_join(subtrees, beta)
+        codes = np.unique(np.concatenate([li * n + lj, si * n + sj]))
+        report.update({
+            "alpha": alpha,
+            "beta": beta,
+            "postings": lex_touched + sub_touched,
+            "candidates_lexical": int(len(li)),
+            "candidates_subtree": int(len(si)),
+        })
+    else:
+        codes = None
+
+    if codes is None or len(codes) > MAX_JOIN_SHARE * total:
+        matrix = score_matrix(corpus)
+        i, j = np.triu_indices(n, k=1)
+        scores = matrix[i, j]
+        keep = scores >= threshold
+        report.update({
+            "mode": "all-pairs", "candidates": total, "verified": total,
+            "results": int(keep.sum()), "verified_fraction": 1.0,
+        })
+        return i[keep], j[keep], scores[keep], report
+
+    cascade = Cascade(corpus, threshold)
+    i, j, scores = cascade.score(codes // n, codes % n)
+    stages = cascade.report()["stages"]
+
+    report.update({
+        "mode": "join",
+        "candidates": int(len(codes)),
+        "verified": stages[-1]["evaluated"],
+        "stages": stages,
+        "results": int(len(i)),
+        "verified_fraction": len(codes) / total if total else 0.0,
+    })
+    return i, j, scores, report
+
+
+def similarity_join(codes, threshold=DEFAULT_THRESHOLD):
+    """
+    {(name_a, name_b): score} of every pair of a {name: code} mapping
+    scoring >= threshold, plus the join report
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    i, j, scores, report = threshold_join(corpus, threshold)
+    names = corpus.names
+    pairs = {
+        tuple(sorted((names[a], names[b]))): float(s)
+        for a, b, s in zip(i, j, scores)
+    }
+    return pairs, report
+
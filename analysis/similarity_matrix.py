@@ -1,18 +1,9 @@
-import pandas as pd
-import numpy as np
-from model.similarity_model import final_similarity
+from analysis.checkpoint import checkpointed_similarity_matrix
+from analysis.parallel_matrix import parallel_similarity_matrix
 
-def compute_similarity_matrix(files):
-    names = list(files.keys())
-    n = len(names)
-    matrix = np.zeros((n, n))
-
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                matrix[i][j] = 1.0
-            else:
-                *_, score = final_similarity(files[names[i]], files[names[j]])
-                matrix[i][j] = score
-
-    return pd.DataFrame(matrix, index=names, columns=names)
+def compute_similarity_matrix(files, workers=1, checkpoint_dir=None):
+    if checkpoint_dir is not None:
+        return checkpointed_similarity_matrix(
+            files, checkpoint_dir, workers=workers
+        )
+    return parallel_similarity_matrix(files, workers=workers)
@@ -0,0 +1,280 @@
+import math
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from analysis.lsh_candidates import splitmix64
+from analysis.matrix_engine import fuse, pair_components
+from model.corpus import pack_fingerprints
+from model.similarity_model import (
+    AST_GLOBAL_SHARE, AST_SUBTREE_SHARE, fingerprint_all
+)
+
+SKETCH_DIMS = 512
+BOTTOM_K = 256
+DEFAULT_DELTA = 0.05
+BLOCK = 256
+_PROJECTION_CHUNK = 8192
+
+
+# =========================================================
+# ---------------- ERROR BOUNDS ----------------
+# =========================================================
+
+def cosine_epsilon(dims, delta):
+    """
+    Johnson-Lindenstrauss for +/-1 projections (Achlioptas): norms of
+    u + v and u - v are kept within (1 +/- eps) except with probability
+    2 exp(-dims (eps^2 / 2 - eps^3 / 3) / 2) each, which bounds the
+    estimated cosine of unit vectors within +/- eps. Solved for eps.
+    """
+    target = 2 * math.log(4 / delta) / dims
+    lo, hi = 0.0, 1.5
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if mid * mid / 2 - mid ** 3 / 3 < target:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def containment_epsilon(sampled, size, delta):
+    """
+    Hoeffding-Serfling bound for a fraction estimated from `sampled` of
+    `size` items drawn without replacement: 0 when the whole set was
+    seen, 1 when nothing was
+    """
+    sampled = np.asarray(sampled, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    eps = np.ones(np.broadcast(sampled, size).shape)
+    drawn = sampled > 0
+    m = np.where(drawn, sampled, 1.0)
+    n = np.maximum(size, 1.0)
+    np.sqrt((1 - (m - 1) / n) * math.log(2 / delta) / (2 * m),
+            out=eps, where=drawn)
+    eps[sampled >= size] = 0.0
+    return np.minimum(eps, 1.0)
+
+
+# =========================================================
+# ---------------- SKETCHES ----------------
+# =========================================================
+
+def _signs(token_vocab, dims):
+    """
+    +/-1 projection rows for the given token IDs, derived from a hash of
+    (token, dimension) so sketches of different corpora agree
+    """
+    keys = (token_vocab.astype(np.int64).astype(np.uint64)[:, None] *
+            np.uint64(dims) + np.arange(dims, dtype=np.uint64)[None, :])
+    bits = splitmix64(keys) >> np.uint64(63)
+    return np.where(bits == 1, 1.0, -1.0).astype(np.float32)
+
+
+def bottom_k(indptr, values, k, seed=0):
+    """
+    Bottom-k sketches of the sets stored CSR-style: the k smallest
+    hashes of each set, sorted, as (indptr, hashes). `thresholds[d]` is
+    the largest hash set d's sketch speaks for (the k-th smallest, or
+    the maximum when the whole set fits).
+    """
+    n = len(indptr) - 1
+    sizes = np.diff(indptr)
+    docs = np.repeat(np.arange(n), sizes)
+    hashed = splitmix64(np.asarray(values).astype(np.uint64) ^
+                        splitmix64(np.uint64(seed)))
+
+    order = np.lexsort((hashed, docs))
+    hashed, docs = hashed[order], docs[order]
+    rank = np.arange(len(docs)) - indptr[docs]
+    keep = rank < k
+
+    kept = np.minimum(sizes, k)
+    out_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(kept, out=out_indptr[1:])
+    hashes = hashed[keep]
+
+    thresholds = np.full(n, np.iinfo(np.uint64).max, dtype=np.uint64)
+    full = np.flatnonzero(sizes > k)
+    thresholds[full] = hashes[out_indptr[full + 1] - 1]
+    return out_indptr, hashes, thresholds
+
+
+class Sketches:
+    """
+    Fixed-size per-file summaries of a PackedCorpus:
+
+    - lexical: token counts projected to `dims` random +/-1 directions,
+      scaled so dot products estimate the cosine
+    - ast: the unit node-type vector (already small and fixed-size)
+    - bottom-k sketch of the subtree set, plus the exact set sizes
+    - entropy, for the (exact) style term
+    """
+
+    def __init__(self, corpus, dims=SKETCH_DIMS, k=BOTTOM_K):
+        self.names = list(corpus.names)
+        self.dims = dims
+        self.k = k
+
+        tokens = corpus.token_matrix()
+        lexical = np.zeros((len(corpus), dims), dtype=np.float32)
+        for start in range(0, tokens.shape[1], _PROJECTION_CHUNK):
+            stop = start + _PROJECTION_CHUNK
+            lexical += tokens[:, start:stop] @ _signs(
+                corpus.token_vocab[start:stop], dims
+            )
+        scale = corpus.token_norms * math.sqrt(dims)
+        self.lexical = np.divide(
+            lexical, scale[:, None], out=np.zeros_like(lexical),
+            where=scale[:, None] > 0
+        ).astype(np.float32)
+
+        norms = corpus.ast_norms[:, None]
+        self.ast = np.divide(
+            corpus.ast_counts, norms, out=np.zeros(corpus.ast_counts.shape),
+            where=norms > 0
+        ).astype(np.float32)
+
+        self.indptr, self.hashes, self.thresholds = bottom_k(
+            corpus.subtree_indptr,
+            corpus.subtree_vocab[corpus.subtree_cols], k
+        )
+        self.sizes = corpus.subtree_sizes()
+        self.entropy = np.asarray(corpus.entropy, dtype=np.float64)
+
+        # One-hot (file x hash) indicators: sketch intersections are one
+        # sparse product
+        self._unique, columns = np.unique(self.hashes, return_inverse=True)
+        columns = columns.ravel()
+        self._onehot = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), columns, self.indptr),
+            shape=(len(self), int(columns.max()) + 1 if len(columns) else 1)
+        )
+
+        # Every sketch entry as one sorted int64 key: file * stride + the
+        # hash's rank among all sketched hashes
+        self._stride = len(self._unique) + 1
+        docs = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        self._keys = docs * self._stride + columns
+
+    def __len__(self):
+        return len(self.names)
+
+    def sampled(self, docs, against):
+        """
+        (len(docs), len(against)) count of each sketch entry of `docs`
+        at or below the threshold of each file in `against`
+        """
+        docs = np.asarray(docs)
+        # Rank of the largest sketched hash at or below each threshold
+        limits = np.searchsorted(self._unique, self.thresholds[against],
+                                 side="right") - 1
+        queries = docs[:, None] * self._stride + limits[None, :]
+        found = np.searchsorted(self._keys, queries, side="right")
+        return found - self.indptr[docs][:, None]
+
+    def subtree_overlap(self, rows, delta):
+        """
+        Estimated |A n B| / min(|A|, |B|) of `rows` against every file,
+        with a per-pair error bound.
+
+        Hashes at or below both thresholds are a uniform sample of the
+        smaller set that both sketches cover, so the fraction of those
+        also in the larger set's sketch estimates its containment;
+        exact whenever the smaller set is sampled completely.
+        """
+        everyone = np.arange(len(self))
+        shared = (self._onehot[rows] @ self._onehot.T).toarray()
+        forward = self.sampled(rows, everyone)
+        backward = self.sampled(everyone, rows).T
+
+        row_sizes = self.sizes[rows][:, None]
+        smaller_is_row = row_sizes <= self.sizes[None, :]
+        sampled = np.where(smaller_is_row, forward, backward)
+        size = np.minimum(row_sizes, self.sizes[None, :])
+
+        estimate = np.zeros(shared.shape)
+        np.divide(shared, sampled, out=estimate, where=sampled > 0)
+        eps = containment_epsilon(sampled, size, delta)
+        eps[size == 0] = 0.0
+        return np.clip(estimate, 0.0, 1.0), eps
+
+
+# =========================================================
+# ---------------- APPROXIMATE MATRIX ----------------
+# =========================================================
+
+def approximate_matrix(sketches, delta=DEFAULT_DELTA, block=BLOCK):
+    """
+    Final scores of every pair computed from sketches only, with bounds.
+
+    Returns {"final", "lower", "upper", "epsilon"}: each true score lies
+    in [lower, upper] with probability >= 1 - delta (delta split evenly
+    between the lexical and subtree estimates; AST-global and style are
+    exact). Bounds come from the per-component error bounds pushed
+    through the monotone fuse(). Rows are filled `block` at a time.
+    """
+    n = len(sketches)
+    eps_cos = cosine_epsilon(sketches.dims, delta / 2)
+    out = {key: np.empty((n, n), dtype=np.float32)
+           for key in ("final", "lower", "upper")}
+
+    for start in range(0, n, block):
+        rows = np.arange(start, min(start + block, n))
+        lex = np.clip(sketches.lexical[rows] @ sketches.lexical.T, 0.0, 1.0)
+        ast_global = np.clip(sketches.ast[rows] @ sketches.ast.T, 0.0, 1.0)
+        style = 1 / (1 + np.abs(np.subtract.outer(
+            sketches.entropy[rows], sketches.entropy
+        )))
+        sub, eps_sub = sketches.subtree_overlap(rows, delta / 2)
+
+        def final(lex, sub):
+            hybrid = AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * sub
+            return fuse(lex, hybrid, style)
+
+        out["final"][rows] = final(lex, sub)
+        out["lower"][rows] = final(np.clip(lex - eps_cos, 0, 1),
+                                   np.clip(sub - eps_sub, 0, 1))
+        out["upper"][rows] = final(np.clip(lex + eps_cos, 0, 1),
+                                   np.clip(sub + eps_sub, 0, 1))
+
+    for key in ("final", "lower", "upper"):
+        np.fill_diagonal(out[key], 1.0)
+    out["epsilon"] = {"lexical": eps_cos, "delta": delta}
+    return out
+
+
+def approximate_similarity(codes, dims=SKETCH_DIMS, k=BOTTOM_K,
+                           delta=DEFAULT_DELTA):
+    """
+    Sketch-based overview of a {name: code} mapping.
+    Returns (final score DataFrame, approximate_matrix output, corpus).
+    """
+    corpus = pack_fingerprints(fingerprint_all(codes))
+    approx = approximate_matrix(Sketches(corpus, dims, k), delta)
+    df = pd.DataFrame(approx["final"], index=corpus.names,
+                      columns=corpus.names)
+    return df, approx, corpus
+
+
+# =========================================================
+# ---------------- EXACT RESCORING ----------------
+# =========================================================
+
+def rescore_above(corpus, approx, threshold):
+    """
+    Exact scores for every pair whose upper bound reaches `threshold`,
+    so (with the stated confidence) no pair truly above it is missed.
+    Returns {(name_a, name_b): score}.
+    """
+    rows, cols = np.nonzero(np.triu(approx["upper"] >= threshold, k=1))
+
+    scores = pair_components(corpus, rows, cols)["final"]
+    names = corpus.names
+    return {
+        tuple(sorted((names[a], names[b]))): float(s)
+        for a, b, s in zip(rows, cols, scores)
+    }
+
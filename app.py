@@ -1,13 +1,28 @@
-import streamlit as st
-import numpy as np
+import os
+
 import pandas as pd
+import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 from model.similarity_model import final_similarity
+from analysis.matrix_engine import pair_scores
+from analysis.archive_index import ArchiveIndex
+from analysis.pipeline import streamed_similarity_matrix
+from analysis.anytime import anytime_scores
+from analysis.partitioned_matrix import (
+    DEFAULT_PATTERN, partitioned_scores, pattern_groups, manifest_groups,
+    load_manifest
+)
+from analysis.bipartite import bipartite_similarity
 from analysis.clustering_analysis import perform_clustering
 from analysis.evaluation_metrics import evaluate_system
 from analysis.roc_analysis import roc_curve_data, plot_roc_curve
+from model.corpus import pack_fingerprints
+from model.similarity_model import fingerprint_all
+from model.fingerprint_cache import (
+    CACHE_ENV, default_cache, set_default_cache
+)
 
 
 # =========================================================
@@ -18,6 +33,25 @@ st.set_page_config(
     layout="wide"
 )
 
+# =========================================================
+# FINGERPRINT CACHE
+# =========================================================
+# Opt-in ($PLAGIARISM_FINGERPRINT_CACHE or the sidebar toggle): once on,
+# re-uploaded, starter and archived files are parsed only once
+if "cache_path" not in st.session_state:
+    st.session_state.cache_path = os.environ.get(CACHE_ENV)
+
+if st.sidebar.toggle(
+    "💾 Cache fingerprints on disk",
+    value=st.session_state.cache_path is not None
+):
+    fingerprint_cache = default_cache() or set_default_cache(
+        st.session_state.cache_path
+        or os.path.join(".cache", "fingerprints.sqlite")
+    )
+else:
+    fingerprint_cache = set_default_cache(None)
+
 # =========================================================
 # HEADER
 # =========================================================
@@ -30,15 +64,28 @@ Hybrid plagiarism detection using
 # =========================================================
 # SESSION STATE
 # =========================================================
-if "codes_dict" not in st.session_state:
-    st.session_state.codes_dict = None
-
 if "sim_df" not in st.session_state:
     st.session_state.sim_df = None
 
 if "sim_scores" not in st.session_state:
     st.session_state.sim_scores = None
 
+if "sim_groups" not in st.session_state:
+    st.session_state.sim_groups = None
+
+
+# =========================================================
+# UPLOADS
+# =========================================================
+def uploaded_codes(files):
+    # {name: code}; duplicate names keep their first submission
+    codes = {}
+    for f in files:
+        codes.setdefault(
+            f.name, f.getvalue().decode("utf-8", errors="ignore")
+        )
+    return codes
+
 
 # =========================================================
 # PAIRWISE COMPARISON
@@ -68,6 +115,104 @@ if pair_files and len(pair_files) == 2:
         c3.metric("Final Score", round(score, 3))
 
 
+# =========================================================
+# ARCHIVE CHECK
+# =========================================================
+st.divider()
+st.header("🗄 Check Against Archive")
+
+
+@st.cache_resource
+def load_archive(path):
+    # Memory-mapped; cached across reruns
+    return ArchiveIndex.load(path)
+
+
+archive_path = st.text_input(
+    "Archive index (build with `python -m analysis.archive_index build`)",
+    os.environ.get("PLAGIARISM_ARCHIVE_INDEX", "data/archive.snap")
+)
+
+archive_file = st.file_uploader(
+    "Upload ONE Python (.py) file to check",
+    type=["py"],
+    key="archive_file"
+)
+
+if archive_file and st.button("Search Archive"):
+    if not os.path.exists(archive_path):
+        st.error(f"No archive index at {archive_path}")
+    else:
+        try:
+            archive = load_archive(archive_path)
+        except ValueError as e:
+            # Built under another Python; its features would not match
+            st.error(str(e))
+            archive = None
+
+        if archive is not None:
+            top = archive.query(
+                archive_file.read().decode("utf-8", errors="ignore")
+            )
+            st.caption(
+                f"{top.attrs['scored']} of {len(archive)} archived files "
+                f"needed full scoring"
+            )
+            st.dataframe(top.round(3), width="stretch")
+
+
+# =========================================================
+# COHORT COMPARISON
+# =========================================================
+st.divider()
+st.header("🆚 Compare Two Cohorts")
+
+cohort_a_files = st.file_uploader(
+    "Cohort A: new submissions (.py)",
+    type=["py"],
+    accept_multiple_files=True,
+    key="cohort_a"
+)
+
+cohort_b_files = st.file_uploader(
+    "Cohort B: past submissions or known solutions (.py)",
+    type=["py"],
+    accept_multiple_files=True,
+    key="cohort_b"
+)
+
+cohort_top_k = st.number_input("Top pairs to show", 1, 500, 20)
+
+if cohort_a_files and cohort_b_files and st.button("Compare Cohorts"):
+    # Only the A x B block is scored; A x A and B x B are skipped
+    with st.spinner("Scoring cohort A against cohort B..."):
+        result = bipartite_similarity(
+            uploaded_codes(cohort_a_files),
+            uploaded_codes(cohort_b_files),
+            top_k=int(cohort_top_k)
+        )
+
+    report = result["report"]
+    st.caption(
+        f"{report['files_a']} x {report['files_b']} files: "
+        f"{report['pairs']} pairs ({report['work_fraction']:.0%} of an "
+        f"all-pairs run)"
+    )
+
+    st.subheader("Top Pairs")
+    st.dataframe(
+        pd.DataFrame(result["top"], columns=["cohort_a", "cohort_b", "score"])
+        .round(3),
+        width="stretch"
+    )
+
+    st.subheader("Closest Match per Cohort A File")
+    st.dataframe(result["best"].round(3), width="stretch")
+
+    st.subheader("Cross Matrix")
+    st.dataframe(result["matrix"].round(3), width="stretch")
+
+
 # =========================================================
 # MULTI FILE ANALYSIS
 # =========================================================
@@ -80,40 +225,127 @@ multi_files = st.file_uploader(
     accept_multiple_files=True
 )
 
-if multi_files and len(multi_files) >= 2:
-    if st.button("Generate Similarity Matrix"):
-
-        st.session_state.codes_dict = {
-            f.name: f.read().decode("utf-8", errors="ignore")
-            for f in multi_files
-        }
-
-        files = list(st.session_state.codes_dict.keys())
-        codes = list(st.session_state.codes_dict.values())
-        n = len(files)
-
-        sim_matrix = np.zeros((n, n))
-        scores = {}
+first_look_budget = st.slider(
+    "⏱ First-look time budget in seconds (0 = skip)",
+    0, 30, 0
+)
 
-        with st.spinner("Computing similarity scores (one-time)..."):
-            for i in range(n):
-                for j in range(i + 1, n):
-                    sim = final_similarity(codes[i], codes[j])[-1]
+# Different assignments are never compared unless asked for
+grouping = st.selectbox(
+    "🗂 Compare",
+    ["All pairs", "Within assignment (filename pattern)",
+     "Within assignment (manifest)"]
+)
 
-                    key = tuple(sorted([files[i], files[j]]))
-                    scores[key] = sim
+if grouping == "Within assignment (filename pattern)":
+    group_pattern = st.text_input(
+        "Assignment pattern (first capture group names the assignment)",
+        DEFAULT_PATTERN
+    )
+elif grouping == "Within assignment (manifest)":
+    manifest_file = st.file_uploader(
+        "Manifest: CSV with file,group columns or JSON {file: group}",
+        type=["csv", "json"],
+        key="manifest_file"
+    )
 
-                    sim_matrix[i][j] = sim
-                    sim_matrix[j][i] = sim
+if grouping != "All pairs":
+    cross_samples = st.number_input(
+        "Cross-assignment check: files sampled per other assignment "
+        "(0 = off)",
+        0, 20, 3
+    )
 
-                sim_matrix[i][i] = 1.0
+if multi_files and len(multi_files) >= 2:
+    if st.button("Generate Similarity Matrix"):
 
-        st.session_state.sim_df = pd.DataFrame(
-            sim_matrix, index=files, columns=files
+        # ---------------- FIRST LOOK ----------------
+        # Most suspicious pairs within the budget, before the full matrix
+        if first_look_budget:
+            st.subheader("⏱ First Look: Most Suspicious Pairs")
+            status = st.empty()
+            table = st.empty()
+
+            codes = uploaded_codes(multi_files)
+
+            for snapshot in anytime_scores(codes, first_look_budget):
+                if snapshot["phase"] == "fingerprints":
+                    status.caption(
+                        f"Fingerprinting: {snapshot['fingerprinted']} of "
+                        f"{len(codes)} files"
+                    )
+                    continue
+
+                status.caption(
+                    f"{snapshot['phase']} after {snapshot['elapsed']:.1f}s: "
+                    f"{snapshot['scored']} of {snapshot['pairs']} pairs "
+                    f"scored exactly, top pairs "
+                    f"{snapshot['completeness']:.0%} complete"
+                )
+                table.dataframe(snapshot["top"].round(3), width="stretch")
+
+        if grouping == "All pairs":
+            # Uploads are read lazily, one at a time, by the pipeline
+            sources = [(f.name, f.read) for f in multi_files]
+            bar = st.progress(0.0)
+
+            with st.spinner("Computing similarity scores (one-time)..."):
+                df = streamed_similarity_matrix(
+                    sources,
+                    progress=lambda done: bar.progress(done / len(sources))
+                )
+            bar.empty()
+            groups = None
+        else:
+            # ---------------- PARTITIONED ----------------
+            codes = uploaded_codes(multi_files)
+
+            with st.spinner("Computing within-assignment scores..."):
+                corpus = pack_fingerprints(fingerprint_all(codes))
+                if grouping == "Within assignment (manifest)":
+                    manifest = {}
+                    if manifest_file is not None:
+                        manifest = load_manifest(manifest_file)
+                    labels = manifest_groups(corpus.names, manifest)
+                else:
+                    labels = pattern_groups(corpus.names, group_pattern)
+                result = partitioned_scores(
+                    corpus, labels, cross_samples=int(cross_samples)
+                )
+
+            report = result["report"]
+            st.caption(
+                f"{report['groups']} assignments: {report['pairs_within']} "
+                f"within + {report['pairs_cross_sampled']} sampled "
+                f"cross-assignment pairs of {report['pairs']} "
+                f"({report['work_fraction']:.0%} of the work); pairs never "
+                f"compared are left blank and are not evaluated"
+            )
+            for group, pairs in result["top_pairs"].items():
+                if pairs:
+                    a, b, score = pairs[0]
+                    st.caption(f"{group}: top pair {a} / {b} ({score:.3f})")
+
+            if len(result["cross_check"]):
+                st.warning("Possibly misfiled: high cross-assignment scores")
+                st.dataframe(result["cross_check"].round(3), width="stretch")
+
+            df = result["combined"]
+            groups = result["groups"]
+
+        if fingerprint_cache is not None:
+            stats = fingerprint_cache.stats()
+            st.caption(
+                f"Fingerprint cache: {stats['hits']} hits, "
+                f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)"
+            )
+
+        st.session_state.sim_df = df
+        st.session_state.sim_groups = groups
+        st.session_state.sim_scores = pair_scores(
+            df.values, list(df.index)
         )
 
-        st.session_state.sim_scores = scores
-
 
 # =========================================================
 # DISPLAY RESULTS
@@ -138,13 +370,23 @@ if st.session_state.sim_df is not None:
         0.05, 0.6, 0.3, 0.05
     )
 
-    clusters, dendro_fig = perform_clustering(df, cluster_threshold)
+    # A partitioned run never compares most cross-assignment pairs, so
+    # each assignment's fully scored block is clustered on its own
+    blocks = st.session_state.sim_groups or {None: df}
+
+    for group, block in blocks.items():
+        if len(block) < 2:
+            continue
+        if group is not None:
+            st.markdown(f"**{group}**")
+
+        clusters, dendro_fig = perform_clustering(block, cluster_threshold)
 
-    for cid, members in clusters.items():
-        if len(members) > 1:
-            st.warning(f"Cluster {cid}: {', '.join(members)}")
+        for cid, members in clusters.items():
+            if len(members) > 1:
+                st.warning(f"Cluster {cid}: {', '.join(members)}")
 
-    st.pyplot(dendro_fig)
+        st.pyplot(dendro_fig)
 
     # =================================================
     # EVALUATION METRICS (FAST)
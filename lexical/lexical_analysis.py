@@ -1,17 +1,33 @@
 import math
+import os
 import re
-from collections import Counter
+import time
+import zlib
+
+import numpy as np
 
 # ---------------------------------
 # Tokenization
 # ---------------------------------
 
+TOKEN_PATTERN = re.compile(
+    r"[A-Za-z_][A-Za-z_0-9]*|\d+|==|!=|<=|>=|[+\-*/%<>]"
+)
+
+KEYWORDS = {
+    "def", "return", "if", "elif", "else", "while", "for",
+    "in", "and", "or", "not", "break", "continue", "class",
+    "import", "from", "as", "with", "try", "except", "finally",
+    "pass", "raise", "yield", "lambda"
+}
+
+OPERATORS = ("==", "!=", "<=", ">=", "+", "-", "*", "/", "%", "<", ">")
+
 def tokenize(code: str):
     """
     Split code into identifiers, numbers, and operators
     """
-    pattern = r"[A-Za-z_][A-Za-z_0-9]*|\d+|==|!=|<=|>=|[+\-*/%<>]"
-    return re.findall(pattern, code)
+    return TOKEN_PATTERN.findall(code)
 
 
 # ---------------------------------
@@ -22,17 +38,12 @@ def normalize_identifiers(tokens):
     """
     Replace variable names with generic placeholders
     """
-    keywords = {
-        "def", "return", "if", "elif", "else", "while", "for",
-        "in", "and", "or", "not", "break", "continue", "class"
-    }
-
     mapping = {}
     normalized = []
     counter = 0
 
     for token in tokens:
-        if token.isidentifier() and token not in keywords:
+        if token.isidentifier() and token not in KEYWORDS:
             if token not in mapping:
                 counter += 1
                 mapping[token] = f"VAR_{counter}"
@@ -44,34 +55,136 @@ def normalize_identifiers(tokens):
 
 
 # ---------------------------------
-# Vectorization
+# Interned Token IDs
 # ---------------------------------
+#
+# Every normalized token maps to a fixed int32, so IDs agree across
+# files, processes and runs without sharing a vocabulary object:
+#   operators and keywords  -> 0 .. 63
+#   VAR_k                   -> VAR_BASE + k
+#   decimal literals        -> NUMBER_BASE + value (up to 9 digits)
+#   other digit runs        -> negative CRC32 (leading zeros, > 9 digits,
+#                              non-ASCII digits)
+
+STATIC_IDS = {
+    token: i for i, token in enumerate(OPERATORS + tuple(sorted(KEYWORDS)))
+}
+VAR_BASE = 64
+
+# lexical_similarity keeps the keyword set it has always used, so its
+# scores are unchanged; fingerprints use the larger KEYWORDS
+SIMILARITY_KEYWORDS = {
+    "def", "return", "if", "elif", "else", "while", "for",
+    "in", "and", "or", "not", "break", "continue", "class"
+}
+SIMILARITY_IDS = {
+    token: STATIC_IDS[token]
+    for token in OPERATORS + tuple(sorted(SIMILARITY_KEYWORDS))
+}
+NUMBER_BASE = 1 << 30
+
+def token_id(token: str) -> int:
+    """
+    ID of an already-normalized token ("VAR_3", "while", "42", "<=")
+    """
+    tid = STATIC_IDS.get(token)
+    if tid is not None:
+        return tid
+    if token.startswith("VAR_"):
+        return VAR_BASE + int(token[4:])
+    return _number_id(token)
+
+def _number_id(digits: str) -> int:
+    if (len(digits) <= 9 and digits.isascii()
+            and (digits[0] != "0" or digits == "0")):
+        return NUMBER_BASE + int(digits)
+    return -1 - (zlib.crc32(digits.encode("utf-8")) & 0x7FFFFFFF)
+
+def token_ids(code: str, static=STATIC_IDS):
+    """
+    Tokenize and normalize identifiers in one pass, emitting int32 IDs
+    (same tokens as normalize_identifiers(tokenize(code))). Identifiers
+    missing from `static` become VAR_k.
+    """
+    mapping = {}
+    ids = []
+
+    for token in TOKEN_PATTERN.findall(code):
+        tid = static.get(token)
+        if tid is None:
+            tid = mapping.get(token)
+            if tid is None:
+                if token[0].isdigit():
+                    tid = _number_id(token)
+                else:
+                    tid = mapping[token] = VAR_BASE + len(mapping) + 1
+        ids.append(tid)
 
-def token_vector(tokens):
-    freq = Counter(tokens)
-    total = sum(freq.values())
+    return np.array(ids, dtype=np.int32)
 
-    if total == 0:
-        return {}
 
-    return {k: v / total for k, v in freq.items()}
+class TokenCounts:
+    """
+    Sparse token count vector: sorted int32 IDs, counts and L2 norm
+    """
 
+    def __init__(self, ids, counts):
+        self.ids = ids
+        self.counts = counts
+        self.norm = math.sqrt(int(np.dot(counts, counts)))
 
-# ---------------------------------
-# Cosine Similarity
-# ---------------------------------
+    def __len__(self):
+        return len(self.ids)
 
-def cosine_similarity(v1, v2):
-    common = set(v1.keys()) & set(v2.keys())
-    numerator = sum(v1[k] * v2[k] for k in common)
 
-    denom1 = math.sqrt(sum(v ** 2 for v in v1.values()))
-    denom2 = math.sqrt(sum(v ** 2 for v in v2.values()))
+def token_counts(code: str, static=STATIC_IDS) -> TokenCounts:
+    ids, counts = np.unique(token_ids(code, static), return_counts=True)
+    return TokenCounts(ids.astype(np.int32), counts.astype(np.int64))
 
-    if denom1 == 0 or denom2 == 0:
+def count_cosine(a: TokenCounts, b: TokenCounts) -> float:
+    """
+    Cosine of two count vectors as an integer sparse dot product
+    """
+    if a.norm == 0 or b.norm == 0:
         return 0.0
 
-    return numerator / (denom1 * denom2)
+    _, ia, ib = np.intersect1d(
+        a.ids, b.ids, assume_unique=True, return_indices=True
+    )
+    return int(np.dot(a.counts[ia], b.counts[ib])) / (a.norm * b.norm)
+
+
+# ---------------------------------
+# Directory Tokenization
+# ---------------------------------
+
+def tokenize_directory(root: str):
+    """
+    Token counts for every .py file under `root`, plus throughput
+    """
+    results = {}
+    total_bytes = 0
+    start = time.perf_counter()
+
+    for dirpath, _, filenames in os.walk(root):
+        for fname in sorted(filenames):
+            if not fname.endswith(".py"):
+                continue
+
+            with open(os.path.join(dirpath, fname), "rb") as f:
+                raw = f.read()
+
+            total_bytes += len(raw)
+            results[fname] = token_counts(raw.decode("utf-8", errors="ignore"))
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "files": len(results),
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "mb_per_s": total_bytes / 1e6 / seconds if seconds else 0.0,
+    }
+    return results, stats
 
 
 # ---------------------------------
@@ -82,10 +195,11 @@ def lexical_similarity(code1: str, code2: str) -> float:
     """
     Compute lexical similarity between two code strings
     """
-    t1 = normalize_identifiers(tokenize(code1))
-    t2 = normalize_identifiers(tokenize(code2))
+    return count_cosine(token_counts(code1, SIMILARITY_IDS),
+                        token_counts(code2, SIMILARITY_IDS))
 
-    v1 = token_vector(t1)
-    v2 = token_vector(t2)
 
-    return cosine_similarity(v1, v2)
+if __name__ == "__main__":
+    _, stats = tokenize_directory(os.path.join("data", "submissions"))
+    print(f"📁 Files: {stats['files']} ({stats['bytes'] / 1e6:.2f} MB)")
+    print(f"⚡ Throughput: {stats['mb_per_s']:.2f} MB/s")
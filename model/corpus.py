@@ -0,0 +1,396 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from syntactic.ast_features import AST_SCHEMA, NODE_TYPES
+from syntactic.subtree_ids import SubtreeDictionary
+
+# Guards score bounds and filters against rounding (a cosine can land on
+# 1 + ulp), so nothing that qualifies is ever pruned
+BOUND_SLACK = 1e-9
+
+
+# =========================================================
+# ---------------- PACKED CORPUS ----------------
+# =========================================================
+
+class PackedCorpus:
+    """
+    Fingerprints of many submissions packed into flat arrays:
+
+    - token counts as CSR rows over a corpus token vocabulary
+    - node-type counts as a dense (n, len(NODE_TYPES)) matrix
+    - subtree fingerprints as CSR rows of dense subtree IDs
+
+    Row subsets (see `rows`) keep the vocabularies, so blocks cut from
+    one corpus can be multiplied against each other directly.
+    """
+
+    ARRAYS = (
+        "token_indptr", "token_cols", "token_counts", "token_vocab",
+        "token_norms", "ast_counts", "ast_norms",
+        "subtree_indptr", "subtree_cols", "subtree_vocab",
+        "subtree_vocab_heights", "entropy",
+    )
+
+    def __init__(self, names, **arrays):
+        self.names = list(names)
+        for key in self.ARRAYS:
+            setattr(self, key, arrays[key])
+
+    def __len__(self):
+        return len(self.names)
+
+    # ---------- sparse / dense views ----------
+
+    def token_matrix(self):
+        return sparse.csr_matrix(
+            (self.token_counts, self.token_cols, self.token_indptr),
+            shape=(len(self), len(self.token_vocab))
+        )
+
+    def subtree_matrix(self):
+        return sparse.csr_matrix(
+            (np.ones(len(self.subtree_cols)), self.subtree_cols,
+             self.subtree_indptr),
+            shape=(len(self), len(self.subtree_vocab))
+        )
+
+    def subtree_sizes(self):
+        return np.diff(self.subtree_indptr)
+
+    def node_counts(self):
+        """
+        AST nodes per file (MAX_DEPTH excluded)
+        """
+        return self.ast_counts[:, :-1].sum(axis=1)
+
+    # ---------- subsets ----------
+
+    def rows(self, index):
+        """
+        Corpus restricted to the given row indices (vocabularies shared)
+        """
+        index = np.asarray(index, dtype=np.int64)
+        tokens = self.token_matrix()[index]
+        subtrees = self.subtree_matrix()[index]
+
+        return PackedCorpus(
+            [self.names[i] for i in index],
+            token_indptr=tokens.indptr.astype(np.int64),
+            token_cols=tokens.indices.astype(np.int32),
+            token_counts=tokens.data,
+            token_vocab=self.token_vocab,
+            token_norms=self.token_norms[index],
+            ast_counts=self.ast_counts[index],
+            ast_norms=self.ast_norms[index],
+            subtree_indptr=subtrees.indptr.astype(np.int64),
+            subtree_cols=subtrees.indices.astype(np.int32),
+            subtree_vocab=self.subtree_vocab,
+            subtree_vocab_heights=self.subtree_vocab_heights,
+            entropy=self.entropy[index],
+        )
+
+
+def gather_slices(indptr, rows):
+    """
+    Positions of the listed CSR rows' entries, concatenated in order
+    without a Python loop, and each row's length
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(len(offsets)), lengths
+
+
+def _csr_parts(arrays, encode):
+    indptr = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=indptr[1:])
+    cols = (
+        np.concatenate([encode(a) for a in arrays]).astype(np.int32)
+        if arrays else np.empty(0, dtype=np.int32)
+    )
+    return indptr, cols
+
+
+def pack_fingerprints(fingerprints):
+    """
+    Pack a {name: Fingerprint} mapping, preserving its order
+    """
+    names = list(fingerprints)
+    fps = list(fingerprints.values())
+
+    # ----- Tokens -----
+    token_ids = [fp.tokens.ids for fp in fps]
+    token_vocab = (
+        np.unique(np.concatenate(token_ids)) if fps
+        else np.empty(0, dtype=np.int32)
+    )
+    token_indptr, token_cols = _csr_parts(
+        token_ids, lambda ids: np.searchsorted(token_vocab, ids)
+    )
+    token_counts = (
+        np.concatenate([fp.tokens.counts for fp in fps]).astype(np.float64)
+        if fps else np.empty(0)
+    )
+
+    # ----- Subtrees -----
+    arrays = [fp.subtrees for fp in fps]
+    dictionary = SubtreeDictionary(arrays)
+    subtree_indptr, subtree_cols = _csr_parts(arrays, dictionary.encode)
+
+    vocab_heights = np.zeros(len(dictionary), dtype=np.uint16)
+    for fp, start, stop in zip(fps, subtree_indptr[:-1], subtree_indptr[1:]):
+        vocab_heights[subtree_cols[start:stop]] = fp.subtree_heights
+
+    return PackedCorpus(
+        names,
+        token_indptr=token_indptr,
+        token_cols=token_cols,
+        token_counts=token_counts,
+        token_vocab=token_vocab.astype(np.int32),
+        token_norms=np.array([fp.tokens.norm for fp in fps], dtype=np.float64),
+        ast_counts=(
+            np.vstack([fp.ast_counts for fp in fps]) if fps
+            else np.empty((0, len(NODE_TYPES)))
+        ),
+        ast_norms=np.array([fp.ast_norm for fp in fps], dtype=np.float64),
+        subtree_indptr=subtree_indptr,
+        subtree_cols=subtree_cols,
+        subtree_vocab=dictionary.keys,
+        subtree_vocab_heights=vocab_heights,
+        entropy=np.array([fp.entropy for fp in fps], dtype=np.float64),
+    )
+
+
+# =========================================================
+# ---------------- INCREMENTAL PACKING ----------------
+# =========================================================
+
+class _Growable:
+    """
+    Array appended to in place; the buffer doubles when full
+    """
+
+    def __init__(self, dtype, width=None):
+        shape = (64,) if width is None else (64, width)
+        self._data = np.empty(shape, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self._data):
+            grown = np.empty(
+                (max(end, 2 * len(self._data)),) + self._data.shape[1:],
+                dtype=self._data.dtype
+            )
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:end] = values
+        self.size = end
+
+    def view(self):
+        return self._data[:self.size]
+
+
+class _Vocabulary:
+    """
+    Dense IDs handed out in arrival order, looked up through a sorted
+    copy of the keys
+    """
+
+    def __init__(self, dtype):
+        self.keys = _Growable(dtype)
+        self._sorted = np.empty(0, dtype=dtype)
+        self._ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.keys.size
+
+    def encode(self, values):
+        """
+        IDs of `values`, adding unseen keys. Also returns, per key
+        added, the position of its first occurrence in `values`.
+        """
+        pos = np.searchsorted(self._sorted, values)
+        known = pos < len(self._sorted)
+        known[known] = self._sorted[pos[known]] == values[known]
+
+        added, first = np.unique(values[~known], return_index=True)
+        first = np.flatnonzero(~known)[first]
+        at = np.searchsorted(self._sorted, added)
+        self._sorted = np.insert(self._sorted, at, added)
+        self._ids = np.insert(
+            self._ids, at, np.arange(len(self), len(self) + len(added))
+        )
+        self.keys.extend(added)
+
+        return self._ids[np.searchsorted(self._sorted, values)], first
+
+
+class CorpusBuilder:
+    """
+    A PackedCorpus grown batch by batch without repacking earlier rows.
+
+    Rows are appended to buffers that double when full, and new tokens
+    and subtrees get the next free vocabulary IDs, so unlike
+    pack_fingerprints the vocabularies are in arrival order, not
+    sorted. Blocks cut from `corpus()` share one vocabulary and score
+    exactly as a pack_fingerprints corpus would.
+    """
+
+    def __init__(self):
+        self.names = []
+        self._tokens = _Vocabulary(np.int32)
+        self._subtrees = _Vocabulary(np.int64)
+        self._arrays = {
+            "token_indptr": _Growable(np.int64),
+            "token_cols": _Growable(np.int32),
+            "token_counts": _Growable(np.float64),
+            "token_norms": _Growable(np.float64),
+            "ast_counts": _Growable(np.float64, len(NODE_TYPES)),
+            "ast_norms": _Growable(np.float64),
+            "subtree_indptr": _Growable(np.int64),
+            "subtree_cols": _Growable(np.int32),
+            "subtree_vocab_heights": _Growable(np.uint16),
+            "entropy": _Growable(np.float64),
+        }
+        self._arrays["token_indptr"].extend([0])
+        self._arrays["subtree_indptr"].extend([0])
+
+    def __len__(self):
+        return len(self.names)
+
+    def _append_csr(self, prefix, arrays, vocab):
+        indptr = self._arrays[f"{prefix}_indptr"]
+        values = np.concatenate(arrays)
+        ids, first = vocab.encode(values)
+        indptr.extend(indptr.view()[-1] + np.cumsum([len(a) for a in arrays]))
+        self._arrays[f"{prefix}_cols"].extend(ids)
+        return values, first
+
+    def add(self, fingerprints):
+        """
+        Append a {name: Fingerprint} mapping, preserving its order
+        """
+        fps = list(fingerprints.values())
+        if not fps:
+            return
+        self.names.extend(fingerprints)
+        a = self._arrays
+
+        # ----- Tokens -----
+        self._append_csr("token", [fp.tokens.ids for fp in fps],
+                         self._tokens)
+        a["token_counts"].extend(
+            np.concatenate([fp.tokens.counts for fp in fps])
+        )
+        a["token_norms"].extend([fp.tokens.norm for fp in fps])
+
+        # ----- AST -----
+        a["ast_counts"].extend(np.vstack([fp.ast_counts for fp in fps]))
+        a["ast_norms"].extend([fp.ast_norm for fp in fps])
+
+        # ----- Subtrees -----
+        _, first = self._append_csr("subtree", [fp.subtrees for fp in fps],
+                                    self._subtrees)
+        heights = np.concatenate([fp.subtree_heights for fp in fps])
+        a["subtree_vocab_heights"].extend(heights[first])
+
+        a["entropy"].extend([fp.entropy for fp in fps])
+
+    def corpus(self):
+        """
+        PackedCorpus view of every row added so far
+        """
+        return PackedCorpus(
+            self.names,
+            token_vocab=self._tokens.keys.view(),
+            subtree_vocab=self._subtrees.keys.view(),
+            **{key: arr.view() for key, arr in self._arrays.items()}
+        )
+
+
+# =========================================================
+# ---------------- SOURCES ----------------
+# =========================================================
+
+def read_sources(root):
+    """
+    {relative path: code} for every .py file under root, sorted by path
+    """
+    codes = {}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.py"),
+                              recursive=True)):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            codes[os.path.relpath(path, root)] = f.read()
+    return codes
+
+
+# =========================================================
+# ---------------- SNAPSHOTS ----------------
+# =========================================================
+
+def corpus_digest(corpus):
+    """
+    SHA-256 over names and every packed array; identifies a snapshot
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(corpus.names).encode("utf-8"))
+    for key in PackedCorpus.ARRAYS:
+        arr = np.ascontiguousarray(getattr(corpus, key))
+        h.update(f"{key}:{arr.dtype.str}:{arr.shape}".encode("ascii"))
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def check_ast_schema(schema, path):
+    """
+    Node-type columns and subtree IDs only mean the same thing under
+    the AST schema they were built with
+    """
+    if schema != AST_SCHEMA:
+        raise ValueError(
+            f"{path} was built with AST schema {schema}, this Python "
+            f"has {AST_SCHEMA}; rebuild it"
+        )
+
+
+def save_corpus(corpus, path):
+    """
+    Write a PackedCorpus to an .npz snapshot (atomically replaced),
+    creating missing directories
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            names=np.array(json.dumps(corpus.names)),
+            ast_schema=np.array(AST_SCHEMA),
+            **{key: getattr(corpus, key) for key in PackedCorpus.ARRAYS}
+        )
+    os.replace(tmp, path)
+
+
+def load_corpus(path):
+    """
+    Load an .npz snapshot, or memory-map a binary one (corpus_snapshot)
+    """
+    from model.corpus_snapshot import is_snapshot, read_snapshot
+
+    if is_snapshot(path):
+        return read_snapshot(path)
+
+    with np.load(path, allow_pickle=False) as data:
+        check_ast_schema(
+            str(data["ast_schema"]) if "ast_schema" in data else None, path
+        )
+        return PackedCorpus(
+            json.loads(str(data["names"])),
+            **{key: data[key] for key in PackedCorpus.ARRAYS}
+        )
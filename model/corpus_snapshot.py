@@ -0,0 +1,218 @@
+import json
+import os
+import struct
+
+import numpy as np
+from scipy import sparse
+
+from model.corpus import PackedCorpus, check_ast_schema, corpus_digest
+from syntactic.ast_features import AST_SCHEMA
+
+MAGIC = b"PLAGSNAP"
+VERSION = 2
+ALIGN = 64
+_PREFIX = struct.Struct("<8sII")
+
+# Stored as-is and mapped straight from the file
+RAW_ARRAYS = tuple(k for k in PackedCorpus.ARRAYS if k != "subtree_vocab")
+
+
+# =========================================================
+# ---------------- DELTA ENCODING ----------------
+# =========================================================
+
+def delta_encode(sorted_keys):
+    """
+    Sorted int64 keys -> (first key, width, (n - 1, width) uint8 gaps).
+    Gaps are stored little-endian in the fewest bytes that fit the
+    largest one.
+    """
+    keys = np.asarray(sorted_keys, dtype=np.int64)
+    if len(keys) == 0:
+        return 0, 1, np.empty((0, 1), dtype=np.uint8)
+
+    gaps = np.diff(keys.view(np.uint64))
+    largest = int(gaps.max()) if len(gaps) else 0
+    width = max(1, (largest.bit_length() + 7) // 8)
+    packed = gaps.astype("<u8").view(np.uint8).reshape(-1, 8)[:, :width]
+    return int(keys[0]), width, np.ascontiguousarray(packed)
+
+
+def delta_decode(first, count, packed):
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    width = packed.shape[1]
+    gaps = np.zeros((count - 1, 8), dtype=np.uint8)
+    gaps[:, :width] = packed
+    keys = np.empty(count, dtype=np.uint64)
+    keys[0] = np.int64(first).view(np.uint64)
+    np.cumsum(gaps.view("<u8").ravel(), out=keys[1:])
+    keys[1:] += keys[0]
+    return keys.view(np.int64)
+
+
+# =========================================================
+# ---------------- LAZY CORPUS ----------------
+# =========================================================
+
+class SnapshotCorpus(PackedCorpus):
+    """
+    PackedCorpus whose arrays are read-only views of a memory-mapped
+    snapshot. The subtree vocabulary is only decoded when something
+    needs the actual hash values.
+    """
+
+    def __init__(self, names, decode_vocab, extras=None, **arrays):
+        self._decode_vocab = decode_vocab
+        self._vocab = None
+        self.extras = extras or {}
+        super().__init__(names, subtree_vocab=None, **arrays)
+
+    @property
+    def subtree_vocab(self):
+        if self._vocab is None:
+            self._vocab = self._decode_vocab()
+        return self._vocab
+
+    @subtree_vocab.setter
+    def subtree_vocab(self, value):
+        self._vocab = value
+
+    def subtree_matrix(self):
+        # Vocabulary size without decoding it
+        return sparse.csr_matrix(
+            (np.ones(len(self.subtree_cols)), self.subtree_cols,
+             self.subtree_indptr),
+            shape=(len(self), len(self.subtree_vocab_heights))
+        )
+
+
+# =========================================================
+# ---------------- WRITE / READ ----------------
+# =========================================================
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def write_snapshot(corpus, path, extras=None):
+    """
+    Save a PackedCorpus as one versioned binary file:
+
+        magic, version, table-of-contents length
+        JSON table of contents (offset / dtype / shape per array)
+        64-byte aligned arrays
+
+    The subtree vocabulary is delta-encoded and the file names are a
+    UTF-8 blob plus offsets. `extras` ({key: array}) are stored and
+    mapped alongside (e.g. an index built over the corpus). The AST
+    schema is recorded so another Python cannot load it. Written to a
+    temporary file and renamed; missing directories are created.
+    """
+    extras = extras or {}
+    first, width, gaps = delta_encode(corpus.subtree_vocab)
+    encoded = [name.encode("utf-8") for name in corpus.names]
+    name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=name_offsets[1:])
+
+    arrays = {key: np.ascontiguousarray(getattr(corpus, key))
+              for key in RAW_ARRAYS}
+    arrays["subtree_vocab_gaps"] = gaps
+    arrays["name_offsets"] = name_offsets
+    arrays["name_blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    for key, arr in extras.items():
+        arrays[f"extra:{key}"] = np.ascontiguousarray(arr)
+
+    layout = {}
+    offset = 0
+    for key, arr in arrays.items():
+        offset = _aligned(offset)
+        layout[key] = {
+            "offset": offset,
+            "dtype": arr.dtype.str,
+            "shape": list(arr.shape),
+        }
+        offset += arr.nbytes
+
+    toc = json.dumps({
+        "count": len(corpus),
+        "digest": corpus_digest(corpus),
+        "ast_schema": AST_SCHEMA,
+        "subtree_vocab": {
+            "first": first, "count": len(corpus.subtree_vocab),
+            "width": width,
+        },
+        "arrays": layout,
+    }).encode("utf-8")
+    data_start = _aligned(_PREFIX.size + len(toc))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(toc)))
+        f.write(toc)
+        for key, arr in arrays.items():
+            f.seek(data_start + layout[key]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def is_snapshot(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_snapshot(path, verify=False):
+    """
+    Memory-map a snapshot as a SnapshotCorpus. Nothing but the header
+    and the name table is read up front; `verify` recomputes the
+    digest (which touches every array).
+    """
+    with open(path, "rb") as f:
+        magic, version, toc_len = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a corpus snapshot")
+        if version != VERSION:
+            raise ValueError(
+                f"{path} is snapshot version {version}, expected {VERSION}"
+            )
+        toc = json.loads(f.read(toc_len))
+    check_ast_schema(toc["ast_schema"], path)
+
+    data_start = _aligned(_PREFIX.size + toc_len)
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+
+    arrays = {}
+    for key, spec in toc["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = data_start + spec["offset"]
+        arrays[key] = np.frombuffer(
+            mm, dtype=dtype, count=count, offset=start
+        ).reshape(spec["shape"])
+
+    blob = arrays.pop("name_blob").tobytes()
+    offsets = arrays.pop("name_offsets").tolist()
+    names = [
+        blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])
+    ]
+
+    extras = {
+        key.split(":", 1)[1]: arrays.pop(key)
+        for key in list(arrays) if key.startswith("extra:")
+    }
+    vocab = toc["subtree_vocab"]
+    gaps = arrays.pop("subtree_vocab_gaps")
+    corpus = SnapshotCorpus(
+        names,
+        lambda: delta_decode(vocab["first"], vocab["count"], gaps),
+        extras,
+        **arrays
+    )
+
+    if verify and corpus_digest(corpus) != toc["digest"]:
+        raise ValueError(f"{path} failed its digest check")
+    return corpus
+
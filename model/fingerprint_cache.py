@@ -0,0 +1,308 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+CACHE_ENV = "PLAGIARISM_FINGERPRINT_CACHE"
+CACHE_MAX_ENV = "PLAGIARISM_FINGERPRINT_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+BUSY_TIMEOUT = 30.0
+
+# A hit refreshes an entry's last_used only when it is older than this
+# (seconds), so repeated hits stay read-only and never queue behind
+# writers; LRU order is kept to this resolution
+LRU_RESOLUTION = 3600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    digest    TEXT NOT NULL,
+    component TEXT NOT NULL,
+    version   INTEGER NOT NULL,
+    data      BLOB NOT NULL,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, component)
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('bytes', 0);
+"""
+
+
+def content_key(code: str):
+    """
+    SHA-256 of the submission text: identical files share entries
+    """
+    return hashlib.sha256(
+        code.encode("utf-8", errors="surrogatepass")
+    ).hexdigest()
+
+
+def encode_arrays(arrays):
+    """
+    Plain .npz bytes of a sequence of arrays (no pickled objects)
+    """
+    buf = io.BytesIO()
+    np.savez(buf, *arrays)
+    return buf.getvalue()
+
+
+def decode_arrays(data):
+    """
+    The arrays of encode_arrays, in order; refuses pickled objects
+    """
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        return tuple(npz[f"arr_{i}"] for i in range(len(npz.files)))
+
+
+# =========================================================
+# ---------------- COMPONENT CACHE ----------------
+# =========================================================
+
+class FingerprintCache:
+    """
+    On-disk cache of fingerprint components keyed by content hash.
+
+    Each component (lexical, ast, style) is stored separately, as a
+    tuple of plain arrays, with the version of the extractor that
+    produced it, so bumping one extractor's version only invalidates
+    that component. The database runs in WAL mode with a busy timeout,
+    so several processes can read and write it at once. Total payload
+    is capped at `max_bytes`; least recently used entries are evicted
+    first.
+
+    A cache failure (locked too long, disk full, ...) never breaks
+    scoring: the lookup counts as a miss and the error is counted.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.errors = 0
+        self._local = threading.local()
+
+    # ---------- connection ----------
+
+    def _connect(self):
+        # One connection per thread; connections must not cross fork()
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            local.conn, local.pid = conn, os.getpid()
+        return local.conn
+
+    def close(self):
+        if getattr(self._local, "pid", None) == os.getpid():
+            self._local.conn.close()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    # ---------- lookups ----------
+
+    def load(self, digest, versions):
+        """
+        {component: arrays} for the components of `versions`
+        ({component: version}) cached at exactly that version. An entry
+        that cannot be decoded counts as a miss.
+        """
+        found = {}
+        try:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT component, version, data, last_used FROM entries "
+                "WHERE digest = ?", (digest,)
+            ).fetchall()
+            oldest = None
+            for component, version, data, last_used in rows:
+                if versions.get(component) != version:
+                    continue
+                try:
+                    found[component] = decode_arrays(data)
+                except Exception:
+                    # Truncated or foreign blob
+                    self.errors += 1
+                    continue
+                oldest = last_used if oldest is None else min(oldest,
+                                                              last_used)
+            now = time.time()
+            if oldest is not None and now - oldest > LRU_RESOLUTION:
+                conn.execute(
+                    "UPDATE entries SET last_used = ? WHERE digest = ?",
+                    (now, digest)
+                )
+        except sqlite3.Error:
+            self.errors += 1
+            found = {}
+
+        for component in versions:
+            if component in found:
+                self.hits[component] += 1
+            else:
+                self.misses[component] += 1
+        return found
+
+    def store(self, digest, values):
+        """
+        Save {component: (version, arrays)} for one submission in a
+        single transaction, evicting old entries if over the cap
+        """
+        rows = [
+            (digest, component, version, encode_arrays(arrays))
+            for component, (version, arrays) in values.items()
+        ]
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for digest, component, version, data in rows:
+                    old = conn.execute(
+                        "SELECT size FROM entries WHERE digest = ? AND "
+                        "component = ?", (digest, component)
+                    ).fetchone()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (digest, component, version, data, len(data),
+                         time.time())
+                    )
+                    conn.execute(
+                        "UPDATE meta SET value = value + ? "
+                        "WHERE key = 'bytes'",
+                        (len(data) - (old[0] if old else 0),)
+                    )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _evict(self, conn):
+        total = conn.execute(
+            "SELECT value FROM meta WHERE key = 'bytes'"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Evict down to 90% of the cap so we do not evict on every store
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for digest, component, size in conn.execute(
+            "SELECT digest, component, size FROM entries ORDER BY last_used"
+        ):
+            if freed >= target:
+                break
+            victims.append((digest, component))
+            freed += size
+
+        conn.executemany(
+            "DELETE FROM entries WHERE digest = ? AND component = ?", victims
+        )
+        conn.execute(
+            "UPDATE meta SET value = value - ? WHERE key = 'bytes'", (freed,)
+        )
+        self.evictions += len(victims)
+
+    # ---------- reporting ----------
+
+    def stats(self):
+        """
+        Hit / miss counts of this process plus the cache's current size
+        """
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        try:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = conn.execute(
+                "SELECT value FROM meta WHERE key = 'bytes'"
+            ).fetchone()[0]
+        except sqlite3.Error:
+            entries = size = None
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "by_component": {
+                c: {"hits": self.hits[c], "misses": self.misses[c]}
+                for c in sorted(set(self.hits) | set(self.misses))
+            },
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM entries")
+        conn.execute("UPDATE meta SET value = 0 WHERE key = 'bytes'")
+
+
+# =========================================================
+# ---------------- DEFAULT CACHE ----------------
+# =========================================================
+
+_default = None
+
+
+def set_default_cache(path, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Route every fingerprint() call through a cache at `path` (None
+    disables it). Exported through the environment so worker processes
+    started later use the same cache.
+    """
+    global _default
+    if path is None:
+        os.environ.pop(CACHE_ENV, None)
+        os.environ.pop(CACHE_MAX_ENV, None)
+        _default = None
+        return None
+
+    os.environ[CACHE_ENV] = path
+    os.environ[CACHE_MAX_ENV] = str(max_bytes)
+    _default = FingerprintCache(path, max_bytes)
+    return _default
+
+
+def default_cache():
+    """
+    The cache configured by set_default_cache or $PLAGIARISM_FINGERPRINT_CACHE
+    """
+    global _default
+    path = os.environ.get(CACHE_ENV)
+    if not path:
+        return None
+    if _default is None or _default.path != path:
+        max_bytes = int(os.environ.get(CACHE_MAX_ENV, DEFAULT_MAX_BYTES))
+        _default = FingerprintCache(path, max_bytes)
+    return _default
@@ -0,0 +1,86 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model.corpus import PackedCorpus
+
+ALIGN = 64
+
+
+# =========================================================
+# ---------------- SHARED-MEMORY CORPUS ----------------
+# =========================================================
+
+class SharedCorpus:
+    """
+    Copies a PackedCorpus into one shared-memory segment so worker
+    processes can map it read-only instead of unpickling a copy.
+
+    Use as a context manager: the segment is unlinked on normal exit,
+    on exceptions and on KeyboardInterrupt. `spec` is the small,
+    picklable description workers pass to attach_corpus().
+    """
+
+    def __init__(self, corpus: PackedCorpus):
+        layout = {}
+        size = 0
+        for key in PackedCorpus.ARRAYS:
+            arr = np.ascontiguousarray(getattr(corpus, key))
+            size = -(-size // ALIGN) * ALIGN
+            layout[key] = (size, arr.dtype.str, arr.shape)
+            size += arr.nbytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            for key, (offset, dtype, shape) in layout.items():
+                view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                                  offset=offset)
+                view[...] = getattr(corpus, key)
+                del view
+        except BaseException:
+            self.close()
+            raise
+
+        self.spec = {
+            "segment": self._shm.name,
+            "names": list(corpus.names),
+            "arrays": layout,
+        }
+
+    def close(self):
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        shm.close()
+        shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment with the resource
+        # tracker. Pool workers share the creator's tracker, where the
+        # name is already registered, so this is a harmless duplicate.
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_corpus(spec):
+    """
+    Read-only PackedCorpus backed by an existing shared segment.
+    Returns (corpus, segment); keep the segment alive while in use.
+    """
+    shm = _open_segment(spec["segment"])
+    arrays = {}
+    for key, (offset, dtype, shape) in spec["arrays"].items():
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        arr.flags.writeable = False
+        arrays[key] = arr
+
+    return PackedCorpus(spec["names"], **arrays), shm
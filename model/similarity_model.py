@@ -1,42 +1,27 @@
+import hashlib
 import math
 import ast
-import hashlib
 from collections import Counter
-import re
+
+import numpy as np
+
+# tokenize / normalize_identifiers / KEYWORDS are re-exported from here
+from lexical.lexical_analysis import (
+    KEYWORDS, TokenCounts, count_cosine, normalize_identifiers,
+    token_counts, tokenize
+)
+from syntactic.ast_features import (
+    AST_SCHEMA, extract_ast_features, node_type_vector, parse_code
+)
+from syntactic.subtree_ids import (
+    subtree_array, subtree_array_with_heights, subtree_overlap
+)
+from model.fingerprint_cache import content_key, default_cache
 
 # =========================================================
 # ---------------- LEXICAL ANALYSIS ----------------
 # =========================================================
 
-KEYWORDS = {
-    "def", "return", "if", "elif", "else", "while", "for",
-    "in", "and", "or", "not", "break", "continue", "class",
-    "import", "from", "as", "with", "try", "except", "finally",
-    "pass", "raise", "yield", "lambda"
-}
-
-def tokenize(code: str):
-    return re.findall(
-        r"[A-Za-z_][A-Za-z_0-9]*|\d+|==|!=|<=|>=|[+\-*/%<>]",
-        code
-    )
-
-def normalize_identifiers(tokens):
-    mapping = {}
-    counter = 0
-    normalized = []
-
-    for t in tokens:
-        if t.isidentifier() and t not in KEYWORDS:
-            if t not in mapping:
-                counter += 1
-                mapping[t] = f"VAR_{counter}"
-            normalized.append(mapping[t])
-        else:
-            normalized.append(t)
-
-    return normalized
-
 def token_vector(tokens):
     freq = Counter(tokens)
     total = sum(freq.values())
@@ -44,14 +29,21 @@ def token_vector(tokens):
         return {}
     return {k: v / total for k, v in freq.items()}
 
-def cosine(v1, v2):
+def vector_norm(v):
+    return math.sqrt(sum(x ** 2 for x in v.values()))
+
+def cosine(v1, v2, norm1=None, norm2=None):
     if not v1 or not v2:
         return 0.0
 
     common = set(v1) & set(v2)
     num = sum(v1[k] * v2[k] for k in common)
-    den = math.sqrt(sum(v ** 2 for v in v1.values())) * \
-          math.sqrt(sum(v ** 2 for v in v2.values()))
+
+    if norm1 is None:
+        norm1 = vector_norm(v1)
+    if norm2 is None:
+        norm2 = vector_norm(v2)
+    den = norm1 * norm2
 
     return num / den if den else 0.0
 
@@ -60,34 +52,18 @@ def cosine(v1, v2):
 # ---------------- AST GLOBAL ANALYSIS ----------------
 # =========================================================
 
-class ASTExtractor(ast.NodeVisitor):
-    def __init__(self):
-        self.counter = Counter()
-        self.depth = 0
-        self.max_depth = 0
-
-    def generic_visit(self, node):
-        self.depth += 1
-        self.max_depth = max(self.max_depth, self.depth)
-        self.counter[type(node).__name__] += 1
-        super().generic_visit(node)
-        self.depth -= 1
-
 def ast_vector(code: str):
-    try:
-        tree = ast.parse(code)
-    except Exception:
-        return {}
-
-    extractor = ASTExtractor()
-    extractor.visit(tree)
-    extractor.counter["MAX_DEPTH"] = extractor.max_depth
+    return ast_vector_from_features(extract_ast_features(parse_code(code)))
 
-    total = sum(extractor.counter.values())
-    if total == 0:
+def ast_vector_from_features(features):
+    if not features.counter:
         return {}
 
-    return {k: v / total for k, v in extractor.counter.items()}
+    counter = Counter(features.counter)
+    counter["MAX_DEPTH"] = features.max_depth
+
+    total = sum(counter.values())
+    return {k: v / total for k, v in counter.items()}
 
 
 # =========================================================
@@ -116,27 +92,16 @@ def canonical_subtree(node):
     return "|".join(parts)
 
 def extract_subtree_hashes(code: str):
-    try:
-        tree = ast.parse(code)
-    except Exception:
-        return set()
-
-    hashes = set()
-    for node in ast.walk(tree):
-        rep = canonical_subtree(node)
-        h = hashlib.md5(rep.encode("utf-8")).hexdigest()
-        hashes.add(h)
-
-    return hashes
+    """
+    Sorted int64 subtree fingerprints
+    """
+    return subtree_array(extract_ast_features(parse_code(code)).subtrees)
 
 def ast_subtree_similarity(code1: str, code2: str):
-    s1 = extract_subtree_hashes(code1)
-    s2 = extract_subtree_hashes(code2)
-
-    if not s1 or not s2:
-        return 0.0
-
-    return len(s1 & s2) / min(len(s1), len(s2))
+    return subtree_overlap(
+        extract_subtree_hashes(code1),
+        extract_subtree_hashes(code2)
+    )
 
 
 # =========================================================
@@ -176,36 +141,181 @@ def style_vector(code: str):
     }
 
 
+# =========================================================
+# ---------------- FINGERPRINTS ----------------
+# =========================================================
+
+class Fingerprint:
+    """
+    Per-submission features, computed once and reused for every pair.
+    """
+
+    def __init__(self, tokens, ast_counts, subtrees, subtree_heights,
+                 entropy, indent):
+        self.tokens = tokens
+        self.ast_counts = ast_counts
+        self.ast_norm = math.sqrt(float(np.dot(ast_counts, ast_counts)))
+        self.subtrees = subtrees
+        self.subtree_heights = subtree_heights
+        self.entropy = entropy
+        self.indent = indent
+
+# Bump a version whenever its extractor's output changes; cached
+# fingerprints are invalidated per component. The AST component also
+# depends on this interpreter's ast classes, so AST_SCHEMA is folded in.
+AST_VERSION = 2
+FEATURE_VERSIONS = {
+    "lexical": 2,
+    "ast": int(hashlib.sha256(
+        f"{AST_VERSION}:{AST_SCHEMA}".encode("utf-8")
+    ).hexdigest()[:15], 16),
+    "style": 2,
+}
+
+def lexical_component(code: str):
+    return token_counts(code)
+
+def ast_component(code: str):
+    """
+    (node-type vector, subtree hashes, subtree heights) from one AST pass
+    """
+    features = extract_ast_features(parse_code(code))
+    return (
+        node_type_vector(features),
+        *subtree_array_with_heights(features.subtrees)
+    )
+
+def style_component(code: str):
+    style = style_vector(code)
+    return style["entropy"], style["indent"]
+
+COMPONENTS = {
+    "lexical": lexical_component,
+    "ast": ast_component,
+    "style": style_component,
+}
+
+# Components are cached as plain arrays, never pickles:
+# {component: (to_arrays, from_arrays)}
+CODECS = {
+    "lexical": (
+        lambda tokens: (tokens.ids, tokens.counts),
+        lambda ids, counts: TokenCounts(ids, counts),
+    ),
+    "ast": (
+        lambda parts: parts,
+        lambda vector, values, heights: (vector, values, heights),
+    ),
+    "style": (
+        lambda style: (np.array(style, dtype=np.float64),),
+        lambda style: (float(style[0]), float(style[1])),
+    ),
+}
+
+def fingerprint_arrays(fp):
+    """
+    {component: arrays} of a Fingerprint, encoded with CODECS
+    """
+    parts = {
+        "lexical": fp.tokens,
+        "ast": (fp.ast_counts, fp.subtrees, fp.subtree_heights),
+        "style": (fp.entropy, fp.indent),
+    }
+    return {name: CODECS[name][0](value) for name, value in parts.items()}
+
+def fingerprint_from_arrays(arrays):
+    """
+    Inverse of fingerprint_arrays. Arrays of the wrong number or shape
+    raise TypeError, ValueError or IndexError.
+    """
+    parts = {name: CODECS[name][1](*arrays[name]) for name in COMPONENTS}
+    return Fingerprint(
+        parts["lexical"],
+        *parts["ast"],
+        *parts["style"]
+    )
+
+def fingerprint(code: str):
+    """
+    Tokenize, parse and measure style of one submission (one AST pass).
+    Components found in the default fingerprint cache are reused.
+    """
+    cache = default_cache()
+    if cache is None:
+        parts = {name: extract(code) for name, extract in COMPONENTS.items()}
+    else:
+        digest = content_key(code)
+        parts = {}
+        for name, arrays in cache.load(digest, FEATURE_VERSIONS).items():
+            try:
+                parts[name] = CODECS[name][1](*arrays)
+            except (TypeError, ValueError, IndexError):
+                # Wrong number or shape of arrays: recompute
+                pass
+        fresh = {
+            name: extract(code)
+            for name, extract in COMPONENTS.items() if name not in parts
+        }
+        if fresh:
+            cache.store(digest, {
+                name: (FEATURE_VERSIONS[name], CODECS[name][0](value))
+                for name, value in fresh.items()
+            })
+            parts.update(fresh)
+
+    return Fingerprint(
+        parts["lexical"],
+        *parts["ast"],
+        *parts["style"]
+    )
+
+def fingerprint_all(codes):
+    """
+    Fingerprint a {name: code} mapping, preserving its order.
+    """
+    return {name: fingerprint(code) for name, code in codes.items()}
+
+
 # =========================================================
 # ---------------- FINAL SIMILARITY (AUC-TUNED) ----------------
 # =========================================================
 
-def final_similarity(code1: str, code2: str):
+LEXICAL_WEIGHT = 0.20
+AST_WEIGHT = 0.65
+STYLE_WEIGHT = 0.15
+
+AST_GLOBAL_SHARE = 0.3
+AST_SUBTREE_SHARE = 0.7
+
+STRETCH = 1.3
+
+def pair_similarity(fp1: Fingerprint, fp2: Fingerprint):
     # ----- Lexical -----
-    t1 = normalize_identifiers(tokenize(code1))
-    t2 = normalize_identifiers(tokenize(code2))
-    lex_sim = cosine(token_vector(t1), token_vector(t2))
+    lex_sim = count_cosine(fp1.tokens, fp2.tokens)
 
     # ----- AST -----
-    ast_global = cosine(ast_vector(code1), ast_vector(code2))
-    ast_sub = ast_subtree_similarity(code1, code2)
+    ast_global = (
+        float(np.dot(fp1.ast_counts, fp2.ast_counts)) /
+        (fp1.ast_norm * fp2.ast_norm)
+        if fp1.ast_norm and fp2.ast_norm else 0.0
+    )
+    ast_sub = subtree_overlap(fp1.subtrees, fp2.subtrees)
 
     # AST-dominant hybrid (best for plagiarism)
-    ast_hybrid = 0.3 * ast_global + 0.7 * ast_sub
+    ast_hybrid = AST_GLOBAL_SHARE * ast_global + AST_SUBTREE_SHARE * ast_sub
 
     # ----- Style -----
-    s1, s2 = style_vector(code1), style_vector(code2)
-    style_sim = 1 / (1 + abs(s1["entropy"] - s2["entropy"]))
+    style_sim = 1 / (1 + abs(fp1.entropy - fp2.entropy))
 
     # Final weighted score (ROC/AUC optimized)
     final_score = (
-        0.20 * lex_sim +
-        0.65 * ast_hybrid +
-        0.15 * style_sim
+        LEXICAL_WEIGHT * lex_sim +
+        AST_WEIGHT * ast_hybrid +
+        STYLE_WEIGHT * style_sim
     )
 
     # Non-linear stretching for better separation
-    final_score = min(1.0, max(0.0, final_score ** 1.3))
+    final_score = min(1.0, max(0.0, final_score ** STRETCH))
 
     return (
         lex_sim,
@@ -215,3 +325,7 @@ def final_similarity(code1: str, code2: str):
         style_sim,
         final_score
     )
+
+
+def final_similarity(code1: str, code2: str):
+    return pair_similarity(fingerprint(code1), fingerprint(code2))
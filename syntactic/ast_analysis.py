@@ -1,32 +1,6 @@
-import ast
 import math
-from collections import Counter
 
-
-# ---------------------------------
-# AST Node Counter
-# ---------------------------------
-
-class ASTNodeCounter(ast.NodeVisitor):
-    """
-    Traverses AST and counts node types + depth
-    """
-
-    def __init__(self):
-        self.counter = Counter()
-        self.current_depth = 0
-        self.max_depth = 0
-
-    def generic_visit(self, node):
-        self.current_depth += 1
-        self.max_depth = max(self.max_depth, self.current_depth)
-
-        node_type = type(node).__name__
-        self.counter[node_type] += 1
-
-        super().generic_visit(node)
-
-        self.current_depth -= 1
+from syntactic.ast_features import extract_ast_features, parse_code
 
 
 # ---------------------------------
@@ -37,22 +11,20 @@ def ast_vector(code: str):
     """
     Convert source code into normalized AST feature vector
     """
-    try:
-        tree = ast.parse(code)
-    except SyntaxError:
+    tree = parse_code(code)
+    if tree is None:
         return {}
 
-    counter = ASTNodeCounter()
-    counter.visit(tree)
+    features = extract_ast_features(tree)
 
     # Add structural depth as a feature
-    counter.counter["MAX_DEPTH"] = counter.max_depth
+    features.counter["MAX_DEPTH"] = features.max_depth
 
-    total = sum(counter.counter.values())
+    total = sum(features.counter.values())
     if total == 0:
         return {}
 
-    return {k: v / total for k, v in counter.counter.items()}
+    return {k: v / total for k, v in features.counter.items()}
 
 
 # ---------------------------------
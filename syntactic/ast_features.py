@@ -0,0 +1,358 @@
+import ast
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+
+DIGEST_SIZE = 8
+PARSE_RECURSION_LIMIT = 100_000
+
+# C stack for the deep-parse retry thread. CPython builds the tree
+# recursively on the C stack, using well under 1 KB per level, so this
+# leaves a wide margin at PARSE_RECURSION_LIMIT; only touched pages are
+# committed.
+PARSE_STACK_SIZE = 256 * 1024 * 1024
+
+# The recursion limit and thread stack size are process-wide
+_PARSE_LOCK = threading.Lock()
+
+# Column order of dense node-type vectors: every AST class this Python
+# knows about, then the MAX_DEPTH feature
+NODE_TYPES = tuple(sorted(
+    name for name, obj in vars(ast).items()
+    if isinstance(obj, type) and issubclass(obj, ast.AST)
+)) + ("MAX_DEPTH",)
+NODE_TYPE_INDEX = {name: i for i, name in enumerate(NODE_TYPES)}
+
+# Digest of everything fingerprints depend on besides the source: the
+# Python version (its parser), the NODE_TYPES columns and every node
+# class's fields (hashed into the Merkle digests). Caches and snapshots
+# built under another interpreter are rejected by comparing it.
+AST_SCHEMA = hashlib.sha256(repr((
+    tuple(sys.version_info[:2]),
+    NODE_TYPES,
+    tuple(getattr(ast, name)._fields for name in NODE_TYPES[:-1]),
+)).encode("utf-8")).hexdigest()[:16]
+
+
+# --------------------------------------------------
+# Single-Pass AST Features
+# --------------------------------------------------
+
+class ASTFeatures:
+    """
+    Everything the AST components need from one traversal:
+    node-type counts, max depth and subtree fingerprints
+    (mapped to the height of the subtree, leaves being 1)
+    """
+
+    def __init__(self):
+        self.counter = Counter()
+        self.max_depth = 0
+        self.subtrees = {}
+        self.root = None
+        self.nodes_visited = 0
+
+
+def parse_code(code: str):
+    """
+    Parse source code, returning None if the parser rejects it.
+
+    Long left-nested chains (e.g. thousands of `a + a + ...` terms) are
+    valid Python but exceed the default recursion limit while CPython
+    builds the tree, so those are retried once with a higher limit.
+    The retry runs in its own thread with a stack sized for that limit,
+    so inputs deeper still fail with RecursionError instead of
+    overflowing the caller's stack.
+    """
+    try:
+        return ast.parse(code)
+    except RecursionError:
+        pass
+    except Exception:
+        return None
+
+    result = []
+
+    def retry():
+        try:
+            result.append(ast.parse(code))
+        except Exception:
+            pass
+
+    # Serialized so concurrent retries cannot restore each other's
+    # raised limit; other threads see it only while this parse runs
+    with _PARSE_LOCK:
+        limit = sys.getrecursionlimit()
+        raised = max(limit, PARSE_RECURSION_LIMIT)
+        sys.setrecursionlimit(raised)
+        try:
+            stack = threading.stack_size(PARSE_STACK_SIZE)
+            try:
+                worker = threading.Thread(target=retry, daemon=True)
+                worker.start()
+            finally:
+                threading.stack_size(stack)
+            worker.join()
+        except (RuntimeError, ValueError):
+            # No thread or stack of that size on this platform
+            return None
+        finally:
+            # A limit set elsewhere in the meantime is left in place
+            if sys.getrecursionlimit() == raised:
+                sys.setrecursionlimit(limit)
+
+    return result[0] if result else None
+
+
+_NAMES = {}
+_LAYOUTS = {}
+_MISSING = object()
+
+# Digests of recently seen (node bytes + child digests) inputs. Leaves and
+# small subtrees such as Name(ctx=Load) repeat constantly, and a dict hit
+# is much cheaper than a fresh BLAKE2b. Cleared when full.
+_DIGEST_MEMO = {}
+_DIGEST_MEMO_SIZE = 65536
+
+
+def _name_bytes(name):
+    b = _NAMES.get(name)
+    if b is None:
+        b = _NAMES[name] = name.encode("ascii") + b"\0"
+    return b
+
+
+def _layout(cls):
+    layout = _LAYOUTS[cls] = (
+        cls.__name__,
+        _name_bytes(cls.__name__),
+        tuple((field, _name_bytes(field)) for field in cls._fields),
+    )
+    return layout
+
+
+def extract_ast_features(tree):
+    """
+    Traverse a parsed tree once. Returns empty features for None.
+
+    Nodes are counted in pre-order and given a Merkle fingerprint in
+    post-order: the digest covers the node type, every field name and
+    the digests of its children, so two subtrees share a fingerprint
+    exactly when canonical_subtree would give them the same string.
+    Identifiers, constants and other scalar fields contribute only
+    their field name.
+
+    The traversal keeps its own stack instead of recursing, so memory
+    grows with tree depth only and arbitrarily deep trees are fine.
+    """
+    features = ASTFeatures()
+    if tree is None:
+        return features
+
+    counter = features.counter
+    subtrees = features.subtrees
+    memo = _DIGEST_MEMO
+    blake2b = hashlib.blake2b
+    AST = ast.AST
+
+    # (node, depth) entries are visits; (segments, 0) entries finish a
+    # node once its children's digests are on top of `digests`
+    stack = [(tree, 1)]
+    digests = []
+    heights = []
+    visited = 0
+    max_depth = 0
+
+    while stack:
+        node, depth = stack.pop()
+
+        if depth:
+            visited += 1
+            cls = node.__class__
+            layout = _LAYOUTS.get(cls) or _layout(cls)
+            counter[layout[0]] += 1
+            if depth > max_depth:
+                max_depth = depth
+
+            # Bytes that precede each child, plus the trailing bytes
+            segments = []
+            children = []
+            current = layout[1]
+
+            for field, field_bytes in layout[2]:
+                value = getattr(node, field, _MISSING)
+
+                if value.__class__ is list:
+                    kids = [v for v in value if isinstance(v, AST)]
+                    current += (
+                        field_bytes + b"[" + len(kids).to_bytes(4, "little")
+                    )
+                    for kid in kids:
+                        segments.append(current)
+                        children.append(kid)
+                        current = b""
+
+                elif isinstance(value, AST):
+                    segments.append(current + field_bytes + b"(")
+                    children.append(value)
+                    current = b""
+
+                elif value is not _MISSING:
+                    # Ignore identifiers, constants, numbers, strings
+                    current += field_bytes + b"."
+
+            if children:
+                segments.append(current)
+                stack.append((segments, 0))
+                depth += 1
+                for child in reversed(children):
+                    stack.append((child, depth))
+                continue
+
+            data = current
+            height = 1
+
+        else:
+            k = len(node) - 1
+            parts = [None] * (2 * k + 1)
+            parts[::2] = node
+            parts[1::2] = digests[-k:]
+            del digests[-k:]
+            data = b"".join(parts)
+            height = 1 + max(heights[-k:])
+            del heights[-k:]
+
+        digest = memo.get(data)
+        if digest is None:
+            if len(memo) >= _DIGEST_MEMO_SIZE:
+                memo.clear()
+            digest = memo[data] = blake2b(
+                data, digest_size=DIGEST_SIZE
+            ).digest()
+
+        subtrees[digest] = height
+        digests.append(digest)
+        heights.append(height)
+
+    features.root = digests[0]
+    features.nodes_visited = visited
+    features.max_depth = max_depth
+    return features
+
+
+def node_type_vector(features):
+    """
+    Dense float64 counts over NODE_TYPES (MAX_DEPTH included), all zero
+    for an unparsable file
+    """
+    vec = np.zeros(len(NODE_TYPES))
+    if features.counter:
+        for name, count in features.counter.items():
+            vec[NODE_TYPE_INDEX[name]] = count
+        vec[-1] = features.max_depth
+    return vec
+
+
+# --------------------------------------------------
+# Micro-Benchmark
+# --------------------------------------------------
+
+def legacy_nodes_visited(tree):
+    """
+    Node visits of the previous extractors: one NodeVisitor pass,
+    one ast.walk pass and a full canonical_subtree walk per node
+    """
+    nodes = list(ast.walk(tree))
+    subtree_sizes = sum(
+        sum(1 for _ in ast.walk(node)) for node in nodes
+    )
+    return 2 * len(nodes) + subtree_sizes
+
+
+def _load_trees(root):
+    trees = []
+    for dirpath, _, filenames in os.walk(root):
+        for fname in sorted(filenames):
+            if fname.endswith(".py"):
+                with open(os.path.join(dirpath, fname), encoding="utf-8") as f:
+                    tree = parse_code(f.read())
+                if tree is not None:
+                    trees.append(tree)
+    return trees
+
+
+DEEP_NESTING = 10_000
+
+# Deeper than PARSE_RECURSION_LIMIT allows on a default-sized stack;
+# used to crash the interpreter instead of returning None
+STACK_NESTING = 200_000
+
+
+def deep_parse_check(terms=STACK_NESTING):
+    """
+    Parse a `terms`-long chain in this thread and in a worker thread;
+    reaching the end at all means neither overflowed the C stack
+    """
+    code = "x = " + " + ".join(["a"] * terms)
+    parsed = {"main": parse_code(code) is not None}
+
+    def worker():
+        parsed["thread"] = parse_code(code) is not None
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+    return parsed
+
+
+def benchmark(root=os.path.join("data", "submissions")):
+    from model.similarity_model import canonical_subtree
+
+    trees = _load_trees(root)
+
+    before = sum(legacy_nodes_visited(t) for t in trees)
+    after = sum(extract_ast_features(t).nodes_visited for t in trees)
+
+    start = time.perf_counter()
+    for t in trees:
+        Counter(type(node).__name__ for node in ast.walk(t))
+        {canonical_subtree(node) for node in ast.walk(t)}
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for t in trees:
+        extract_ast_features(t)
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    deep = extract_ast_features(
+        parse_code("x = " + " + ".join(["a"] * DEEP_NESTING))
+    )
+    deep_time = time.perf_counter() - start
+
+    return {
+        "files": len(trees),
+        "visits_per_file_before": before / max(len(trees), 1),
+        "visits_per_file_after": after / max(len(trees), 1),
+        "seconds_before": legacy_time,
+        "seconds_after": single_time,
+        "deep_nesting_depth": deep.max_depth,
+        "deep_nesting_seconds": deep_time,
+        "stack_nesting_parsed": deep_parse_check(),
+    }
+
+
+if __name__ == "__main__":
+    stats = benchmark()
+    print(f"📁 Files: {stats['files']}")
+    print(f"🔁 Nodes visited per file (before): {stats['visits_per_file_before']:.1f}")
+    print(f"✔ Nodes visited per file (after):  {stats['visits_per_file_after']:.1f}")
+    print(f"⏱ Before: {stats['seconds_before']:.3f}s | After: {stats['seconds_after']:.3f}s")
+    print(f"🌲 {DEEP_NESTING}-term chain: depth {stats['deep_nesting_depth']} in {stats['deep_nesting_seconds']:.3f}s")
+    print(f"🧱 {STACK_NESTING}-term chain parsed without a crash: {stats['stack_nesting_parsed']}")
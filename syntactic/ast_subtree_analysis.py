@@ -1,5 +1,7 @@
 import ast
-import hashlib
+
+from syntactic.ast_features import extract_ast_features, parse_code
+from syntactic.subtree_ids import subtree_array, subtree_overlap
 
 
 # --------------------------------------------------
@@ -40,22 +42,10 @@ def canonical_subtree(node):
 
 def extract_subtree_hashes(code: str):
     """
-    Extract hashed canonical AST subtrees from code
+    Extract Merkle fingerprints of all AST subtrees from code,
+    as a sorted int64 array
     """
-    try:
-        tree = ast.parse(code)
-    except SyntaxError:
-        return set()
-
-    subtree_hashes = set()
-
-    for node in ast.walk(tree):
-        rep = canonical_subtree(node)
-        if rep:
-            h = hashlib.sha256(rep.encode("utf-8")).hexdigest()
-            subtree_hashes.add(h)
-
-    return subtree_hashes
+    return subtree_array(extract_ast_features(parse_code(code)).subtrees)
 
 
 # --------------------------------------------------
@@ -69,8 +59,5 @@ def ast_subtree_similarity(code1: str, code2: str) -> float:
     s1 = extract_subtree_hashes(code1)
     s2 = extract_subtree_hashes(code2)
 
-    if not s1 or not s2:
-        return 0.0
+    return subtree_overlap(s1, s2)
 
-    intersection = len(s1 & s2)
-    return intersection / min(len(s1), len(s2))
@@ -0,0 +1,191 @@
+import numpy as np
+
+
+# --------------------------------------------------
+# Integer Subtree Fingerprints
+# --------------------------------------------------
+
+def subtree_array(digests):
+    """
+    Convert 8-byte Merkle digests into a sorted int64 array
+    """
+    if not digests:
+        return np.empty(0, dtype=np.int64)
+
+    values = np.frombuffer(b"".join(digests), dtype="<i8")
+    return np.unique(values).astype(np.int64, copy=False)
+
+
+def subtree_array_with_heights(subtrees):
+    """
+    Sorted int64 fingerprints and their subtree heights (uint16,
+    capped at 65535) from a {digest: height} mapping
+    """
+    values = subtree_array(subtrees)
+    if not subtrees:
+        return values, np.empty(0, dtype=np.uint16)
+
+    raw = np.frombuffer(b"".join(subtrees), dtype="<i8")
+    heights = np.fromiter(subtrees.values(), dtype=np.int64,
+                          count=len(subtrees))
+    order = np.argsort(raw, kind="stable")
+    return values, np.minimum(heights[order], 65535).astype(np.uint16)
+
+
+def intersection_size(a, b) -> int:
+    """
+    Size of the intersection of two sorted, duplicate-free arrays
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return 0
+
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = 0
+    return int(np.count_nonzero(b[idx] == a))
+
+
+def subtree_overlap(a, b) -> float:
+    """
+    Overlap coefficient |a & b| / min(|a|, |b|) of two subtree arrays
+    """
+    if len(a) == 0 or len(b) == 0:
+        return 0.0
+
+    return intersection_size(a, b) / min(len(a), len(b))
+
+
+# --------------------------------------------------
+# One-vs-Many / Many-vs-Many (sorted arrays)
+# --------------------------------------------------
+
+class PackedSubtrees:
+    """
+    Many subtree arrays concatenated into one, with CSR-style offsets
+    """
+
+    def __init__(self, arrays):
+        lengths = np.fromiter((len(a) for a in arrays), dtype=np.int64,
+                              count=len(arrays))
+        self.offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+
+        self.values = (
+            np.concatenate(arrays).astype(np.int64, copy=False)
+            if len(arrays) else np.empty(0, dtype=np.int64)
+        )
+        self.owners = np.repeat(np.arange(len(arrays)), lengths)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+
+def intersection_sizes(query, packed: PackedSubtrees):
+    """
+    |query & packed[i]| for every i, in one vectorized pass
+    """
+    hits = np.isin(packed.values, query, assume_unique=True)
+    return np.bincount(packed.owners[hits], minlength=len(packed))
+
+
+def intersection_matrix(packed: PackedSubtrees):
+    """
+    |packed[i] & packed[j]| for every pair (many-vs-many). All arrays
+    are merged into one sorted run, where copies of a fingerprint sit
+    next to each other; each copy pair adds one to its owners' cell.
+    """
+    n = len(packed)
+    out = np.zeros((n, n), dtype=np.int64)
+    order = np.argsort(packed.values, kind="stable")
+    values, owners = packed.values[order], packed.owners[order]
+    np.add.at(out, (owners, owners), 1)
+
+    # Copies k apart; once none are, no longer run exists
+    for k in range(1, len(values)):
+        same = values[k:] == values[:-k]
+        if not same.any():
+            break
+        a, b = owners[:-k][same], owners[k:][same]
+        np.add.at(out, (a, b), 1)
+        np.add.at(out, (b, a), 1)
+
+    return out
+
+
+# --------------------------------------------------
+# Corpus Dictionary (dense IDs + bitsets)
+# --------------------------------------------------
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class SubtreeDictionary:
+    """
+    Maps every fingerprint seen in a corpus to a dense ID in
+    [0, len(dictionary)), ordered by fingerprint value
+    """
+
+    def __init__(self, arrays):
+        self.keys = (
+            np.unique(np.concatenate(arrays))
+            if len(arrays) else np.empty(0, dtype=np.int64)
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode(self, array):
+        """
+        Dense IDs of the fingerprints in `array`, dropping unknown ones
+        """
+        if len(self.keys) == 0 or len(array) == 0:
+            return np.empty(0, dtype=np.int32)
+
+        idx = np.searchsorted(self.keys, array)
+        idx[idx == len(self.keys)] = 0
+        return idx[self.keys[idx] == array].astype(np.int32)
+
+    def bitset(self, array):
+        bits = np.zeros(len(self.keys), dtype=bool)
+        bits[self.encode(array)] = True
+        return np.packbits(bits)
+
+    def bitsets(self, arrays):
+        """
+        One packed bitset row per array, as a 2-D uint8 matrix
+        """
+        bits = np.zeros((len(arrays), len(self.keys)), dtype=bool)
+        for row, array in enumerate(arrays):
+            bits[row, self.encode(array)] = True
+        return np.packbits(bits, axis=1)
+
+
+def bitset_intersections(query_bits, bitsets):
+    """
+    Popcount of query AND each bitset row (one-vs-many)
+    """
+    return _POPCOUNT[bitsets & query_bits].sum(axis=1, dtype=np.int64)
+
+
+def bitset_intersection_matrix(bitsets, max_bytes=64 * 2 ** 20):
+    """
+    Pairwise intersection counts of all bitset rows (many-vs-many),
+    processed in row blocks so temporaries stay under `max_bytes`
+    """
+    n, width = bitsets.shape
+    out = np.zeros((n, n), dtype=np.int64)
+    block = max(1, max_bytes // max(n * width, 1))
+
+    for start in range(0, n, block):
+        rows = bitsets[start:start + block]
+        both = rows[:, None, :] & bitsets[None, :, :]
+        out[start:start + block] = _POPCOUNT[both].sum(axis=2, dtype=np.int64)
+
+    return out
@@ -0,0 +1,139 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+from model.fingerprint_cache import CACHE_ENV, CACHE_MAX_ENV
+
+# Tests never touch an on-disk fingerprint cache
+os.environ.pop(CACHE_ENV, None)
+os.environ.pop(CACHE_MAX_ENV, None)
+
+from analysis.matrix_engine import score_matrix  # noqa: E402
+from model.corpus import pack_fingerprints  # noqa: E402
+from model.similarity_model import (  # noqa: E402
+    fingerprint_all, pair_similarity
+)
+
+BASES = {
+    "factorial": (
+        "def factorial(n):\n"
+        "    result = 1\n"
+        "    for i in range(2, n + 1):\n"
+        "        result *= i\n"
+        "    return result\n"
+    ),
+    "fibonacci": (
+        "def fib(n):\n"
+        "    a, b = 0, 1\n"
+        "    for _ in range(n):\n"
+        "        a, b = b, a + b\n"
+        "    return a\n"
+    ),
+    "prime_check": (
+        "def is_prime(n):\n"
+        "    if n < 2:\n"
+        "        return False\n"
+        "    i = 2\n"
+        "    while i * i <= n:\n"
+        "        if n % i == 0:\n"
+        "            return False\n"
+        "        i += 1\n"
+        "    return True\n"
+    ),
+    "max_element": (
+        "def max_element(xs):\n"
+        "    best = xs[0]\n"
+        "    for x in xs[1:]:\n"
+        "        if x > best:\n"
+        "            best = x\n"
+        "    return best\n"
+    ),
+}
+
+VARIANTS = 6
+
+_KEEP = {"def", "return", "for", "in", "range", "if", "while", "False",
+         "True", "print", "class", "self", "and", "or", "not"}
+
+
+def _rename(code, suffix):
+    return re.sub(
+        r"\b[A-Za-z_]\w*\b",
+        lambda m: m.group(0) if m.group(0) in _KEEP
+        else f"{m.group(0)}_{suffix}",
+        code
+    )
+
+
+def _variant(base, k):
+    """
+    k-th submission of an assignment: renamed, padded with extra
+    statements and, for some, a helper borrowed from another assignment
+    """
+    names = sorted(BASES)
+    code = _rename(BASES[base], k) if k % 2 else BASES[base]
+    for j in range(k % 3):
+        code += f"\nvalue_{j} = {j * k}\nprint(value_{j} * 2)\n"
+    if k >= 4:
+        code += "\n" + BASES[names[(names.index(base) + k) % len(names)]]
+    return code
+
+
+def make_codes():
+    """
+    {name: code} for a small corpus: VARIANTS solutions per assignment,
+    plus an empty, an unparsable and a very deep file
+    """
+    codes = {}
+    for base in sorted(BASES):
+        for k in range(VARIANTS):
+            codes[f"{base}/{base}_solution_{k}.py"] = _variant(base, k)
+    codes["misc/empty.py"] = ""
+    codes["misc/broken.py"] = "def broken(:\n    return\n"
+    codes["misc/deep.py"] = "x = " + " + ".join(["a"] * 3000) + "\n"
+    return codes
+
+
+@pytest.fixture(scope="session")
+def codes():
+    return make_codes()
+
+
+@pytest.fixture(scope="session")
+def fingerprints(codes):
+    return fingerprint_all(codes)
+
+
+@pytest.fixture(scope="session")
+def corpus(fingerprints):
+    return pack_fingerprints(fingerprints)
+
+
+@pytest.fixture(scope="session")
+def reference(corpus):
+    """
+    Exact all-pairs final scores, the baseline every engine must match
+    """
+    return score_matrix(corpus)
+
+
+def brute_force(fingerprints):
+    """
+    Final scores from pair_similarity, one pair at a time
+    """
+    fps = list(fingerprints.values())
+    out = np.ones((len(fps), len(fps)))
+    for a in range(len(fps)):
+        for b in range(a + 1, len(fps)):
+            out[a, b] = out[b, a] = pair_similarity(fps[a], fps[b])[-1]
+    return out
+
+
+def upper_pairs(matrix, threshold):
+    """
+    Set of (i, j), i < j, whose score is >= threshold
+    """
+    i, j = np.nonzero(np.triu(matrix >= threshold, k=1))
+    return set(zip(i.tolist(), j.tolist()))
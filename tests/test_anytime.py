@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from analysis.anytime import anytime_scores, anytime_top_pairs
+from analysis.matrix_engine import top_pairs
+
+
+def assert_exact_top(top, corpus, reference, k):
+    index = {name: n for n, name in enumerate(corpus.names)}
+    expected = [score for _, _, score in top_pairs(reference, corpus.names, k)]
+
+    assert top["exact"].all()
+    np.testing.assert_allclose(top["score"].values, expected, atol=1e-12)
+    for a, b, score in zip(top["file_a"], top["file_b"], top["score"]):
+        assert score == pytest.approx(reference[index[a], index[b]],
+                                      abs=1e-12)
+
+
+@pytest.mark.parametrize("top_k", [1, 10, 50])
+@pytest.mark.parametrize("chunk", [16, 4096])
+def test_final_snapshot_is_exact_top_k(codes, corpus, reference, top_k,
+                                       chunk):
+    snapshots = list(anytime_scores(codes, budget=60.0, top_k=top_k,
+                                    chunk=chunk))
+    last = snapshots[-1]
+    assert last["phase"] == "done"
+    assert last["completeness"] == 1.0
+    assert len(last["top"]) == top_k
+    assert_exact_top(last["top"], corpus, reference, top_k)
+
+
+def test_snapshots_progress(codes):
+    snapshots = list(anytime_scores(codes, budget=60.0, top_k=5, chunk=16))
+    phases = [s["phase"] for s in snapshots]
+    assert phases[0] in ("fingerprints", "estimate")
+    assert phases[-1] == "done"
+    assert set(phases[:-1]) <= {"fingerprints", "estimate", "exact"}
+
+    scored = [s["scored"] for s in snapshots]
+    assert scored == sorted(scored)
+    assert all(s["scored"] <= s["pairs"] for s in snapshots)
+
+
+def test_zero_budget_returns_estimates(codes):
+    snapshots = list(anytime_scores(codes, budget=0.0, top_k=5))
+    last = snapshots[-1]
+    assert last["phase"] == "deadline"
+    assert last["scored"] == 0
+    assert len(last["top"]) == 5
+    assert not last["top"]["exact"].any()
+
+
+def test_anytime_top_pairs(codes, corpus, reference):
+    last = anytime_top_pairs(codes, budget=60.0, top_k=10)
+    assert last["phase"] == "done"
+    assert_exact_top(last["top"], corpus, reference, 10)
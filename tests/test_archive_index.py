@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import analysis.archive_index as archive_index
+from analysis.archive_index import COLUMNS, ArchiveIndex
+from model.similarity_model import fingerprint, pair_similarity
+
+QUERIES = {
+    "novel": (
+        "def total(values):\n"
+        "    s = 0\n"
+        "    for v in values:\n"
+        "        s += v\n"
+        "    return s\n"
+    ),
+    "near_copy": (
+        "def fact(m):\n"
+        "    out = 1\n"
+        "    for j in range(2, m + 1):\n"
+        "        out *= j\n"
+        "    return out\n"
+        "print(fact(5))\n"
+    ),
+    "empty": "",
+}
+
+
+@pytest.fixture(scope="module")
+def index(codes):
+    return ArchiveIndex.build(codes)
+
+
+def brute_force_top(fingerprints, query, k):
+    fp = fingerprint(query)
+    scores = {
+        name: pair_similarity(fp, other)
+        for name, other in fingerprints.items()
+    }
+    best = sorted(scores.values(), key=lambda s: -s[-1])[:k]
+    return scores, [s[-1] for s in best]
+
+
+def assert_exact_top(top, fingerprints, query, k):
+    scores, best = brute_force_top(fingerprints, query, k)
+    assert list(top.columns) == COLUMNS
+    np.testing.assert_allclose(top["final"].values, best, atol=1e-12)
+    for name, row in top.iterrows():
+        np.testing.assert_allclose(row.values, scores[name], atol=1e-12)
+
+
+@pytest.mark.parametrize("query", sorted(QUERIES))
+@pytest.mark.parametrize("k", [1, 5, 100])
+def test_query_is_exact_top_k(index, fingerprints, query, k):
+    top = index.query(QUERIES[query], k)
+    assert len(top) == min(k, len(fingerprints))
+    assert_exact_top(top, fingerprints, QUERIES[query], k)
+
+
+def test_archived_file_finds_itself(index, codes):
+    name = "prime_check/prime_check_solution_2.py"
+    top = index.query(codes[name], 3)
+    assert name in top.index
+    assert top["final"].iloc[0] == pytest.approx(1.0)
+
+
+def test_pruning_skips_documents(codes, fingerprints, monkeypatch):
+    monkeypatch.setattr(archive_index, "FIRST_ROUND", 2)
+    index = ArchiveIndex.build(codes)
+    top = index.query(QUERIES["near_copy"], 2)
+    assert top.attrs["scored"] < len(codes)
+    assert_exact_top(top, fingerprints, QUERIES["near_copy"], 2)
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "nested" / "archive.idx")
+    index.save(path)
+    loaded = ArchiveIndex.load(path)
+    assert len(loaded) == len(index)
+    np.testing.assert_array_equal(loaded.posting_docs, index.posting_docs)
+    for query in QUERIES.values():
+        expected = index.query(query, 5)
+        got = loaded.query(query, 5)
+        assert list(got.index) == list(expected.index)
+        np.testing.assert_array_equal(got.values, expected.values)
+
+
+def test_load_rejects_other_node_types(index, tmp_path, monkeypatch):
+    path = str(tmp_path / "archive.idx")
+    index.save(path)
+    monkeypatch.setattr(archive_index, "NODE_TYPES",
+                        archive_index.NODE_TYPES + ("Extra",))
+    with pytest.raises(ValueError, match="node-type"):
+        ArchiveIndex.load(path)
+
+
+def test_empty_archive():
+    index = ArchiveIndex.build({})
+    assert len(index.query(QUERIES["novel"], 5)) == 0
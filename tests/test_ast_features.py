@@ -0,0 +1,156 @@
+import ast
+import os
+
+import pytest
+
+from syntactic.ast_features import extract_ast_features, parse_code
+from syntactic.ast_subtree_analysis import canonical_subtree
+
+SUBMISSIONS = os.path.join(os.path.dirname(__file__), "..", "data",
+                           "submissions")
+
+EDGE_CASES = {
+    "empty": "",
+    "expression": "1",
+    "pass": "def f():\n    pass\n",
+    "return_none": "def f():\n    return\n",
+    "nested": (
+        "class A:\n"
+        "    def f(self):\n"
+        "        def g(x):\n"
+        "            return lambda y: [x + y for _ in range(3)]\n"
+        "        return g\n"
+    ),
+    "decorated": "@a\n@b(1)\ndef f(*args, k=2, **kw):\n    yield from args\n",
+    "control_flow": (
+        "try:\n    x = 1\nexcept (A, B) as e:\n    raise\n"
+        "else:\n    pass\nfinally:\n    del x\n"
+        "while x:\n    if y:\n        break\n    continue\n"
+    ),
+    "match": (
+        "match p:\n"
+        "    case [1, *rest]:\n        pass\n"
+        "    case {'k': v, **kw} if v:\n        pass\n"
+        "    case Point(x=0) | None:\n        pass\n"
+    ),
+    "strings": "s = f'{a!r:>{w}}' + b'x' + 'y'\n",
+    "comprehensions": "{k: v for k, v in d.items() if k}; {*a, *b}; (i async for i in x)\n",
+    "async": "async def f():\n    async with a as b:\n        await b\n",
+    "deep": "x = " + "(" * 150 + "1" + ")" * 150 + " + y\n",
+    "long_chain": "x = " + " + ".join(["a"] * 300) + "\n",
+}
+
+
+class RecursiveExtractor(ast.NodeVisitor):
+    """
+    The extractor extract_ast_features replaced: node-type counts and
+    max depth from a recursive NodeVisitor walk
+    """
+
+    def __init__(self):
+        self.counter = {}
+        self.depth = 0
+        self.max_depth = 0
+
+    def generic_visit(self, node):
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        name = type(node).__name__
+        self.counter[name] = self.counter.get(name, 0) + 1
+        super().generic_visit(node)
+        self.depth -= 1
+
+
+def _corpus_trees():
+    trees = []
+    for dirpath, _, filenames in os.walk(SUBMISSIONS):
+        for fname in sorted(filenames):
+            if fname.endswith(".py"):
+                with open(os.path.join(dirpath, fname),
+                          encoding="utf-8", errors="ignore") as f:
+                    tree = parse_code(f.read())
+                if tree is not None:
+                    trees.append(tree)
+    return trees
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    trees = _corpus_trees()
+    assert trees
+    return trees
+
+
+@pytest.fixture(scope="module")
+def edge_cases():
+    return [ast.parse(code) for code in EDGE_CASES.values()]
+
+
+def _assert_one_to_one(trees):
+    rep_to_digest = {}
+    digest_to_rep = {}
+    for tree in trees:
+        for node in ast.walk(tree):
+            rep = canonical_subtree(node)
+            digest = extract_ast_features(node).root
+            assert rep_to_digest.setdefault(rep, digest) == digest
+            assert digest_to_rep.setdefault(digest, rep) == rep
+    return len(rep_to_digest)
+
+
+def test_merkle_ids_match_canonical_strings_on_corpus(corpus):
+    assert _assert_one_to_one(corpus) > 50
+
+
+def test_merkle_ids_match_canonical_strings_on_edge_cases(edge_cases):
+    _assert_one_to_one(edge_cases)
+
+
+def test_subtree_map_is_every_canonical_subtree(corpus, edge_cases):
+    for tree in corpus[:50] + edge_cases:
+        features = extract_ast_features(tree)
+        assert len(features.subtrees) == len({
+            canonical_subtree(node) for node in ast.walk(tree)
+        })
+
+
+def _assert_same_counts(tree):
+    reference = RecursiveExtractor()
+    reference.visit(tree)
+    features = extract_ast_features(tree)
+    assert dict(features.counter) == reference.counter
+    assert features.max_depth == reference.max_depth
+    assert features.nodes_visited == sum(reference.counter.values())
+
+
+def test_counts_and_depth_match_recursive_extractor_on_corpus(corpus):
+    for tree in corpus:
+        _assert_same_counts(tree)
+
+
+@pytest.mark.parametrize("name", sorted(EDGE_CASES))
+def test_counts_and_depth_match_recursive_extractor_on_edge_cases(name):
+    _assert_same_counts(ast.parse(EDGE_CASES[name]))
+
+
+def _root(code):
+    return extract_ast_features(ast.parse(code)).root
+
+
+def test_identifiers_and_constants_do_not_change_ids():
+    assert _root("a + 1") == _root("b + 2")
+    assert _root("f(x, 'y')") == _root("g(z, 3)")
+
+
+def test_structure_changes_ids():
+    assert _root("a + b") != _root("a - b")
+    assert _root("f(a)") != _root("f(a, b)")
+    assert _root("[a, [b]]") != _root("[[a], b]")
+
+
+def test_unparsable_source_has_empty_features():
+    assert parse_code("def broken(:\n") is None
+    features = extract_ast_features(None)
+    assert not features.counter
+    assert features.max_depth == 0
+    assert features.subtrees == {}
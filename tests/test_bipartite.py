@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from analysis.bipartite import (
+    best_matches, bipartite_scores, bipartite_similarity, cross_matrix,
+    main, pack_cohorts, top_cross_pairs
+)
+from model.similarity_model import pair_similarity
+
+
+@pytest.fixture(scope="module")
+def cohorts(fingerprints):
+    names = list(fingerprints)
+    cohort_a = {name: fingerprints[name] for name in names[::2]}
+    cohort_b = {name: fingerprints[name] for name in names[1::2]}
+    # A name may sit in both cohorts
+    cohort_b[names[0]] = fingerprints[names[0]]
+    return cohort_a, cohort_b
+
+
+def brute_cross(cohort_a, cohort_b):
+    return np.array([
+        [pair_similarity(fa, fb)[-1] for fb in cohort_b.values()]
+        for fa in cohort_a.values()
+    ])
+
+
+@pytest.mark.parametrize("block", [1, 5, 512])
+def test_cross_matrix_matches_brute_force(cohorts, block):
+    a, b = pack_cohorts(*cohorts)
+    assert a.names == list(cohorts[0])
+    assert b.names == list(cohorts[1])
+    np.testing.assert_allclose(cross_matrix(a, b, block),
+                               brute_cross(*cohorts), atol=1e-12)
+
+
+def test_cross_matrix_matches_reference_block(corpus, reference,
+                                              fingerprints):
+    names = list(fingerprints)
+    rows, cols = np.arange(0, 10), np.arange(10, len(names))
+    a, b = pack_cohorts({names[r]: fingerprints[names[r]] for r in rows},
+                        {names[c]: fingerprints[names[c]] for c in cols})
+    np.testing.assert_allclose(cross_matrix(a, b),
+                               reference[np.ix_(rows, cols)], atol=1e-12)
+
+
+@pytest.mark.parametrize("k", [1, 7, 1000])
+def test_top_cross_pairs(k):
+    rng = np.random.default_rng(0)
+    matrix = rng.random((6, 9))
+    matrix[2, 3] = matrix[4, 1] = 2.0
+    names_a = [f"a{r}" for r in range(6)]
+    names_b = [f"b{c}" for c in range(9)]
+
+    top = top_cross_pairs(matrix, names_a, names_b, k)
+    expected = sorted(
+        ((names_a[r], names_b[c], matrix[r, c])
+         for r in range(6) for c in range(9)),
+        key=lambda cell: -cell[2]
+    )[:k]
+    assert top == expected
+    assert top[:2] == [("a2", "b3", 2.0), ("a4", "b1", 2.0)][:k]
+
+
+def test_best_matches():
+    matrix = np.array([[0.1, 0.9], [0.8, 0.2], [0.3, 0.3]])
+    best = best_matches(matrix, ["x", "y", "z"], ["p", "q"])
+    assert list(best["file"]) == ["x", "y", "z"]
+    assert list(best["closest"]) == ["q", "p", "p"]
+    assert list(best["score"]) == [0.9, 0.8, 0.3]
+
+    assert best_matches(np.empty((0, 2)), [], ["p", "q"]).empty
+    assert top_cross_pairs(np.empty((0, 2)), [], ["p", "q"]) == []
+
+
+def test_bipartite_scores(cohorts):
+    result = bipartite_scores(*cohorts, top_k=5)
+    brute = brute_cross(*cohorts)
+    np.testing.assert_allclose(result["matrix"].values, brute, atol=1e-12)
+    assert [s for _, _, s in result["top"]] == pytest.approx(
+        sorted(brute.ravel(), reverse=True)[:5], abs=1e-12
+    )
+    np.testing.assert_allclose(result["best"]["score"].values,
+                               np.sort(brute.max(axis=1))[::-1], atol=1e-12)
+
+    report = result["report"]
+    n = len(cohorts[0]) + len(cohorts[1])
+    assert report["pairs"] == brute.size
+    assert report["pairs_all"] == n * (n - 1) // 2
+
+
+def test_bipartite_similarity_and_cli(tmp_path, capsys, codes):
+    names = list(codes)[:6]
+    for cohort, picked in (("new", names[:3]), ("old", names[3:])):
+        for name in picked:
+            path = tmp_path / cohort / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(codes[name], encoding="utf-8")
+
+    result = bipartite_similarity({n: codes[n] for n in names[:3]},
+                                  {n: codes[n] for n in names[3:]}, 4)
+    main([str(tmp_path / "new"), str(tmp_path / "old"), "--top-k", "4"])
+    out = capsys.readouterr().out
+    assert "3 x 3 files" in out
+    for _, _, score in result["top"]:
+        assert f"{score:.3f}" in out
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from analysis.cascade import (
+    STAGES, Cascade, cascade_similarity, height_histograms
+)
+from analysis.matrix_engine import component_matrices
+from conftest import brute_force, upper_pairs
+
+THRESHOLDS = [0.4, 0.7, 0.9]
+
+
+def assert_exact(i, j, scores, reference, threshold):
+    assert set(zip(i.tolist(), j.tolist())) == upper_pairs(reference,
+                                                           threshold)
+    np.testing.assert_allclose(scores, reference[i, j], atol=1e-12)
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+@pytest.mark.parametrize("batch", [7, 65536])
+def test_score_all_matches_brute_force(corpus, fingerprints, threshold,
+                                       batch):
+    cascade = Cascade(corpus, threshold)
+    i, j, scores = cascade.score_all(batch)
+    assert_exact(i, j, scores, brute_force(fingerprints), threshold)
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_score_listed_pairs(corpus, reference, threshold):
+    rows, cols = np.triu_indices(len(corpus), k=1)
+    keep = (rows + cols) % 3 > 0
+    i, j, scores = Cascade(corpus, threshold).score(rows[keep], cols[keep])
+
+    listed = set(zip(rows[keep].tolist(), cols[keep].tolist()))
+    assert set(zip(i.tolist(), j.tolist())) == (
+        upper_pairs(reference, threshold) & listed
+    )
+    np.testing.assert_allclose(scores, reference[i, j], atol=1e-12)
+
+
+def test_score_nothing(corpus):
+    i, j, scores = Cascade(corpus).score([], [])
+    assert len(i) == len(j) == len(scores) == 0
+
+
+def test_height_histograms_bound_shared_subtrees(corpus):
+    hist = height_histograms(corpus)
+    assert (hist.sum(axis=1) == corpus.subtree_sizes()).all()
+
+    shared = (corpus.subtree_matrix() @ corpus.subtree_matrix().T).toarray()
+    most = np.minimum(hist[:, None, :], hist[None, :, :]).sum(axis=2)
+    assert (shared <= most).all()
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_report_accounts_for_every_pair(corpus, threshold):
+    cascade = Cascade(corpus, threshold)
+    i, _, _ = cascade.score_all()
+    report = cascade.report()
+
+    n = len(corpus)
+    assert report["pairs"] == n * (n - 1) // 2
+    assert report["results"] == len(i)
+    stages = report["stages"]
+    assert [s["stage"] for s in stages] == list(STAGES)
+    for before, after in zip(stages, stages[1:]):
+        assert after["evaluated"] == before["evaluated"] - before["pruned"]
+
+
+def test_zero_threshold_scores_every_pair(corpus):
+    exact = component_matrices(corpus)
+    cascade = Cascade(corpus, 0.0)
+    rows, cols = np.triu_indices(len(corpus), k=1)
+    _, _, scores = cascade.score(rows, cols)
+    np.testing.assert_allclose(scores, exact["final"][rows, cols],
+                               atol=1e-12)
+
+
+def test_cascade_similarity_names(codes, corpus, reference):
+    pairs, report = cascade_similarity(codes, 0.7)
+    index = {name: k for k, name in enumerate(corpus.names)}
+    found = {tuple(sorted((index[a], index[b]))) for a, b in pairs}
+    assert found == upper_pairs(reference, 0.7)
+    assert report["results"] == len(pairs)
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from analysis.lsh_candidates import (
+    band_pairs, choose_bands, collision_probability, lsh_candidates,
+    lsh_similarity_pairs, measure_recall, minhash_signatures, splitmix64,
+    token_shingles
+)
+from conftest import upper_pairs
+
+
+def test_splitmix64_is_deterministic_and_spreads():
+    x = np.arange(1000, dtype=np.uint64)
+    assert np.array_equal(splitmix64(x), splitmix64(x.copy()))
+    assert len(np.unique(splitmix64(x))) == len(x)
+
+
+def test_token_shingles_ignore_renaming():
+    a = "def f(a, b):\n    return a + b\n"
+    b = "def g(x, y):\n    return x + y\n"
+    assert np.array_equal(token_shingles(a), token_shingles(b))
+    assert len(token_shingles("")) == 0
+
+
+def test_minhash_estimates_jaccard():
+    values = np.concatenate([np.arange(0, 300), np.arange(100, 400)])
+    indptr = np.array([0, 300, 600, 600])
+    sig = minhash_signatures(indptr, values, num_perm=512)
+    agree = np.mean(sig[0] == sig[1])
+    assert abs(agree - 200 / 400) < 0.1
+    assert (sig[2] == np.iinfo(np.uint64).max).all()
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 0.8])
+@pytest.mark.parametrize("recall", [0.9, 0.99])
+def test_choose_bands_meets_recall(threshold, recall):
+    bands, rows = choose_bands(threshold, recall, 128)
+    assert bands * rows <= 128
+    assert collision_probability(threshold, bands, rows) >= recall
+    if rows < 128:
+        more = rows + 1
+        assert collision_probability(threshold, 128 // more, more) < recall
+
+
+def test_band_pairs_match_brute_force():
+    rng = np.random.default_rng(0)
+    sig = rng.integers(0, 3, size=(40, 8)).astype(np.uint64)
+    bands, rows = 4, 2
+    expected = {
+        (a, b)
+        for a in range(len(sig)) for b in range(a + 1, len(sig))
+        if any(np.array_equal(sig[a, s * rows:(s + 1) * rows],
+                              sig[b, s * rows:(s + 1) * rows])
+               for s in range(bands))
+    }
+    i, j = band_pairs(sig, bands, rows)
+    assert set(zip(i.tolist(), j.tolist())) == expected
+
+    active = np.arange(0, 40, 2)
+    i, j = band_pairs(sig, bands, rows, active=active)
+    assert set(zip(i.tolist(), j.tolist())) == {
+        (a, b) for a, b in expected if a % 2 == 0 and b % 2 == 0
+    }
+
+
+def test_candidates_are_unique_upper_pairs(codes, corpus):
+    i, j, _ = lsh_candidates(codes, corpus)
+    assert (i < j).all()
+    assert len(set(zip(i.tolist(), j.tolist()))) == len(i)
+
+
+def test_high_scoring_pairs_are_candidates(codes, corpus, reference):
+    i, j, _ = lsh_candidates(codes, corpus)
+    kept = set(zip(i.tolist(), j.tolist()))
+    assert upper_pairs(reference, 0.9) <= kept
+    positives = upper_pairs(reference, 0.7)
+    assert len(positives & kept) / len(positives) >= 0.95
+
+
+def test_measure_recall_agrees_with_candidates(codes, reference):
+    stats = measure_recall(codes, 0.7)
+    positives = upper_pairs(reference, 0.7)
+    assert stats["positives"] == len(positives)
+    assert stats["recall"] >= 0.95
+    assert stats["pairs"] == len(codes) * (len(codes) - 1) // 2
+
+
+def test_similarity_pairs_are_exact(codes, corpus, reference):
+    pairs, report = lsh_similarity_pairs(codes)
+    assert report["candidates"] == len(pairs) > 0
+    assert report["pruned"] == report["pairs"] - len(pairs)
+
+    index = {name: k for k, name in enumerate(corpus.names)}
+    for (a, b), score in pairs.items():
+        assert score == pytest.approx(reference[index[a], index[b]],
+                                      abs=1e-12)
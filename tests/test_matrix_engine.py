@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from analysis.matrix_engine import (
+    component_matrices, pair_components, pair_scores, score_block,
+    score_pairs, similarity_dataframe, top_pairs
+)
+from model.similarity_model import pair_similarity
+
+from conftest import brute_force
+
+COMPONENTS = ["lexical", "ast_global", "ast_subtree", "ast_hybrid", "style",
+              "final"]
+
+
+def test_score_matrix_matches_pair_similarity(fingerprints, reference):
+    np.testing.assert_allclose(reference, brute_force(fingerprints),
+                               rtol=0, atol=1e-12)
+
+
+def test_components_match_pair_similarity(fingerprints, corpus):
+    comps = component_matrices(corpus)
+    fps = list(fingerprints.values())
+    for a in range(0, len(fps), 3):
+        for b in range(len(fps)):
+            if a == b:
+                continue
+            expected = pair_similarity(fps[a], fps[b])
+            for k, name in enumerate(COMPONENTS):
+                assert comps[name][a, b] == pytest.approx(expected[k],
+                                                          abs=1e-12)
+
+
+def test_blocks_and_pairs_agree_with_matrix(corpus, reference):
+    block = score_block(corpus.rows(np.arange(5, 12)), corpus)
+    # score_block leaves the diagonal as computed; score_matrix fixes it
+    off = np.arange(len(corpus))[None, :] != np.arange(5, 12)[:, None]
+    np.testing.assert_array_equal(block[off], reference[5:12][off])
+
+    i, j = np.triu_indices(len(corpus), k=1)
+    np.testing.assert_array_equal(score_pairs(corpus, i, j), reference[i, j])
+    small = pair_components(corpus, i, j, batch=7)
+    full = component_matrices(corpus)
+    for name in COMPONENTS:
+        np.testing.assert_array_equal(small[name], full[name][i, j])
+
+
+def test_similarity_dataframe(codes, reference):
+    df = similarity_dataframe(codes)
+    assert list(df.index) == list(codes)
+    np.testing.assert_array_equal(df.values, reference)
+
+
+def test_pair_scores_and_top_pairs(corpus, reference):
+    names = corpus.names
+    scores = pair_scores(reference, names)
+    assert len(scores) == len(names) * (len(names) - 1) // 2
+    assert all(key == tuple(sorted(key)) for key in scores)
+
+    top = top_pairs(reference, names, k=5)
+    best = sorted(scores.values(), reverse=True)[:5]
+    assert [s for _, _, s in top] == best
+
+
+def test_pair_scores_skip_nan(corpus, reference):
+    matrix = reference.copy()
+    matrix[0, 1] = matrix[1, 0] = np.nan
+    scores = pair_scores(matrix, corpus.names)
+    assert tuple(sorted(corpus.names[:2])) not in scores
+    assert len(scores) == len(corpus) * (len(corpus) - 1) // 2 - 1
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pytest
+
+from analysis.matrix_engine import pair_scores
+from analysis.partitioned_matrix import (
+    UNGROUPED, directory_groups, load_manifest, manifest_groups,
+    partitioned_scores, partitioned_similarity, pattern_groups
+)
+
+
+def test_directory_groups():
+    names = ["a/x.py", "a/y.py", "b/z.py", "top.py"]
+    assert directory_groups(names) == ["a", "a", "b", UNGROUPED]
+
+
+def test_pattern_groups():
+    names = ["hw1_solution_3.py", "dir/hw2_solution_10.py", "notes.py"]
+    assert pattern_groups(names) == ["hw1", "hw2", UNGROUPED]
+    assert pattern_groups(names, r"^hw\d") == ["hw1", "hw2", UNGROUPED]
+
+
+@pytest.mark.parametrize("kind", ["json", "csv"])
+def test_manifest_round_trip(tmp_path, kind):
+    manifest = {"a/x.py": "one", "y.py": "two"}
+    path = tmp_path / f"manifest.{kind}"
+    if kind == "json":
+        path.write_text(json.dumps(manifest), encoding="utf-8")
+    else:
+        path.write_text(
+            "file,group\n" + "".join(f"{k},{v}\n" for k, v in manifest.items()),
+            encoding="utf-8"
+        )
+
+    loaded = load_manifest(str(path))
+    assert loaded == manifest
+    with open(path, encoding="utf-8") as f:
+        assert load_manifest(f) == manifest
+
+    names = ["a/x.py", "b/y.py", "c/z.py"]
+    assert manifest_groups(names, loaded) == ["one", "two", UNGROUPED]
+
+
+@pytest.fixture(scope="module")
+def labels(corpus):
+    return directory_groups(corpus.names)
+
+
+@pytest.fixture(scope="module")
+def result(corpus, labels):
+    return partitioned_scores(corpus, labels, top_k=5)
+
+
+def test_within_group_blocks_match_reference(corpus, reference, labels,
+                                             result):
+    labels = np.asarray(labels, dtype=object)
+    assert sorted(result["groups"]) == sorted(set(labels))
+    for g, df in result["groups"].items():
+        idx = np.flatnonzero(labels == g)
+        assert list(df.index) == [corpus.names[d] for d in idx]
+        np.testing.assert_allclose(df.values, reference[np.ix_(idx, idx)],
+                                   atol=1e-12)
+
+
+def test_uncompared_pairs_are_nan(corpus, reference, labels, result):
+    labels = np.asarray(labels, dtype=object)
+    combined = result["combined"].values
+    same = labels[:, None] == labels[None, :]
+
+    assert np.isnan(combined[~same]).all()
+    np.testing.assert_allclose(combined[same], reference[same], atol=1e-12)
+
+    scores = pair_scores(combined, corpus.names)
+    n_within = result["report"]["pairs_within"]
+    assert len(scores) == n_within
+
+
+def test_top_pairs_and_report(corpus, labels, result):
+    n = len(corpus)
+    counts = {g: labels.count(g) for g in set(labels)}
+    report = result["report"]
+    assert report["pairs"] == n * (n - 1) // 2
+    assert report["pairs_within"] == sum(c * (c - 1) // 2
+                                         for c in counts.values())
+    assert report["pairs_cross_sampled"] == 0
+
+    within = [score for pairs in result["top_pairs"].values()
+              for _, _, score in pairs]
+    assert [score for _, _, score in result["top"]] == sorted(
+        within, reverse=True
+    )[:5]
+
+
+def test_cross_check_fills_sampled_pairs(corpus, reference, labels):
+    result = partitioned_scores(corpus, labels, cross_samples=2,
+                                cross_threshold=0.5)
+    combined = result["combined"].values
+    labels = np.asarray(labels, dtype=object)
+    cross = ~np.isnan(combined) & (labels[:, None] != labels[None, :])
+
+    assert cross.sum() == 2 * result["report"]["pairs_cross_sampled"] > 0
+    np.testing.assert_allclose(combined[cross], reference[cross], atol=1e-12)
+    flagged = result["cross_check"]
+    assert (flagged["score"] >= 0.5).all()
+    assert (flagged["group_a"] != flagged["group_b"]).all()
+
+
+def test_partitioned_similarity_by_pattern(codes):
+    result = partitioned_similarity(codes, by="pattern")
+    assert UNGROUPED in result["groups"]
+    assert len(result["groups"]) == 5
+
+    with pytest.raises(ValueError):
+        partitioned_similarity(codes, by="nonsense")
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from analysis.matrix_engine import top_pairs
+from analysis.sharding import (
+    main, merge_shards, run_local, run_shard, shard_path, shard_plan
+)
+from model.corpus import save_corpus
+from model.corpus_snapshot import write_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module", params=["npz", "bin"])
+def snapshot(request, tmp_path_factory, corpus):
+    path = str(tmp_path_factory.mktemp("snapshot") /
+               f"corpus.{request.param}")
+    if request.param == "npz":
+        save_corpus(corpus, path)
+    else:
+        write_snapshot(corpus, path)
+    return path
+
+
+def run_all(snapshot, shards, out_dir, tile_size=4, top_k=50):
+    return [run_shard(snapshot, s, shards, str(out_dir), tile_size, top_k)
+            for s in range(shards)]
+
+
+def test_plan_covers_every_tile_once(corpus):
+    plan = shard_plan(corpus, 3, 4)
+    tiles = [tile for shard in plan for tile in shard]
+    assert len(plan) == 3
+    assert len(tiles) == len(set(tiles))
+    assert plan == shard_plan(corpus, 3, 4)
+
+
+@pytest.mark.parametrize("shards", [1, 3, 5])
+def test_merged_shards_match_score_matrix(tmp_path, snapshot, corpus,
+                                          reference, shards):
+    paths = run_all(snapshot, shards, tmp_path)
+    merged = merge_shards(paths, top_k=20, threshold=None)
+
+    assert merged["names"] == corpus.names
+    np.testing.assert_allclose(merged["matrix"].values, reference,
+                               atol=1e-12)
+    assert merged["top_pairs"] == top_pairs(reference, corpus.names, 20)
+    assert merged["clusters"] is None
+
+
+def test_merge_top_pairs_only(tmp_path, snapshot, corpus, reference):
+    merged = merge_shards(run_all(snapshot, 2, tmp_path), top_k=10,
+                          matrix=False)
+    assert merged["matrix"] is None
+    assert merged["top_pairs"] == top_pairs(reference, corpus.names, 10)
+
+
+def test_merge_clusters(tmp_path, snapshot):
+    pytest.importorskip("matplotlib")
+    merged = merge_shards(run_all(snapshot, 2, tmp_path), top_k=10)
+    members = sorted(name for group in merged["clusters"].values()
+                     for name in group)
+    assert members == sorted(merged["names"])
+
+
+def test_merge_rejects_incomplete_or_mixed_runs(tmp_path, snapshot):
+    paths = run_all(snapshot, 3, tmp_path / "three")
+    with pytest.raises(ValueError, match="Expected shards"):
+        merge_shards(paths[:2], top_k=10)
+    with pytest.raises(ValueError, match="Expected shards"):
+        merge_shards(paths + paths[:1], top_k=10)
+
+    other = run_all(snapshot, 2, tmp_path / "two")
+    with pytest.raises(ValueError, match="disagree on shards"):
+        merge_shards(paths[:1] + other[1:], top_k=10)
+    with pytest.raises(ValueError, match="top_k"):
+        merge_shards(paths, top_k=1000)
+    with pytest.raises(ValueError, match="No shard results"):
+        merge_shards([])
+    with pytest.raises(ValueError, match="out of range"):
+        run_shard(snapshot, 3, 3, str(tmp_path))
+
+
+def test_merge_cli(tmp_path, snapshot, corpus, reference, capsys):
+    out_dir = tmp_path / "nested" / "out"
+    run_all(snapshot, 2, out_dir)
+    # A leftover result of a run with another shard count is ignored
+    run_shard(snapshot, 0, 3, str(out_dir), 4, 50)
+
+    main(["merge", str(out_dir), "2", "--top-k", "3"])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [f"{score:.3f}  {a}  {b}"
+                     for a, b, score in top_pairs(reference, corpus.names, 3)]
+
+    with pytest.raises(SystemExit):
+        main(["merge", str(out_dir), "4"])
+    assert "missing shard results" in capsys.readouterr().err
+
+
+def test_run_local_processes(tmp_path, snapshot, corpus, reference,
+                             monkeypatch):
+    monkeypatch.chdir(ROOT)
+    paths = run_local(snapshot, 2, str(tmp_path / "local"), tile_size=8,
+                      top_k=20)
+    assert paths == [shard_path(str(tmp_path / "local"), s, 2)
+                     for s in range(2)]
+
+    merged = merge_shards(paths, top_k=20, threshold=None)
+    np.testing.assert_allclose(merged["matrix"].values, reference,
+                               atol=1e-12)
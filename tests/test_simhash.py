@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import analysis.simhash as simhash
+from analysis.matrix_engine import component_matrices
+from analysis.simhash import (
+    choose_tables, corpus_signatures, hamming, hamming_cosine,
+    hamming_radius, measure, prefix_pairs, simhash_candidates
+)
+from conftest import upper_pairs
+
+
+@pytest.fixture(scope="module")
+def signatures(corpus):
+    return corpus_signatures(corpus)
+
+
+@pytest.fixture(scope="module")
+def exact(corpus):
+    return component_matrices(corpus)
+
+
+def popcount_loop(a, b):
+    return np.array([
+        sum(bin(int(x) ^ int(y)).count("1") for x, y in zip(ra, rb))
+        for ra, rb in zip(a, b)
+    ])
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_hamming_matches_loop(monkeypatch, native):
+    if not native:
+        monkeypatch.delattr(np, "bitwise_count", raising=False)
+    elif not hasattr(np, "bitwise_count"):
+        pytest.skip("numpy without bitwise_count")
+
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 2 ** 63, size=(50, 4), dtype=np.uint64) << np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=(50, 4), dtype=np.uint64)
+    distance = simhash.hamming(a, b)
+    assert np.array_equal(distance, popcount_loop(a, b))
+
+
+def test_signatures_are_stable(corpus, signatures):
+    again = corpus_signatures(corpus)
+    for component, sig in signatures.items():
+        assert sig.shape == (len(corpus), simhash.BITS // 64)
+        assert np.array_equal(sig, again[component])
+
+
+@pytest.mark.parametrize("component", ["lexical", "ast_global"])
+def test_hamming_estimates_cosine(signatures, exact, component):
+    sig = signatures[component]
+    rows, cols = np.triu_indices(len(sig), k=1)
+    estimate = hamming_cosine(hamming(sig[rows], sig[cols]))
+    truth = exact[component][rows, cols]
+    assert np.mean(np.abs(estimate - truth)) < 0.1
+
+
+def test_parameters():
+    tables, prefix = choose_tables(0.9, 0.95)
+    assert 1 <= tables <= simhash.MAX_TABLES
+    assert 0 <= hamming_radius(0.9) < hamming_radius(0.8) <= simhash.BITS
+
+
+def test_prefix_pairs_match_brute_force(signatures):
+    sig = signatures["ast_global"]
+    tables, prefix = 3, 12
+    bits = np.unpackbits(sig.view(np.uint8), axis=1, bitorder="little")
+    rng = np.random.default_rng(0)
+    columns = [rng.permutation(bits.shape[1])[:prefix]
+               for _ in range(tables)]
+    expected = {
+        (a, b)
+        for a in range(len(sig)) for b in range(a + 1, len(sig))
+        if any(np.array_equal(bits[a, c], bits[b, c]) for c in columns)
+    }
+    i, j = prefix_pairs(sig, tables, prefix)
+    assert set(zip(i.tolist(), j.tolist())) == expected
+
+
+@pytest.mark.parametrize("cosine", [0.8, 0.9, 0.95])
+def test_candidates_within_radius(signatures, cosine):
+    sig = signatures["lexical"]
+    i, j, report = simhash_candidates(sig, cosine)
+    assert (i < j).all()
+    assert report["candidates"] == len(i) <= report["bucketed"]
+    assert (hamming(sig[i], sig[j]) <= report["radius"]).all()
+
+
+@pytest.mark.parametrize("component", ["lexical", "ast_global"])
+def test_identical_vectors_always_found(corpus, signatures, exact,
+                                        component):
+    norms = {"lexical": corpus.token_norms, "ast_global": corpus.ast_norms}
+    active = np.flatnonzero(norms[component] > 0)
+    i, j, _ = simhash_candidates(signatures[component], 0.9, active=active)
+    same = upper_pairs(exact[component], 1 - 1e-9)
+    assert same
+    assert same <= set(zip(i.tolist(), j.tolist()))
+
+
+@pytest.mark.parametrize("cosine", [0.8, 0.9])
+def test_measure_recall(codes, cosine):
+    for report in measure(codes, cosine).values():
+        assert report["positives"] > 0
+        assert report["recall"] >= 0.9
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import analysis.similarity_join as similarity_join_module
+from analysis.matrix_engine import component_matrices
+from analysis.similarity_join import (
+    OrderedSets, cosine_join, overlap_join, similarity_join, threshold_join
+)
+from conftest import upper_pairs
+
+THRESHOLDS = [0.4, 0.5, 0.7, 0.9, 0.95]
+
+
+@pytest.fixture(scope="module")
+def components(corpus):
+    return component_matrices(corpus)
+
+
+@pytest.fixture
+def join_only(monkeypatch):
+    """
+    Never fall back to scoring the whole matrix
+    """
+    monkeypatch.setattr(similarity_join_module, "MAX_JOIN_SHARE", 1.0)
+    monkeypatch.setattr(similarity_join_module, "MAX_POSTINGS_PER_PAIR",
+                        np.inf)
+
+
+def assert_exact(i, j, scores, reference, threshold):
+    assert set(zip(i.tolist(), j.tolist())) == upper_pairs(reference,
+                                                           threshold)
+    np.testing.assert_allclose(scores, reference[i, j], atol=1e-12)
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_threshold_join_matches_brute_force(corpus, reference, threshold):
+    i, j, scores, report = threshold_join(corpus, threshold)
+    assert report["results"] == len(i)
+    assert_exact(i, j, scores, reference, threshold)
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_join_mode_matches_brute_force(corpus, reference, join_only,
+                                       threshold):
+    i, j, scores, report = threshold_join(corpus, threshold)
+    assert report["mode"] == "join"
+    assert report["verified"] <= report["candidates"] <= report["pairs"]
+    assert_exact(i, j, scores, reference, threshold)
+
+
+@pytest.mark.parametrize("beta", [0.3, 0.6, 0.9, 1.0])
+def test_overlap_join_keeps_every_qualifying_pair(corpus, components, beta):
+    sets = OrderedSets(corpus.subtree_indptr, corpus.subtree_cols,
+                       len(corpus.subtree_vocab_heights))
+    i, j, _ = overlap_join(sets, beta)
+    assert (i < j).all()
+    assert upper_pairs(components["ast_subtree"], beta - 1e-9) <= set(
+        zip(i.tolist(), j.tolist())
+    )
+
+
+@pytest.mark.parametrize("alpha", [0.3, 0.6, 0.9, 1.0])
+def test_cosine_join_keeps_every_qualifying_pair(corpus, components, alpha):
+    norms = np.repeat(corpus.token_norms, np.diff(corpus.token_indptr))
+    tokens = OrderedSets(
+        corpus.token_indptr, corpus.token_cols, len(corpus.token_vocab),
+        weights=corpus.token_counts / np.where(norms > 0, norms, 1.0)
+    )
+    i, j, _ = cosine_join(tokens, alpha)
+    assert (i < j).all()
+    assert upper_pairs(components["lexical"], alpha - 1e-9) <= set(
+        zip(i.tolist(), j.tolist())
+    )
+
+
+def test_similarity_join_names(codes, corpus, reference):
+    pairs, report = similarity_join(codes, 0.7)
+    index = {name: k for k, name in enumerate(corpus.names)}
+    found = {tuple(sorted((index[a], index[b]))) for a, b in pairs}
+    assert found == upper_pairs(reference, 0.7)
+    for (a, b), score in pairs.items():
+        assert score == pytest.approx(reference[index[a], index[b]],
+                                      abs=1e-12)
+
+
+def test_nothing_above_one(corpus):
+    i, j, scores, _ = threshold_join(corpus, 1.5)
+    assert len(i) == len(j) == len(scores) == 0
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from analysis.matrix_engine import component_matrices
+from analysis.sketch_scoring import (
+    Sketches, approximate_matrix, approximate_similarity, bottom_k,
+    containment_epsilon, cosine_epsilon, rescore_above
+)
+from conftest import upper_pairs
+
+
+@pytest.fixture(scope="module", params=[4, 256])
+def sketches(request, corpus):
+    return Sketches(corpus, k=request.param)
+
+
+@pytest.fixture(scope="module")
+def approx(sketches):
+    return approximate_matrix(sketches)
+
+
+def test_bottom_k_keeps_smallest_hashes():
+    indptr = np.array([0, 5, 7, 7])
+    values = np.arange(7, dtype=np.uint64)
+    out_indptr, hashes, thresholds = bottom_k(indptr, values, 3)
+    assert list(out_indptr) == [0, 3, 5, 5]
+    assert (np.diff(hashes[:3]) > 0).all()
+    assert thresholds[0] == hashes[2]
+    assert thresholds[1] == thresholds[2] == np.iinfo(np.uint64).max
+
+
+def test_epsilons():
+    assert 0 < cosine_epsilon(512, 0.05) < cosine_epsilon(64, 0.05)
+    eps = containment_epsilon([0, 5, 10, 10], [10, 10, 10, 20], 0.05)
+    assert eps[0] == 1.0
+    assert eps[2] == 0.0
+    assert 0 < eps[3] < eps[1] < 1
+
+
+def test_sampled_matches_loop(sketches):
+    n = len(sketches)
+    docs, against = np.arange(n), np.arange(n)[::-1]
+    expected = np.array([
+        [
+            np.count_nonzero(
+                sketches.hashes[sketches.indptr[d]:sketches.indptr[d + 1]]
+                <= sketches.thresholds[a]
+            )
+            for a in against
+        ]
+        for d in docs
+    ])
+    assert np.array_equal(sketches.sampled(docs, against), expected)
+
+
+def test_full_sketches_give_exact_overlap(corpus):
+    sketches = Sketches(corpus, k=int(corpus.subtree_sizes().max()))
+    estimate, eps = sketches.subtree_overlap(np.arange(len(corpus)), 0.05)
+    exact = component_matrices(corpus)["ast_subtree"]
+    off = ~np.eye(len(corpus), dtype=bool)
+    np.testing.assert_allclose(estimate[off], exact[off], atol=1e-12)
+    assert (eps == 0).all()
+
+
+def test_exact_scores_inside_bounds(approx, reference):
+    rows, cols = np.triu_indices(len(reference), k=1)
+    exact = reference[rows, cols]
+    inside = (
+        (approx["lower"][rows, cols] <= exact + 1e-6) &
+        (exact <= approx["upper"][rows, cols] + 1e-6)
+    )
+    assert inside.mean() >= 1 - approx["epsilon"]["delta"]
+    assert (approx["lower"] <= approx["final"] + 1e-6).all()
+    assert (approx["final"] <= approx["upper"] + 1e-6).all()
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.7, 0.9])
+def test_rescore_above_keeps_every_pair_above(corpus, approx, reference,
+                                              threshold):
+    rescored = rescore_above(corpus, approx, threshold)
+    index = {name: k for k, name in enumerate(corpus.names)}
+    found = {tuple(sorted((index[a], index[b]))) for a, b in rescored}
+    assert upper_pairs(reference, threshold) <= found
+
+    for (a, b), score in rescored.items():
+        assert score == pytest.approx(reference[index[a], index[b]],
+                                      abs=1e-12)
+
+
+def test_approximate_similarity_frame(codes, corpus):
+    df, approx, packed = approximate_similarity(codes)
+    assert list(df.index) == list(corpus.names)
+    assert np.allclose(np.diag(df.values), 1.0)
+    assert df.values.shape == (len(codes), len(codes))
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from syntactic.subtree_ids import (
+    PackedSubtrees, SubtreeDictionary, bitset_intersection_matrix,
+    bitset_intersections, intersection_matrix, intersection_size,
+    intersection_sizes, subtree_overlap
+)
+
+
+@pytest.fixture
+def arrays():
+    # Small value range so sets overlap a lot; one empty set
+    rng = np.random.default_rng(5)
+    out = [
+        np.unique(rng.integers(-40, 40, size=rng.integers(1, 30)))
+        for _ in range(12)
+    ]
+    out.append(np.empty(0, dtype=np.int64))
+    out.append(np.array([np.iinfo(np.int64).min, np.iinfo(np.int64).max]))
+    return [a.astype(np.int64) for a in out]
+
+
+def brute_force(arrays):
+    sets = [set(a.tolist()) for a in arrays]
+    return np.array([[len(a & b) for b in sets] for a in sets])
+
+
+def test_intersection_size(arrays):
+    expected = brute_force(arrays)
+    for i, a in enumerate(arrays):
+        for j, b in enumerate(arrays):
+            assert intersection_size(a, b) == expected[i, j]
+
+
+def test_subtree_overlap():
+    a = np.array([1, 2, 3, 4], dtype=np.int64)
+    b = np.array([3, 4, 5], dtype=np.int64)
+    assert subtree_overlap(a, b) == pytest.approx(2 / 3)
+    assert subtree_overlap(a, np.empty(0, dtype=np.int64)) == 0.0
+
+
+def test_packed_subtrees(arrays):
+    packed = PackedSubtrees(arrays)
+    assert len(packed) == len(arrays)
+    assert packed.sizes().tolist() == [len(a) for a in arrays]
+    for i, a in enumerate(arrays):
+        assert np.array_equal(packed[i], a)
+
+
+def test_one_vs_many_sorted(arrays):
+    expected = brute_force(arrays)
+    packed = PackedSubtrees(arrays)
+    for i, query in enumerate(arrays):
+        assert np.array_equal(intersection_sizes(query, packed), expected[i])
+
+
+def test_many_vs_many_sorted(arrays):
+    assert np.array_equal(intersection_matrix(PackedSubtrees(arrays)),
+                          brute_force(arrays))
+
+
+def test_one_vs_many_bitsets(arrays):
+    expected = brute_force(arrays)
+    dictionary = SubtreeDictionary(arrays)
+    bitsets = dictionary.bitsets(arrays)
+    for i, query in enumerate(arrays):
+        got = bitset_intersections(dictionary.bitset(query), bitsets)
+        assert np.array_equal(got, expected[i])
+
+
+@pytest.mark.parametrize("max_bytes", [1, 64 * 2 ** 20])
+def test_many_vs_many_bitsets(arrays, max_bytes):
+    bitsets = SubtreeDictionary(arrays).bitsets(arrays)
+    assert np.array_equal(bitset_intersection_matrix(bitsets, max_bytes),
+                          brute_force(arrays))
+
+
+def test_dictionary_encode_drops_unknown(arrays):
+    dictionary = SubtreeDictionary(arrays[:2])
+    ids = dictionary.encode(np.array([10 ** 6], dtype=np.int64))
+    assert len(ids) == 0
+    assert np.array_equal(dictionary.keys[dictionary.encode(arrays[0])],
+                          arrays[0])
+
+
+def test_empty_corpus():
+    packed = PackedSubtrees([])
+    assert intersection_matrix(packed).shape == (0, 0)
+    assert len(SubtreeDictionary([])) == 0